@@ -0,0 +1,169 @@
+#
+# Copyright 2009-2012 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+#
+# Description:    Constants definitions for vdsm and utilities.
+
+import os
+
+# VDSM management networks
+LEGACY_MANAGEMENT_NETWORKS = ('ovirtmgmt', 'rhevm')
+
+# SMBIOS manufacturer
+SMBIOS_MANUFACTURER = 'x'
+SMBIOS_OSNAME = 'x'
+
+#
+# file ownership definitions
+#
+VDSM_USER = 'x'
+VDSM_GROUP = 'x'
+DISKIMAGE_USER = 'x'
+DISKIMAGE_GROUP = 'x'
+METADATA_USER = 'x'
+METADATA_GROUP = 'x'
+QEMU_PROCESS_USER = 'x'
+QEMU_PROCESS_GROUP = 'x'
+
+# Sanlock definitions
+SANLOCK_ENABLED = 'x' == 'yes'
+SANLOCK_USER = 'x'
+
+# Libvirt selinux
+LIBVIRT_SELINUX = 'x' == 'yes'
+
+
+#
+# The username of SASL authenticating for libvirt connection
+#
+SASL_USERNAME = "vdsm@ovirt"
+
+# This is the domain version translation list
+# DO NOT CHANGE OLD VALUES ONLY APPEND
+DOMAIN_VERSIONS = (0, 2, 3)
+SUPPORTED_BLOCKSIZE = (512,)
+
+# This contains the domains versions that this VDSM
+# accepts currently its all of the version but in the
+# future we might slice it (eg. tuple(DOMAIN_VERSION[1:]))
+SUPPORTED_DOMAIN_VERSIONS = DOMAIN_VERSIONS
+
+UUID_GLOB_PATTERN = '*-*-*-*-*'
+
+MEGAB = 2 ** 20  # = 1024 ** 2 = 1 MiB
+
+#
+# Path definitions
+#
+P_LIBVIRT_VMCHANNELS = '/var/lib/libvirt/qemu/channels/'
+P_VDSM = 'x/'
+P_VDSM_RPC = 'x/rpc/'
+P_VDSM_HOOKS = 'x/'
+P_VDSM_LIB = 'x/'
+P_VDSM_RUN = 'x/'
+P_VDSM_STORAGE = P_VDSM_RUN + 'storage/'
+P_VDSM_CONF = 'x/'
+P_VDSM_KEYS = '/etc/pki/vdsm/keys/'
+P_VDSM_LIBVIRT_PASSWD = P_VDSM_KEYS + 'libvirt_password'
+P_VDSM_CERT = '/etc/pki/vdsm/certs/vdsmcert.pem'
+
+P_VDSM_CLIENT_LOG = 'x/client.log'
+P_VDSM_LOG = 'x'
+P_VDSM_NODE_ID = '/etc/vdsm/vdsm.id'
+
+P_VDSM_EXEC = 'x'
+
+#
+# Configuration file definitions
+#
+SYSCONF_PATH = '@sysconfdir@'
+
+#
+# External programs (sorted, please keep in order).
+#
+EXT_BLKID = 'x'
+EXT_BRCTL = 'x'
+
+EXT_CAT = 'x'
+EXT_CHOWN = 'x'
+EXT_CP = 'x'
+
+EXT_DD = 'x'
+EXT_DMIDECODE = 'x'
+EXT_DMSETUP = 'x'
+
+EXT_FENCE_PREFIX = os.path.dirname('x') + '/fence_'
+EXT_FSCK = 'x'
+EXT_FUSER = 'x'
+
+EXT_GREP = 'x'
+
+EXT_IFDOWN = 'x'
+EXT_IFUP = 'x'
+EXT_IONICE = 'x'
+EXT_ISCSIADM = 'x'
+EXT_TC = 'x'
+
+EXT_KILL = 'x'
+
+EXT_LSBLK = 'x'
+EXT_LVM = 'x'
+
+EXT_MKFS = 'x'
+EXT_MKFS_MSDOS = 'x'
+EXT_MKISOFS = 'x'
+EXT_MK_SYSPREP_FLOPPY = 'x/mk_sysprep_floppy'
+EXT_MOUNT = 'x'
+EXT_MULTIPATH = 'x'
+
+EXT_NICE = 'x'
+
+EXT_PERSIST = 'x'
+EXT_PGREP = 'x'
+EXT_PYTHON = 'x'
+
+EXT_QEMUIMG = 'x'
+
+EXT_RSYNC = 'x'
+
+EXT_SASLPASSWD2 = '@SASLPASSWD2_PATH@'
+
+EXT_SERVICE = 'x'
+EXT_SETSID = 'x'
+EXT_SH = '/bin/sh'  # The shell path is invariable
+EXT_SU = 'x'
+EXT_SUDO = 'x'
+
+EXT_TAR = 'x'
+EXT_TEE = 'x'
+EXT_TUNE2FS = '@TUNE2FS_PATH@'
+
+EXT_UDEVADM = 'x'
+
+EXT_UMOUNT = 'x'
+EXT_UNPERSIST = 'x'
+
+EXT_VDSM_RESTORE_NET_CONFIG = 'x/vdsm-restore-net-config'
+EXT_VDSM_STORE_NET_CONFIG = 'x/vdsm-store-net-config'
+
+EXT_WGET = 'x'
+
+EXT_VDSM_TOOL = os.path.join('x', 'vdsm-tool')
+
+EXT_CURL_IMG_WRAP = 'x/curl-img-wrap'
@@ -19,7 +19,7 @@
 
 from contextlib import contextmanager
 from ctypes import (CDLL, CFUNCTYPE, byref, c_char, c_char_p, c_int, c_void_p,
-                    c_size_t, get_errno, sizeof)
+                    c_size_t, c_uint64, get_errno, sizeof)
 from distutils.version import StrictVersion
 from functools import partial
 from Queue import Empty, Queue
@@ -32,6 +32,11 @@ _POOL_SIZE = 5
 CHARBUFFSIZE = 40  # Increased to fit IPv6 expanded representations
 HWADDRSIZE = 60    # InfiniBand HW address needs 59+1 bytes
 
+# rtnl_link_stat_id_t, the same in libnl-1 and libnl-3
+_LINK_STATS = (('rx_bytes', 2), ('tx_bytes', 3),
+               ('rx_errors', 4), ('tx_errors', 5),
+               ('rx_dropped', 6), ('tx_dropped', 7))
+
 
 def iter_links():
     """Generator that yields an information dictionary for each link of the
@@ -56,6 +61,19 @@ def iter_addrs():
                     addr = _nl_cache_get_next(addr)
 
 
+def iter_links_stats():
+    """Generator that yields a dictionary with the name, index, flags, master
+    index and the traffic counters of each link of the system. All the links
+    come from a single RTM_GETLINK dump, the counters from IFLA_STATS64 when
+    the kernel provides it."""
+    with _pool.socket() as sock:
+        with _nl_link_cache(sock) as cache:
+            link = _nl_cache_get_first(cache)
+            while link:
+                yield _link_stats(link)
+                link = _nl_cache_get_next(link)
+
+
 def get_link(name):
     """Returns the information dictionary of the name specified link."""
     with _pool.socket() as sock:
@@ -169,6 +187,17 @@ def _link_info(cache, link):
     return info
 
 
+def _link_stats(link):
+    """Returns a dictionary with the traffic counters of the link object."""
+    stats = {'name': _rtnl_link_get_name(link),
+             'index': _rtnl_link_get_ifindex(link),
+             'flags': _rtnl_link_get_flags(link),
+             'master': _rtnl_link_get_master(link)}
+    for name, stat_id in _LINK_STATS:
+        stats[name] = _rtnl_link_get_stat(link, stat_id)
+    return stats
+
+
 def _link_index_to_name(cache, link_index):
     """Returns the textual name of the link with index equal to link_index."""
     name = (c_char * CHARBUFFSIZE)()
@@ -311,6 +340,8 @@ _rtnl_link_get_mtu = _int_proto(('rtnl_link_get_mtu', LIBNL_ROUTE))
 _rtnl_link_get_name = _char_proto(('rtnl_link_get_name', LIBNL_ROUTE))
 _rtnl_link_get_operstate = _int_proto(('rtnl_link_get_operstate', LIBNL_ROUTE))
 _rtnl_link_get_qdisc = _char_proto(('rtnl_link_get_qdisc', LIBNL_ROUTE))
+_rtnl_link_get_stat = CFUNCTYPE(c_uint64, c_void_p, c_int)((
+    'rtnl_link_get_stat', LIBNL_ROUTE))
 
 _rtnl_addr_get_label = _char_proto(('rtnl_addr_get_label', LIBNL_ROUTE))
 _rtnl_addr_get_ifindex = _int_proto(('rtnl_addr_get_ifindex', LIBNL_ROUTE))
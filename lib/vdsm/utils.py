@@ -34,6 +34,7 @@ from Queue import Queue
 from StringIO import StringIO
 from weakref import proxy
 import SocketServer
+import ctypes
 import errno
 import fcntl
 import functools
@@ -99,6 +100,28 @@ class ActionStopped(GeneralException):
     message = "Action was stopped"
 
 
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_CLOCK_MONOTONIC = 1
+_librt = ctypes.CDLL("librt.so.1", use_errno=True)
+_clock_gettime = _librt.clock_gettime
+_clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+
+def monotonic_time():
+    """
+    Return the time in seconds of the monotonic clock, which is not affected
+    by changes of the system time. Only the difference between two calls is
+    meaningful.
+    """
+    ts = _Timespec()
+    if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
 def isBlockDevice(path):
     path = os.path.abspath(path)
     return stat.S_ISBLK(os.stat(path).st_mode)
@@ -284,6 +307,58 @@ class SimpleThreadedXMLRPCServer(SocketServer.ThreadingMixIn,
     pass
 
 
+class ProcFile(object):
+    """
+    A procfs or sysfs file kept open, and read again from its start.
+
+    Reading such a file from offset 0 returns its current content, so there
+    is no need to open and close it for every read. The content is read into
+    a buffer that is reused by the next reads, and grown when the content
+    does not fit.
+    """
+    def __init__(self, path, bufsize=4096):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._buf = bytearray(bufsize)
+
+    @property
+    def path(self):
+        return self._path
+
+    def read(self):
+        """
+        Return the current content of the file.
+        """
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = io.FileIO(self._path, 'r')
+                    closeOnExec(self._file.fileno())
+                self._file.seek(0)
+                size = 0
+                while True:
+                    n = self._file.readinto(memoryview(self._buf)[size:])
+                    if not n:
+                        break
+                    size += n
+                    if size == len(self._buf):
+                        self._buf.extend(bytearray(len(self._buf)))
+                return memoryview(self._buf)[:size].tobytes()
+            except (IOError, OSError):
+                self._close()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 def _parseMemInfo(lines):
     """
     Parse the content of ``/proc/meminfo`` as list of strings
@@ -296,6 +371,9 @@ def _parseMemInfo(lines):
     return meminfo
 
 
+_memInfoFile = ProcFile('/proc/meminfo')
+
+
 def readMemInfo():
     """
     Parse ``/proc/meminfo`` and return its content as a dictionary.
@@ -310,10 +388,10 @@ def readMemInfo():
     tries = 3
     while True:
         tries -= 1
+        lines = None
         try:
-            with open('/proc/meminfo') as f:
-                lines = f.readlines()
-                return _parseMemInfo(lines)
+            lines = _memInfoFile.read().splitlines()
+            return _parseMemInfo(lines)
         except:
             logging.warning(lines, exc_info=True)
             if tries <= 0:
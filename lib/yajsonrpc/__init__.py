@@ -19,6 +19,7 @@ from Queue import Queue
 from weakref import ref
 from threading import Lock, Event
 from vdsm.utils import traceback
+from executor import TooManyTasks
 
 __all__ = ["tcpReactor"]
 
@@ -70,6 +71,13 @@ class JsonRpcInternalError(JsonRpcError):
         JsonRpcError.__init__(self, -32603, msg)
 
 
+class JsonRpcServerBusyError(JsonRpcError):
+    def __init__(self, msg=None):
+        if not msg:
+            msg = "Server is too busy, try again later."
+        JsonRpcError.__init__(self, -32000, msg)
+
+
 class JsonRpcRequest(object):
     def __init__(self, method, params=(), reqId=None):
         self.method = method
@@ -448,10 +456,16 @@ class JsonRpcClient(object):
 class JsonRpcServer(object):
     log = logging.getLogger("jsonrpc.JsonRpcServer")
 
-    def __init__(self, bridge, threadFactory=None):
+    def __init__(self, bridge, executor=None, queueNameFunc=None):
+        """
+        Requests are served by executor (see yajsonrpc.executor), on the
+        queue named by queueNameFunc(method). Without an executor,
+        requests are served in the thread reading them.
+        """
         self._bridge = bridge
         self._workQueue = Queue()
-        self._threadFactory = threadFactory
+        self._executor = executor
+        self._queueNameFunc = queueNameFunc
 
     def queueRequest(self, req):
         self.log.debug("Queueing request")
@@ -548,10 +562,24 @@ class JsonRpcServer(object):
             self._runRequest(ctx, request)
 
     def _runRequest(self, ctx, request):
-        if self._threadFactory is None:
+        if self._executor is None:
             self._serveRequest(ctx, request)
-        else:
-            self._threadFactory(partial(self._serveRequest, ctx, request))
+            return
+
+        queueName = None
+        if self._queueNameFunc is not None:
+            queueName = self._queueNameFunc(request.method)
+
+        try:
+            self._executor.dispatch(partial(self._serveRequest, ctx, request),
+                                    queueName)
+        except TooManyTasks as e:
+            self.log.warning("Rejecting request %s: %s", request.method, e)
+            if request.isNotification():
+                return
+            ctx.requestDone(JsonRpcResponse(None,
+                                            JsonRpcServerBusyError(str(e)),
+                                            request.id))
 
     def stop(self):
         self.log.info("Stopping JsonRPC Server")
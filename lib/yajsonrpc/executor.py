@@ -0,0 +1,175 @@
+# Copyright (C) 2014 Red Hat Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+"""
+Bounded request executor
+
+Runs tasks on fixed pools of worker threads. Tasks are dispatched to named
+queues, each served by its own workers, so tasks of one kind (e.g. slow
+storage verbs) cannot starve tasks of another kind (e.g. status verbs).
+Each queue holds a bounded number of waiting tasks; dispatching to a full
+queue raises TooManyTasks instead of creating more threads.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from vdsm.utils import traceback
+
+
+class TooManyTasks(Exception):
+    pass
+
+
+class _TaskQueue(object):
+    """
+    A queue of tasks served by a fixed number of worker threads.
+    """
+    log = logging.getLogger("jsonrpc.Executor")
+
+    def __init__(self, name, workers, maxQueued):
+        self.name = name
+        self._workers = workers
+        self._maxQueued = maxQueued
+        self._tasks = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._running = False
+        self._threads = []
+        self._busy = 0
+        # Metrics
+        self._dispatched = 0
+        self._rejected = 0
+        self._maxDepth = 0
+        self._waitTotal = 0.0
+        self._waitMax = 0.0
+
+    def start(self):
+        with self._cond:
+            self._running = True
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run,
+                                 name="%s/%d" % (self.name, i))
+            t.setDaemon(True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._tasks.clear()
+            self._cond.notifyAll()
+        self._threads = []
+
+    def dispatch(self, func):
+        with self._cond:
+            if not self._running:
+                raise TooManyTasks("Queue %s is stopped" % self.name)
+            if len(self._tasks) >= self._maxQueued:
+                self._rejected += 1
+                raise TooManyTasks("Queue %s is full (%d tasks waiting)" %
+                                   (self.name, len(self._tasks)))
+            self._tasks.append((time.time(), func))
+            self._dispatched += 1
+            self._maxDepth = max(self._maxDepth, len(self._tasks))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            started = self._dispatched - len(self._tasks)
+            return {'workers': self._workers,
+                    'busy': self._busy,
+                    'queued': len(self._tasks),
+                    'maxQueued': self._maxQueued,
+                    'maxDepth': self._maxDepth,
+                    'dispatched': self._dispatched,
+                    'rejected': self._rejected,
+                    'waitAvg': self._waitTotal / started if started else 0.0,
+                    'waitMax': self._waitMax}
+
+    def _get(self):
+        with self._cond:
+            while self._running and not self._tasks:
+                self._cond.wait()
+            if not self._running:
+                return None
+            queued, func = self._tasks.popleft()
+            wait = time.time() - queued
+            self._waitTotal += wait
+            self._waitMax = max(self._waitMax, wait)
+            self._busy += 1
+            return func
+
+    def _done(self):
+        with self._cond:
+            self._busy -= 1
+
+    @traceback(on=log.name)
+    def _run(self):
+        while True:
+            func = self._get()
+            if func is None:
+                return
+            try:
+                func()
+            except Exception:
+                self.log.exception("Unhandled error in task on queue %s",
+                                   self.name)
+            finally:
+                self._done()
+
+
+class Executor(object):
+    """
+    Dispatches tasks to named queues.
+
+    queues maps each queue name to a (workers, maxQueued) tuple. Tasks
+    dispatched to a name that has no queue go to the default queue, which
+    must be present.
+    """
+
+    def __init__(self, name, queues, default="default"):
+        if default not in queues:
+            raise ValueError("No queue for default %r" % default)
+        self._default = default
+        self._queues = {}
+        for queueName, (workers, maxQueued) in queues.iteritems():
+            self._queues[queueName] = _TaskQueue(
+                "%s/%s" % (name, queueName), workers, maxQueued)
+
+    def start(self):
+        for queue in self._queues.itervalues():
+            queue.start()
+
+    def stop(self):
+        for queue in self._queues.itervalues():
+            queue.stop()
+
+    def dispatch(self, func, queueName=None):
+        """
+        Queue func to run on a worker of queueName. Raises TooManyTasks if
+        the queue is full.
+        """
+        queue = self._queues.get(queueName, self._queues[self._default])
+        queue.dispatch(func)
+
+    def stats(self):
+        """
+        Return the metrics of each queue: number of workers, busy workers,
+        current and maximal queue depth, tasks dispatched and rejected, and
+        average and maximal seconds tasks waited before running.
+        """
+        return dict((name, queue.stats())
+                    for name, queue in self._queues.iteritems())
@@ -15,7 +15,6 @@
 
 import logging
 import socket
-import cStringIO
 from threading import Timer, Event
 from uuid import uuid4
 from collections import deque
@@ -75,15 +74,18 @@ class Frame(object):
         if body is not None:
             self.headers["content-length"] = len(body)
 
-        data = self.command + '\n'
-        data += '\n'.join(["%s:%s" % (encodeValue(key), encodeValue(value))
-                          for key, value in self.headers.iteritems()])
-        data += '\n\n'
+        # Join all the parts at once; the body may be several megabytes and
+        # must be copied only once.
+        parts = [self.command, '\n']
+        parts.append('\n'.join(["%s:%s" % (encodeValue(key),
+                                           encodeValue(value))
+                                for key, value in self.headers.iteritems()]))
+        parts.append('\n\n')
         if body is not None:
-            data += body
+            parts.append(body)
 
-        data += "\0"
-        return data
+        parts.append("\0")
+        return ''.join(parts)
 
     def __repr__(self):
         return "<StompFrame command=%s>" % (repr(self.command))
@@ -120,6 +122,17 @@ def encodeValue(s):
 
 
 class Parser(object):
+    """
+    Incremental STOMP frame parser.
+
+    Incoming data is appended to a single bytearray and consumed from a read
+    offset, so parsing a frame is linear in its size however it was split
+    by the transport. Consumed data is discarded only when the buffer is
+    drained or the read offset passes half of the buffer, keeping the
+    copying amortized. Bodies with a content-length header are not scanned
+    at all; the parser waits until the whole body arrived and copies it
+    once.
+    """
     _STATE_CMD = "Parsing command"
     _STATE_HEADER = "Parsing headers"
     _STATE_BODY = "Receiving body"
@@ -132,20 +145,39 @@ class Parser(object):
         self._frames = deque()
         self._state = self._STATE_CMD
         self._contentLength = -1
-        self._flush()
+        self._buffer = bytearray()
+        # Offset of the first unconsumed byte
+        self._pos = 0
+        # Offset from which to continue searching for a terminator, so data
+        # that was already searched is not searched again
+        self._searchPos = 0
 
     def _flush(self):
-        self._buffer = cStringIO.StringIO()
+        pos = self._pos
+        if pos == len(self._buffer):
+            del self._buffer[:]
+        elif pos > len(self._buffer) // 2:
+            del self._buffer[:pos]
+        else:
+            return
+        self._searchPos -= pos
+        self._pos = 0
+
+    def _consume(self, size):
+        data = str(buffer(self._buffer, self._pos, size))
+        self._pos += size
+        self._searchPos = self._pos
+        return data
 
     def _handle_terminator(self, term):
-        if term not in self._buffer.getvalue():
+        index = self._buffer.find(term, max(self._pos, self._searchPos))
+        if index == -1:
+            self._searchPos = len(self._buffer)
             return None
 
-        data = self._buffer.getvalue()
-        res, rest = data.split(term, 1)
-        self._flush()
-        self._buffer.write(rest)
-
+        res = self._consume(index - self._pos)
+        self._pos += len(term)
+        self._searchPos = self._pos
         return res
 
     def _parse_command(self):
@@ -214,22 +246,15 @@ class Parser(object):
         return True
 
     def _parse_body_length(self):
-        buf = self._buffer
         cl = self._contentLength
-        ndata = buf.tell()
-        if ndata < cl:
+        # The body is followed by the null terminator
+        if len(self._buffer) - self._pos < cl + 1:
             return False
 
-        remainingBytes = 0
-        self._flush()
-        body = buf.getvalue()
-        self._buffer.write(body[cl + 1:])
-        body = body[:cl]
-
-        if remainingBytes == 0:
-            self._tmpFrame.body = body
-            self._pushFrame()
-
+        self._tmpFrame.body = self._consume(cl)
+        self._pos += 1
+        self._searchPos = self._pos
+        self._pushFrame()
         return True
 
     @property
@@ -238,9 +263,10 @@ class Parser(object):
 
     def parse(self, data):
         states = self._states
-        self._buffer.write(data)
+        self._buffer.extend(data)
         while states[self._state]():
             pass
+        self._flush()
 
     def popFrame(self):
         try:
@@ -366,12 +392,13 @@ class Client(object):
 class AsyncDispatcher(object):
     log = logging.getLogger("stomp.AsyncDispatcher")
 
-    def __init__(self, frameHandler, bufferSize=1024):
+    def __init__(self, frameHandler, bufferSize=65536):
         self._frameHandler = frameHandler
         self._bufferSize = bufferSize
         self._parser = Parser()
         self._outbox = deque()
         self._outbuf = None
+        self._outbufOffset = 0
 
     def _queueFrame(self, frame):
         self._outbox.append(frame)
@@ -379,7 +406,7 @@ class AsyncDispatcher(object):
     @property
     def outgoing(self):
         n = len(self._outbox)
-        if self._outbuf != "":
+        if self._outbuf is not None:
             n += 1
 
         return n
@@ -423,13 +450,19 @@ class AsyncDispatcher(object):
                 return
 
             self._outbuf = frame.encode()
+            self._outbufOffset = 0
 
+        # Send from the current offset without slicing the (possibly huge)
+        # encoded frame after each partial write.
         data = self._outbuf
-        numSent = dispatcher.send(data)
-        if numSent == len(data):
+        offset = self._outbufOffset
+        numSent = dispatcher.send(buffer(data, offset, self._bufferSize))
+        offset += numSent
+        if offset == len(data):
             self._outbuf = None
+            self._outbufOffset = 0
         else:
-            self._outbuf = data[numSent:]
+            self._outbufOffset = offset
 
     def send_raw(self, frame):
         self._queueFrame(frame)
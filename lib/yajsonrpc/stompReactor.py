@@ -14,7 +14,9 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
 import asyncore
+import errno
 import os
+import select
 import threading
 import logging
 
@@ -34,9 +36,12 @@ _DEFAULT_REQUEST_DESTINATION = "/queue/_local/vdsm/requests"
 class StompAdapterImpl(object):
     log = logging.getLogger("Broker.StompAdapter")
 
-    def __init__(self, reactor, messageHandler):
+    def __init__(self, reactor, messageHandler, subscribeHandler=None,
+                 unsubscribeHandler=None):
         self._reactor = reactor
         self._messageHandler = messageHandler
+        self._subscribeHandler = subscribeHandler
+        self._unsubscribeHandler = unsubscribeHandler
         self._commands = {
             stomp.Command.CONNECT: self._cmd_connect,
             stomp.Command.SEND: self._cmd_send,
@@ -57,10 +62,22 @@ class StompAdapterImpl(object):
         self._reactor.wakeup()
 
     def _cmd_subscribe(self, dispatcher, frame):
-        self.log.debug("Subscribe command ignored")
+        destination = frame.headers.get("destination")
+        subid = frame.headers.get("id")
+        if (self._subscribeHandler is None or destination is None or
+                subid is None):
+            self.log.debug("Subscribe command ignored")
+            return
+
+        self._subscribeHandler(subid, destination)
 
     def _cmd_unsubscribe(self, dispatcher, frame):
-        self.log.debug("Unsubscribe command ignored")
+        subid = frame.headers.get("id")
+        if self._unsubscribeHandler is None or subid is None:
+            self.log.debug("Unsubscribe command ignored")
+            return
+
+        self._unsubscribeHandler(subid)
 
     def _cmd_send(self, dispatcher, frame):
         self.log.debug("Passing incoming message")
@@ -86,7 +103,7 @@ class _StompConnection(object):
 
     def send_raw(self, msg):
         self._adisp.send_raw(msg)
-        self._reactor.wakeup()
+        self._reactor.requestWrite(self._dispatcher)
 
     def setTimeout(self, timeout):
         self._dispatcher.socket.settimeout(timeout)
@@ -104,9 +121,12 @@ class StompServer(object):
     def __init__(self, sock, reactor):
         self._reactor = reactor
         self._messageHandler = None
+        self._subscriptionHandler = None
         self._socket = sock
 
-        adapter = StompAdapterImpl(reactor, self._handleMessage)
+        adapter = StompAdapterImpl(reactor, self._handleMessage,
+                                   self._handleSubscribe,
+                                   self._handleUnsubscribe)
         self._stompConn = _StompConnection(
             adapter,
             sock,
@@ -128,6 +148,28 @@ class StompServer(object):
         self._messageHandler = msgHandler
         self.check_read()
 
+    def setSubscriptionHandler(self, handler):
+        """
+        handler.subscribe(server, subid, destination) is called when the
+        client subscribes to a destination, and returns True if it handles
+        the destination. handler.unsubscribe(server, subid) is called when
+        the client unsubscribes.
+        """
+        self._subscriptionHandler = handler
+
+    def _handleSubscribe(self, subid, destination):
+        handler = self._subscriptionHandler
+        if handler is None or not handler.subscribe(self, subid, destination):
+            self.log.debug("Subscription to %s ignored", destination)
+
+    def _handleUnsubscribe(self, subid):
+        if self._subscriptionHandler is not None:
+            self._subscriptionHandler.unsubscribe(self, subid)
+
+    @property
+    def connected(self):
+        return self._stompConn._dispatcher.connected
+
     def check_read(self):
         if isinstance(self._socket, SSLSocket) and self._socket.pending() > 0:
             self._stompConn._dispatcher.handle_read()
@@ -140,6 +182,17 @@ class StompServer(object):
                           message)
         self._stompConn.send_raw(res)
 
+    def publish(self, subid, destination, message):
+        """
+        Send message to the client subscription subid.
+        """
+        res = stomp.Frame(stomp.Command.MESSAGE,
+                          {"destination": destination,
+                           "subscription": subid,
+                           "content-type": "application/json"},
+                          message)
+        self._stompConn.send_raw(res)
+
     def close(self):
         self._stompConn.close()
 
@@ -257,10 +310,86 @@ class _AsyncoreEvent(asyncore.file_dispatcher):
         asyncore.file_dispatcher.close(self)
 
 
+class _EpollMap(dict):
+    """
+    Asyncore socket map registering its dispatchers with an epoll object.
+
+    Dispatchers add and remove themselves from the map (see
+    asyncore.dispatcher.add_channel and del_channel), so keeping the
+    registrations in the map keeps epoll in sync with the dispatchers
+    without scanning the map.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.epoll = select.epoll()
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def __setitem__(self, fd, obj):
+        with self._lock:
+            events = _interest(obj)
+            if fd in self._events:
+                self.epoll.modify(fd, events)
+            else:
+                self.epoll.register(fd, events)
+            self._events[fd] = events
+            dict.__setitem__(self, fd, obj)
+
+    def __delitem__(self, fd):
+        with self._lock:
+            dict.__delitem__(self, fd)
+            del self._events[fd]
+            try:
+                self.epoll.unregister(fd)
+            except (IOError, OSError):
+                # Already closed
+                pass
+
+    def refresh(self, fd, obj):
+        """
+        Update the events epoll reports for obj to match its readable()
+        and writable() predicates.
+        """
+        with self._lock:
+            if self.get(fd) is not obj:
+                # Closed while handling its events
+                return
+            events = _interest(obj)
+            if events != self._events[fd]:
+                self.epoll.modify(fd, events)
+                self._events[fd] = events
+
+    def close(self):
+        self.epoll.close()
+
+
+def _interest(obj):
+    # Same as asyncore.poll2(); errors and hangups are always reported.
+    events = 0
+    if obj.readable():
+        events |= select.EPOLLIN | select.EPOLLPRI
+    # accepting sockets should not be writable
+    if obj.writable() and not obj.accepting:
+        events |= select.EPOLLOUT
+    return events
+
+
 class StompReactor(object):
+    """
+    Runs the STOMP connections on a level-triggered epoll loop.
+
+    Only the sockets that are ready are visited on each iteration. Sockets
+    are polled for writing only while their connection has queued output;
+    threads queueing output call requestWrite(), so the reactor does not
+    need to evaluate the writable() predicate of every connection.
+    """
+
     def __init__(self):
-        self._map = {}
+        self._map = _EpollMap()
         self._isRunning = False
+        self._pendingWrites = set()
+        self._pendingLock = threading.Lock()
         self._wakeupEvent = _AsyncoreEvent(self._map)
 
     def createListener(self, connected_socket, address, acceptHandler):
@@ -274,11 +403,43 @@ class StompReactor(object):
     def process_requests(self):
         self._isRunning = True
         while self._isRunning:
-            asyncore.loop(use_poll=True, map=self._map, count=1)
+            self._poll()
 
         for key, dispatcher in self._map.items():
             del self._map[key]
             dispatcher.close()
+        self._map.close()
+
+    def _poll(self, timeout=30.0):
+        try:
+            events = self._map.epoll.poll(timeout)
+        except IOError as e:
+            if e.errno != errno.EINTR:
+                raise
+            events = ()
+
+        for fd, flags in events:
+            obj = self._map.get(fd)
+            if obj is None:
+                continue
+            asyncore.readwrite(obj, flags)
+            self._map.refresh(fd, obj)
+
+        with self._pendingLock:
+            pending = self._pendingWrites
+            self._pendingWrites = set()
+
+        for obj in pending:
+            self._map.refresh(obj._fileno, obj)
+
+    def requestWrite(self, dispatcher):
+        """
+        Called after queueing output on dispatcher, possibly from another
+        thread, so the reactor starts polling it for writing.
+        """
+        with self._pendingLock:
+            self._pendingWrites.add(dispatcher)
+        self.wakeup()
 
     def wakeup(self):
         self._wakeupEvent.set()
@@ -20,8 +20,16 @@
 #
 
 import collections
+import os
+import tempfile
+
 from storage import blockSD
+from storage import blockVolume
+from storage import lvm
+from storage import misc
+from storage import storage_exception as se
 from vdsm import constants
+from monkeypatch import MonkeyPatchScope
 from testrunner import VdsmTestCase as TestCaseBase
 
 # Make it easy to test the values we care about
@@ -48,3 +56,84 @@ class BlockSDTests(TestCaseBase):
     def test_metadataValidity_threshold_bad(self):
         vg = VG(self.MIN_MD_SIZE, self.MIN_MD_FREE)
         self.assertEquals(False, blockSD.metadataValidity(vg)['mdathreshold'])
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class MetadataCacheTests(TestCaseBase):
+
+    SLOT = blockVolume.VOLUME_METASIZE
+
+    def setUp(self):
+        # tmpfs does not support O_DIRECT
+        fd, self.path = tempfile.mkstemp(dir="/var/tmp")
+        os.write(fd, "a" * self.SLOT + "b" * self.SLOT)
+        os.close(fd)
+        self.clock = FakeClock()
+        self.cache = blockVolume.MetadataCache(ttl=2, clock=self.clock)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def overwrite(self, data):
+        with open(self.path, "w") as f:
+            f.write(data)
+
+    def testRead(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.assertEquals(self.cache.read("vg", 1), "b" * self.SLOT)
+            self.assertEquals(self.cache.read("vg", 0), "a" * self.SLOT)
+
+    def testReadCached(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.cache.read("vg", 0)
+            self.overwrite("c" * self.SLOT * 2)
+            self.assertEquals(self.cache.read("vg", 1), "b" * self.SLOT)
+
+    def testExpired(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.cache.read("vg", 0)
+            self.overwrite("c" * self.SLOT * 2)
+            self.clock.now = 2
+            self.assertEquals(self.cache.read("vg", 1), "c" * self.SLOT)
+
+    def testInvalidate(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.cache.read("vg", 0)
+            self.overwrite("c" * self.SLOT * 2)
+            self.cache.invalidate("vg")
+            self.assertEquals(self.cache.read("vg", 1), "c" * self.SLOT)
+
+    def testWriteThrough(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.cache.read("vg", 0)
+            self.cache.write("vg", 1, "x" * self.SLOT)
+            self.assertEquals(self.cache.read("vg", 1), "x" * self.SLOT)
+
+    def testVolumeClassInvalidate(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path),
+                               (blockVolume, '_metadataCache', self.cache)]):
+            self.cache.read("vg", 0)
+            self.overwrite("c" * self.SLOT * 2)
+            blockVolume.BlockVolume.invalidateMetadataCache("vg")
+            self.assertEquals(self.cache.read("vg", 1), "c" * self.SLOT)
+
+    def testReadPastEnd(self):
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path)]):
+            self.assertRaises(se.MiscBlockReadIncomplete,
+                              self.cache.read, "vg", 2)
+
+    def testReadStuck(self):
+        def ddRead(path, offset, size):
+            return "d" * size
+
+        with MonkeyPatchScope([(lvm, 'lvPath', lambda vg, lv: self.path),
+                               (misc, '_isStuck', lambda path: True),
+                               (misc, '_ddRead', ddRead)]):
+            self.assertEquals(self.cache.read("vg", 1), "d" * self.SLOT)
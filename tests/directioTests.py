@@ -0,0 +1,133 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import os
+import tempfile
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+import storage.directio as directio
+
+BLOCK = directio.BLOCK_SIZE
+
+
+class DirectFileTests(TestCaseBase):
+
+    def setUp(self):
+        # tmpfs does not support O_DIRECT
+        fd, self.path = tempfile.mkstemp(dir="/var/tmp")
+        os.write(fd, "a" * BLOCK + "b" * BLOCK + "c" * BLOCK)
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def testRead(self):
+        with directio.DirectFile(self.path) as f:
+            self.assertEquals(f.read(BLOCK, BLOCK), "b" * BLOCK)
+            self.assertEquals(f.read(0, 2 * BLOCK),
+                              "a" * BLOCK + "b" * BLOCK)
+
+    def testReadPastEnd(self):
+        with directio.DirectFile(self.path) as f:
+            self.assertEquals(f.read(2 * BLOCK, 2 * BLOCK), "c" * BLOCK)
+
+    def testWrite(self):
+        with directio.DirectFile(self.path, "r+") as f:
+            f.write(BLOCK, "x" * BLOCK)
+            self.assertEquals(f.read(0, 3 * BLOCK),
+                              "a" * BLOCK + "x" * BLOCK + "c" * BLOCK)
+        with open(self.path) as f:
+            self.assertEquals(f.read(),
+                              "a" * BLOCK + "x" * BLOCK + "c" * BLOCK)
+
+    def testWriteReadOnly(self):
+        with directio.DirectFile(self.path) as f:
+            self.assertRaises(IOError, f.write, 0, "x" * BLOCK)
+
+    def testUnaligned(self):
+        with directio.DirectFile(self.path, "r+") as f:
+            self.assertRaises(ValueError, f.read, 1, BLOCK)
+            self.assertRaises(ValueError, f.read, 0, 100)
+            self.assertRaises(ValueError, f.write, 0, "x" * 100)
+
+    def testReopenAfterFailure(self):
+        f = directio.DirectFile(self.path + ".missing")
+        self.assertRaises(OSError, f.read, 0, BLOCK)
+        os.rename(self.path, self.path + ".missing")
+        try:
+            self.assertEquals(f.read(0, BLOCK), "a" * BLOCK)
+        finally:
+            os.rename(self.path + ".missing", self.path)
+            f.close()
+
+    def testInvalidMode(self):
+        self.assertRaises(ValueError, directio.DirectFile, self.path, "w")
+
+
+class ReadTests(TestCaseBase):
+
+    def setUp(self):
+        # tmpfs does not support O_DIRECT
+        fd, self.path = tempfile.mkstemp(dir="/var/tmp")
+        os.write(fd, "a" * BLOCK + "b" * BLOCK)
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def testRead(self):
+        self.assertEquals(directio.read(self.path, BLOCK, BLOCK), "b" * BLOCK)
+
+    def testReadPastEnd(self):
+        self.assertEquals(directio.read(self.path, BLOCK, 2 * BLOCK),
+                          "b" * BLOCK)
+
+    def testUnaligned(self):
+        self.assertRaises(ValueError, directio.read, self.path, 1, BLOCK)
+        self.assertRaises(ValueError, directio.read, self.path, 0, 100)
+
+
+class BufferPoolTests(TestCaseBase):
+
+    def testReuse(self):
+        pool = directio.BufferPool()
+        with pool.buffer(BLOCK) as buf:
+            pass
+        with pool.buffer(BLOCK) as other:
+            self.assertTrue(other is buf)
+
+    def testSizes(self):
+        pool = directio.BufferPool()
+        with pool.buffer(BLOCK) as buf:
+            pass
+        with pool.buffer(2 * BLOCK) as other:
+            self.assertFalse(other is buf)
+            self.assertEquals(len(other), 2 * BLOCK)
+
+    def testMaxFree(self):
+        pool = directio.BufferPool(maxFree=1)
+        with pool.buffer(BLOCK) as first:
+            with pool.buffer(BLOCK) as second:
+                pass
+        with pool.buffer(BLOCK) as buf:
+            self.assertTrue(buf is second)
+        # Buffers beyond maxFree are closed
+        self.assertRaises(ValueError, first.read, 1)
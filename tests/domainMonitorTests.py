@@ -0,0 +1,135 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import threading
+import time
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+from storage import domainMonitor
+
+
+class LatencyHistogramTests(TestCaseBase):
+
+    def testEmpty(self):
+        info = domainMonitor.LatencyHistogram().info()
+        self.assertEquals(info['count'], 0)
+        self.assertEquals(info['avg'], 0.0)
+        self.assertEquals(sum(info['buckets']), 0)
+
+    def testBuckets(self):
+        hist = domainMonitor.LatencyHistogram()
+        hist.add(0.005)
+        hist.add(0.01)
+        hist.add(0.2)
+        hist.add(100)
+        info = hist.info()
+        self.assertEquals(info['buckets'], [2, 0, 1, 0, 0, 0, 0, 1])
+        self.assertEquals(info['count'], 4)
+        self.assertEquals(info['max'], 100)
+        self.assertEquals(info['last'], 100)
+        self.assertEquals(len(info['buckets']), len(info['bounds']) + 1)
+
+
+class FakeMonitor(object):
+
+    def __init__(self, interval, block=None):
+        self.interval = interval
+        self.stopped = False
+        self.runStart = None
+        self.runs = 0
+        self.missed = 0
+        self.hung = 0
+        self.ran = threading.Event()
+        self._block = block
+
+    def run(self):
+        self.runs += 1
+        self.ran.set()
+        if self._block is not None:
+            self._block.wait()
+
+    def missedDeadline(self, now):
+        self.missed += 1
+
+    def checkHung(self, now):
+        self.hung += 1
+
+
+class MonitorSchedulerTests(TestCaseBase):
+
+    def setUp(self):
+        self.scheduler = domainMonitor.MonitorScheduler(
+            workers=1, maxWorkers=2, hungTimeout=0.5)
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def testRunImmediately(self):
+        monitor = FakeMonitor(60)
+        self.scheduler.add(monitor)
+        self.assertTrue(monitor.ran.wait(2))
+
+    def testStopped(self):
+        monitor = FakeMonitor(60)
+        monitor.stopped = True
+        self.scheduler.add(monitor)
+        time.sleep(0.2)
+        self.assertEquals(monitor.runs, 0)
+
+    def testHung(self):
+        block = threading.Event()
+        hung = FakeMonitor(0.1, block=block)
+        try:
+            self.scheduler.add(hung)
+            self.assertTrue(hung.ran.wait(2))
+            # Another domain is checked by a new worker
+            other = FakeMonitor(60)
+            time.sleep(0.6)
+            self.scheduler.add(other)
+            self.assertTrue(other.ran.wait(3))
+            self.assertTrue(hung.hung > 0)
+            self.assertTrue(hung.missed > 0)
+            self.assertEquals(hung.runs, 1)
+        finally:
+            block.set()
+
+    def testQueuedNotHung(self):
+        scheduler = domainMonitor.MonitorScheduler(
+            workers=1, maxWorkers=1, hungTimeout=0.5)
+        scheduler.start()
+        block = threading.Event()
+        try:
+            blocked = FakeMonitor(60, block=block)
+            scheduler.add(blocked)
+            self.assertTrue(blocked.ran.wait(2))
+            # Waits for the only worker, but is not checked yet
+            queued = FakeMonitor(60)
+            scheduler.add(queued)
+            time.sleep(1.2)
+            self.assertTrue(blocked.hung > 0)
+            self.assertEquals(queued.runs, 0)
+            self.assertEquals(queued.hung, 0)
+            block.set()
+            self.assertTrue(queued.ran.wait(2))
+        finally:
+            block.set()
+            scheduler.stop()
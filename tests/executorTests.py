@@ -0,0 +1,140 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import threading
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+from yajsonrpc import JsonRpcRequest, JsonRpcServer
+from yajsonrpc.executor import Executor, TooManyTasks
+
+TIMEOUT = 5
+
+
+class ExecutorTests(TestCaseBase):
+
+    def setUp(self):
+        self.executor = Executor('test', {'default': (2, 4),
+                                          'slow': (1, 2)})
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def testDispatch(self):
+        done = threading.Event()
+        self.executor.dispatch(done.set)
+        self.assertTrue(done.wait(TIMEOUT))
+
+    def testUnknownQueueUsesDefault(self):
+        done = threading.Event()
+        self.executor.dispatch(done.set, 'no-such-queue')
+        self.assertTrue(done.wait(TIMEOUT))
+        self.assertEquals(self.executor.stats()['default']['dispatched'], 1)
+
+    def testFullQueue(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(TIMEOUT)
+
+        try:
+            self.executor.dispatch(block, 'slow')
+            self.assertTrue(started.wait(TIMEOUT))
+            self.executor.dispatch(block, 'slow')
+            self.executor.dispatch(block, 'slow')
+            self.assertRaises(TooManyTasks, self.executor.dispatch, block,
+                              'slow')
+        finally:
+            release.set()
+
+        stats = self.executor.stats()['slow']
+        self.assertEquals(stats['rejected'], 1)
+        self.assertEquals(stats['maxDepth'], 2)
+
+    def testSlowQueueDoesNotStarveOthers(self):
+        release = threading.Event()
+        try:
+            self.executor.dispatch(lambda: release.wait(TIMEOUT), 'slow')
+            done = threading.Event()
+            self.executor.dispatch(done.set)
+            self.assertTrue(done.wait(TIMEOUT))
+        finally:
+            release.set()
+
+    def testTaskErrorKeepsWorker(self):
+        def fail():
+            raise RuntimeError("task failed")
+
+        self.executor.dispatch(fail, 'slow')
+        done = threading.Event()
+        self.executor.dispatch(done.set, 'slow')
+        self.assertTrue(done.wait(TIMEOUT))
+
+    def testWaitStats(self):
+        release = threading.Event()
+        done = threading.Event()
+        try:
+            self.executor.dispatch(lambda: release.wait(0.2), 'slow')
+            self.executor.dispatch(done.set, 'slow')
+        finally:
+            release.set()
+        self.assertTrue(done.wait(TIMEOUT))
+        stats = self.executor.stats()['slow']
+        self.assertEquals(stats['dispatched'], 2)
+        self.assertEquals(stats['queued'], 0)
+        self.assertTrue(stats['waitMax'] >= stats['waitAvg'] >= 0)
+
+    def testStopped(self):
+        self.executor.stop()
+        self.assertRaises(TooManyTasks, self.executor.dispatch, lambda: None)
+
+
+class _FakeContext(object):
+    def __init__(self):
+        self.responses = []
+
+    def requestDone(self, response):
+        self.responses.append(response)
+
+
+class _FullExecutor(object):
+    def dispatch(self, func, queueName=None):
+        raise TooManyTasks("Queue %s is full" % queueName)
+
+
+class JsonRpcServerOverloadTests(TestCaseBase):
+
+    def testBusyError(self):
+        server = JsonRpcServer(None, _FullExecutor(), lambda method: 'q')
+        ctx = _FakeContext()
+        server._runRequest(ctx, JsonRpcRequest('Host.ping', [], 'id'))
+        self.assertEquals(len(ctx.responses), 1)
+        response = ctx.responses[0]
+        self.assertEquals(response.id, 'id')
+        self.assertEquals(response.error.code, -32000)
+
+    def testBusyNotification(self):
+        server = JsonRpcServer(None, _FullExecutor())
+        ctx = _FakeContext()
+        server._runRequest(ctx, JsonRpcRequest('Host.ping', []))
+        self.assertEquals(ctx.responses, [])
@@ -21,8 +21,13 @@
 import os
 
 from testrunner import VdsmTestCase as TestCaseBase
+from testrunner import namedTemporaryDir
+from monkeypatch import MonkeyPatchScope
 from vdsm.config import config
 import storage.fileVolume as fileVolume
+import storage.fileUtils as fileUtils
+import storage.image as image
+import storage.storage_exception as se
 
 
 class GetDomUuidFromVolumePathTests(TestCaseBase):
@@ -31,3 +36,91 @@ class GetDomUuidFromVolumePathTests(TestCaseBase):
                                 "spUUID/sdUUID/images/imgUUID/volUUID")
         self.assertEqual(fileVolume.getDomUuidFromVolumePath(testPath),
                          "sdUUID")
+
+
+class InProcessOop(object):
+    """ Run multiCall calls in process, counting the round trips """
+
+    FUNCTIONS = {"os.path.isdir": os.path.isdir,
+                 "os.access": os.access,
+                 "fileUtils.pathExists": fileUtils.pathExists}
+
+    def __init__(self):
+        self.multiCalls = 0
+
+    def multiCall(self, calls):
+        self.multiCalls += 1
+        return [(self.FUNCTIONS[name](*args), None) for name, args in calls]
+
+
+class FakeDomain(object):
+    def isISO(self):
+        return False
+
+
+class FakeSdCache(object):
+    def produce(self, sdUUID):
+        return FakeDomain()
+
+
+class FakeFileVolume(fileVolume.FileVolume):
+    def __init__(self):
+        self.repoPath = "/repo"
+        self.sdUUID = "sdUUID"
+        self.imgUUID = "imgUUID"
+        self.volUUID = "volUUID"
+        self.imagePath = None
+        self.volumePath = None
+        self._oop = InProcessOop()
+
+    @property
+    def oop(self):
+        return self._oop
+
+
+class FileVolumeValidateTests(TestCaseBase):
+
+    def validate(self, create, method="validate"):
+        with namedTemporaryDir() as imageDir:
+            for name in create:
+                open(os.path.join(imageDir, name), "w").close()
+            vol = FakeFileVolume()
+            with MonkeyPatchScope([
+                (fileVolume, "sdCache", FakeSdCache()),
+                (image.Image, "getImageDir",
+                 lambda self, sdUUID, imgUUID: imageDir),
+            ]):
+                getattr(vol, method)()
+            return vol, imageDir
+
+    def testValidate(self):
+        vol, imageDir = self.validate(["volUUID", "volUUID.meta"])
+        self.assertEqual(vol.imagePath, imageDir)
+        self.assertEqual(vol.volumePath, os.path.join(imageDir, "volUUID"))
+        self.assertEqual(vol.oop.multiCalls, 1)
+
+    def testValidateVolumePath(self):
+        vol, imageDir = self.validate(["volUUID", "volUUID.meta"],
+                                      "validateVolumePath")
+        self.assertEqual(vol.volumePath, os.path.join(imageDir, "volUUID"))
+        self.assertEqual(vol.oop.multiCalls, 1)
+
+    def testMissingVolume(self):
+        for method in ("validate", "validateVolumePath"):
+            self.assertRaises(se.VolumeDoesNotExist, self.validate,
+                              ["volUUID.meta"], method)
+
+    def testMissingMetadata(self):
+        for method in ("validate", "validateVolumePath"):
+            self.assertRaises(se.VolumeDoesNotExist, self.validate,
+                              ["volUUID"], method)
+
+    def testMissingImage(self):
+        vol = FakeFileVolume()
+        with MonkeyPatchScope([
+            (fileVolume, "sdCache", FakeSdCache()),
+            (image.Image, "getImageDir",
+             lambda self, sdUUID, imgUUID: "/no/such/image"),
+        ]):
+            self.assertRaises(se.ImagePathError, vol.validateImagePath)
+            self.assertRaises(se.ImagePathError, vol.validate)
@@ -21,10 +21,17 @@
 
 
 import os
+import shutil
+import tempfile
+import time
 from testrunner import VdsmTestCase as TestCaseBase
+from monkeypatch import MonkeyPatchScope
 
 import storage.blockSD
 import storage.fileSD
+import storage.fileUtils
+import storage.remoteFileHandler
+import storage.storage_exception as se
 
 testDir = os.path.dirname(__file__)
 
@@ -69,7 +76,11 @@ class Moop(object):
             inp = open(os.path.join(sdHead, "glob_%s.out" % sdName),
                        "r").read()
             # Danger Will Robinson! Danger!
-            return eval(inp)
+            metaPaths = eval(inp)
+            if globExp == '/*':
+                # The image directories
+                return sorted(set(os.path.dirname(p) for p in metaPaths))
+            return metaPaths
 
     class FileUselessUtils(object):
         def pathExists(metafile):
@@ -79,6 +90,9 @@ class Moop(object):
     def glob(cls):
         return cls.Modulito()
 
+    def multiCall(self, calls):
+        return [(self.glob.glob(*args), None) for name, args in calls]
+
     @property
     def fileutils(cls):
         return cls.FileUselessUtils()
@@ -100,3 +114,191 @@ class TestFileGetAllVolumes(TestCaseBase):
         dom = self.MStorageDomain(sdName)
         allVols = dom.getAllVolumes()
         self.assertEqual(len(allVols), 11)
+
+    def test_getAllImages(self):
+        sdName = "1c60971a-8647-44ac-ae33-6520887f8843"
+        dom = self.MStorageDomain(sdName)
+        allVols = dom.getAllVolumes()
+        allImgs = set()
+        for imgs, parent in allVols.itervalues():
+            allImgs.update(imgs)
+        self.assertEqual(dom.getAllImages(), allImgs)
+
+
+class TestImageIndex(TestCaseBase):
+    IMAGES = "/rhev/data-center/mnt/server:_export/sdUUID/images"
+
+    def test_index(self):
+        entries = [os.path.join(self.IMAGES, name) for name in
+                   ("img1", "img2", "empty", "_remove_me_img3")]
+        metaPaths = [os.path.join(self.IMAGES, img, vol + ".meta")
+                     for img, vol in (("img1", "vol1"), ("img1", "vol2"),
+                                      ("img2", "vol3"))]
+        index = storage.fileSD.ImageIndex(entries, metaPaths)
+        self.assertEqual(index.volumes, {"img1": ["vol1", "vol2"],
+                                         "img2": ["vol3"]})
+        self.assertEqual(index.removed, ["_remove_me_img3"])
+        self.assertEqual(index.others, ["empty"])
+
+    def test_manyVolumes(self):
+        # About 20000 volumes: 100 templates, each used by 99 images with a
+        # snapshot. This takes hours with a quadratic algorithm.
+        metaPaths = []
+        for t in range(100):
+            template = "tmpl%d" % t
+            metaPaths.append(os.path.join(self.IMAGES, "timg%d" % t,
+                                          template + ".meta"))
+            for i in range(99):
+                img = "img%d-%d" % (t, i)
+                metaPaths.append(os.path.join(self.IMAGES, img,
+                                              template + ".meta"))
+                metaPaths.append(os.path.join(self.IMAGES, img,
+                                              "vol%d-%d.meta" % (t, i)))
+        entries = sorted(set(os.path.dirname(p) for p in metaPaths))
+        self.assertEqual(len(metaPaths), 19900)
+
+        class Oop(object):
+            def multiCall(self, calls):
+                return [(entries, None), (metaPaths, None)][:len(calls)]
+
+        class Domain(storage.fileSD.FileStorageDomain):
+            def __init__(self):
+                self.sdUUID = "sdUUID"
+                self.mountpoint = "/rhev/data-center/mnt/server:_export"
+                self.stat = None
+
+            @property
+            def oop(self):
+                return Oop()
+
+        allVols = Domain().getAllVolumes()
+        self.assertEqual(len(allVols), 100 + 100 * 99)
+        imgs, parent = allVols["tmpl0"]
+        self.assertEqual(imgs[0], "timg0")
+        self.assertEqual(len(imgs), 100)
+        self.assertEqual(parent, storage.fileSD.sd.BLANK_UUID)
+
+
+class StatWalkOop(object):
+    """ Run statWalk and os.stat calls in process, counting the walks """
+
+    def __init__(self):
+        self.walks = 0
+
+    def statWalk(self, top):
+        self.walks += 1
+        return storage.remoteFileHandler.statWalk(top)
+
+    def multiCall(self, calls):
+        results = []
+        for name, args in calls:
+            assert name == "os.stat"
+            try:
+                results.append((os.stat(*args), None))
+            except OSError as e:
+                results.append((None, e))
+        return results
+
+
+class TestFileGetFileList(TestCaseBase):
+    class MStorageDomain(storage.fileSD.FileStorageDomain):
+        def __init__(self, basedir):
+            self.basedir = basedir
+            self.stat = None
+            self._fileList = None
+            self._oop = StatWalkOop()
+
+        @property
+        def oop(self):
+            return self._oop
+
+        def getIsoDomainImagesDir(self):
+            return self.basedir
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.basedir, "sub"))
+        self.create("a.iso", 10)
+        self.create("B.ISO", 20)
+        self.create("sub/c.iso", 30)
+        self.create("d.vfd", 40)
+        # Older than the racy interval, so listings are cached
+        old = time.time() - 10
+        for d in (self.basedir, os.path.join(self.basedir, "sub")):
+            os.utime(d, (old, old))
+        self.dom = self.MStorageDomain(self.basedir)
+        # Readable by qemu only if "other" may read it
+        self.patch = MonkeyPatchScope([(storage.fileUtils, 'qemuGids',
+                                        lambda: ())])
+        self.patch.__enter__()
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        shutil.rmtree(self.basedir)
+
+    def create(self, name, size):
+        path = os.path.join(self.basedir, name)
+        with open(path, "w") as f:
+            f.write("x" * size)
+        os.chmod(path, 0o644)
+        return path
+
+    def test_getFileList(self):
+        files = self.dom.getFileList("*.iso", caseSensitive=False)
+        self.assertEqual(sorted(files), ["B.ISO", "a.iso", "sub/c.iso"])
+        self.assertEqual(files["sub/c.iso"]["size"], "30")
+        self.assertEqual(files["a.iso"]["status"], 0)
+
+    def test_caseSensitive(self):
+        files = self.dom.getFileList("*.iso", caseSensitive=True)
+        self.assertEqual(sorted(files), ["a.iso", "sub/c.iso"])
+
+    def test_allFiles(self):
+        files = self.dom.getFileList("*", caseSensitive=True)
+        self.assertEqual(len(files), 4)
+
+    def test_notReadable(self):
+        os.chmod(os.path.join(self.basedir, "a.iso"), 0o600)
+        files = self.dom.getFileList("*.iso", caseSensitive=True)
+        self.assertEqual(files["a.iso"]["status"],
+                         se.StorageServerAccessPermissionError.code)
+        self.assertEqual(files["sub/c.iso"]["status"], 0)
+
+    def test_cached(self):
+        self.dom.getFileList("*.iso", caseSensitive=False)
+        self.dom.getFileList("*.vfd", caseSensitive=False)
+        self.assertEqual(self.dom.oop.walks, 1)
+
+    def test_fileAdded(self):
+        self.dom.getFileList("*.iso", caseSensitive=False)
+        path = self.create("sub/e.iso", 50)
+        # Make sure the change is visible even with a coarse mtime
+        dirname = os.path.dirname(path)
+        mtime = os.stat(dirname).st_mtime
+        os.utime(dirname, (mtime + 1, mtime + 1))
+        files = self.dom.getFileList("*.iso", caseSensitive=False)
+        self.assertIn("sub/e.iso", files)
+        self.assertEqual(self.dom.oop.walks, 2)
+
+    def test_fileAddedSameSecond(self):
+        # A file system with one second mtime resolution
+        now = int(time.time())
+        sub = os.path.join(self.basedir, "sub")
+        os.utime(sub, (now, now))
+        self.dom.getFileList("*.iso", caseSensitive=False)
+        self.create("sub/e.iso", 50)
+        os.utime(sub, (now, now))
+        files = self.dom.getFileList("*.iso", caseSensitive=False)
+        self.assertIn("sub/e.iso", files)
+
+    def test_dirRemoved(self):
+        self.dom.getFileList("*.iso", caseSensitive=False)
+        shutil.rmtree(os.path.join(self.basedir, "sub"))
+        files = self.dom.getFileList("*.iso", caseSensitive=False)
+        self.assertEqual(sorted(files), ["B.ISO", "a.iso"])
+
+    def test_expired(self):
+        self.dom.getFileList("*.iso", caseSensitive=False)
+        with MonkeyPatchScope([(storage.fileSD, 'FILE_LIST_CACHE_TTL', 0)]):
+            self.dom.getFileList("*.iso", caseSensitive=False)
+        self.assertEqual(self.dom.oop.walks, 2)
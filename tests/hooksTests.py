@@ -24,6 +24,7 @@ import contextlib
 import tempfile
 import os
 import os.path
+import time
 from contextlib import contextmanager
 from testrunner import VdsmTestCase as TestCaseBase
 from testrunner import namedTemporaryDir
@@ -138,3 +139,105 @@ domXMLFile.write(customProperty)
                                         params={'customProperty': ' rocks!'},
                                         vmconf=vmconf)
             self.assertEqual(result, "oVirt rocks more!")
+
+    def test_scriptsPerDirNewScript(self):
+        with namedTemporaryDir() as dirName:
+            self.assertEqual([], hooks._scriptsPerDir(dirName))
+            sName, md5 = self.createScript(dirName)
+            self.assertEqual([sName], hooks._scriptsPerDir(dirName))
+
+    def test_scriptsPerDirCached(self):
+        with namedTemporaryDir() as dirName:
+            sName, md5 = self.createScript(dirName)
+            # Older than the racy interval, so the listing is cached
+            old = time.time() - 10
+            os.utime(dirName, (old, old))
+            self.assertEqual([sName], hooks._scriptsPerDir(dirName))
+            os.rename(sName, sName + '.new')
+            os.utime(dirName, (old, old))
+            self.assertEqual([], hooks._scriptsPerDir(dirName))
+
+    def test_scriptsPerDirNotExecutable(self):
+        with namedTemporaryDir() as dirName:
+            sName, md5 = self.createScript(dirName)
+            self.assertEqual([sName], hooks._scriptsPerDir(dirName))
+            os.chmod(sName, 0o664)
+            self.assertEqual([], hooks._scriptsPerDir(dirName))
+
+    @contextmanager
+    def _persistentHookDir(self):
+        with namedTemporaryDir() as dirName:
+            with tempfile.NamedTemporaryFile(dir=dirName, delete=False) as f:
+                code = """#!/usr/bin/python
+# vdsm: persistent-hook
+
+import os
+import hooking
+
+
+def main():
+    stats = hooking.read_json()
+    stats['pid'] = os.getpid()
+    stats['param'] = os.environ.get('param')
+    hooking.write_json(stats)
+    print 'not part of the protocol'
+
+hooking.run_persistent(main)
+"""
+                f.write(code)
+                os.chmod(f.name, 0o775)
+            try:
+                yield dirName
+            finally:
+                hooks._hookScripts.persistentHook(f.name).stop()
+
+    def test_persistentHook(self):
+        with self._persistentHookDir() as dirName:
+            first = hooks._runHooksDir({}, dirName, params={'param': 'a'},
+                                       hookType=hooks._JSON_HOOK)
+            second = hooks._runHooksDir({}, dirName,
+                                        hookType=hooks._JSON_HOOK)
+            self.assertEqual(first['param'], 'a')
+            self.assertEqual(second['param'], None)
+            self.assertEqual(first['pid'], second['pid'])
+            self.assertNotEqual(first['pid'], os.getpid())
+
+    def test_removedPersistentHookStoppedUnlocked(self):
+        stopped = []
+
+        class FakeHook(object):
+            def stop(self):
+                # Must not block the other directories
+                self.locked = hooks._hookScripts._lock.locked()
+                stopped.append(self)
+
+        with namedTemporaryDir() as dirName:
+            script = os.path.join(dirName, 'removed')
+            hook = FakeHook()
+            hooks._hookScripts._persistent[script] = hook
+            self.assertEqual([], hooks._scriptsPerDir(dirName))
+        self.assertEqual(stopped, [hook])
+        self.assertFalse(hook.locked)
+        self.assertEqual(hooks._hookScripts.persistentHook(script), None)
+
+    def test_persistentHookError(self):
+        with namedTemporaryDir() as dirName:
+            with tempfile.NamedTemporaryFile(dir=dirName, delete=False) as f:
+                code = """#!/usr/bin/python
+# vdsm: persistent-hook
+
+import hooking
+
+
+def main():
+    hooking.exit_hook('failed')
+
+hooking.run_persistent(main)
+"""
+                f.write(code)
+                os.chmod(f.name, 0o775)
+            try:
+                self.assertRaises(hooks.HookError, hooks._runHooksDir,
+                                  {}, dirName, hookType=hooks._JSON_HOOK)
+            finally:
+                hooks._hookScripts.persistentHook(f.name).stop()
@@ -19,9 +19,14 @@
 # Refer to the README and COPYING files for full details of the license
 #
 
+import os
+
 from testrunner import VdsmTestCase as TestCaseBase
+from testrunner import namedTemporaryDir
+from monkeypatch import MonkeyPatchScope
 
 import storage.lvm as lvm
+import storage.uevent as uevent
 
 
 class LvmTests(TestCaseBase):
@@ -37,3 +42,305 @@ class LvmTests(TestCaseBase):
                           "\\\\x22\\\\x28|\', \'r|.*|\' ]"
                           )
         self.assertEqual(expectedFilter, filter)
+
+
+class FakeLVMCache(lvm.LVMCache):
+    """
+    LVMCache answering lvs commands from a static table.
+    """
+
+    def __init__(self, lvs):
+        super(FakeLVMCache, self).__init__()
+        self._fakeLvs = lvs
+        self.cmds = []
+
+    def cmd(self, cmd, devices=tuple()):
+        self.cmds.append(cmd)
+        if cmd[0] == "vgs":
+            return self._vgsCmd(cmd)
+        vgNames = cmd[len(lvm.LVS_CMD):] or sorted(self._fakeLvs)
+        if any(vgName not in self._fakeLvs for vgName in vgNames):
+            return 5, [], ["Volume group not found"]
+        out = []
+        for vgName in vgNames:
+            for lvName in self._fakeLvs[vgName]:
+                out.append(lvm.SEPARATOR.join(
+                    ("uuid-" + lvName, lvName, vgName, "-wi-a----", "1024",
+                     "0", "/dev/mapper/pv(0)", "")))
+        return 0, out, []
+
+    def _vgsCmd(self, cmd):
+        vgNames = cmd[len(lvm.VGS_CMD):] or sorted(self._fakeLvs)
+        out = []
+        for vgName in vgNames:
+            if vgName in self._fakeLvs:
+                out.append(lvm.SEPARATOR.join(
+                    ("uuid-" + vgName, vgName, "wz--n-", "1024", "512",
+                     "128", "8", "4", "", "128", "64",
+                     str(len(self._fakeLvs[vgName])), "1",
+                     "/dev/mapper/pv")))
+        return 0, out, []
+
+
+class LvsBatchTests(TestCaseBase):
+    def testReloadSeveralVgs(self):
+        cache = FakeLVMCache({"vg1": ["lv1", "lv2"], "vg2": ["lv3"]})
+        lvs = cache._reloadlvsBatch(frozenset(["vg1", "vg2"]))
+        self.assertEquals(len(cache.cmds), 1)
+        self.assertEquals(sorted(lvs), [("vg1", "lv1"), ("vg1", "lv2"),
+                                        ("vg2", "lv3")])
+
+    def testFallbackOnMissingVg(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        lvs = cache._reloadlvsBatch(frozenset(["vg1", "vg2"]))
+        # One failed batch command, then one command per VG
+        self.assertEquals(len(cache.cmds), 3)
+        self.assertTrue(("vg1", "lv1") in lvs)
+
+    def testGetLvFiltersVg(self):
+        cache = FakeLVMCache({"vg1": ["lv1"], "vg2": ["lv2"]})
+        cache._reloadlvsBatch(frozenset(["vg1", "vg2"]))
+        self.assertEquals([lv.name for lv in cache.getLv("vg2")], ["lv2"])
+        self.assertEquals(cache.getLv("vg1", "lv1").vg_name, "vg1")
+
+
+LVS_JSON_REPORT = """\
+  {
+      "report": [
+          {
+              "lv": [
+                  {"lv_uuid":"uuid1", "lv_name":"lv1", "vg_name":"vg1",
+                   "lv_attr":"-wi-a-----", "lv_size":"1024"}
+              ]
+          }
+      ]
+      ,
+      "log": [
+          {"log_seq_num":"1", "log_type":"status", "log_context":"shell",
+           "log_object_type":"cmd", "log_message":"success",
+           "log_errno":"0", "log_ret_code":"%d"}
+      ]
+  }
+"""
+
+
+class LVMShellTests(TestCaseBase):
+    def testParseReport(self):
+        shell = lvm.LVMShell(timeout=1)
+        rc, out = shell._parseReport(LVS_JSON_REPORT % 1)
+        self.assertEquals(rc, 0)
+        self.assertEquals(out, ["uuid1|lv1|vg1|-wi-a-----|1024"])
+
+    def testParseReportFailure(self):
+        shell = lvm.LVMShell(timeout=1)
+        rc, out = shell._parseReport(LVS_JSON_REPORT % 5)
+        self.assertEquals(rc, 5)
+
+    def testParseInvalidReport(self):
+        shell = lvm.LVMShell(timeout=1)
+        self.assertRaises(lvm.LVMShellError, shell._parseReport,
+                          "No such command 'lvs'.  Try 'help'.")
+
+
+class FailingShell(object):
+    def __init__(self):
+        self.calls = 0
+        self.stopped = False
+
+    def run(self, cmd):
+        self.calls += 1
+        raise lvm.LVMShellError("Timeout waiting for lvm shell")
+
+    def stop(self):
+        self.stopped = True
+
+
+class LVMCacheShellTests(TestCaseBase):
+    def testCanUseShell(self):
+        cache = lvm.LVMCache()
+        cache._shell = FailingShell()
+        self.assertTrue(cache._canUseShell(["lvs", "-o", "name", "vg1"]))
+        self.assertFalse(cache._canUseShell(["lvchange", "-an", "vg1/lv1"]))
+        self.assertFalse(cache._canUseShell(["vgs", "vg 1"]))
+
+    def testDisableAfterFailures(self):
+        cache = lvm.LVMCache()
+        shell = cache._shell = FailingShell()
+        cache._getCachedExtraCfg = lambda: ""
+        for i in range(lvm.LVM_SHELL_MAX_FAILURES):
+            self.assertEquals(cache._shellCmd(["lvs"]), None)
+        self.assertEquals(shell.calls, lvm.LVM_SHELL_MAX_FAILURES)
+        self.assertTrue(shell.stopped)
+        self.assertEquals(cache._shell, None)
+
+
+class DmNameTests(TestCaseBase):
+    def testLvName(self):
+        self.assertEquals(lvm._dmNameToLv("vg-lv"), ("vg", "lv"))
+
+    def testEscapedHyphens(self):
+        self.assertEquals(lvm._dmNameToLv("vg--1-lv--a--b"),
+                          ("vg-1", "lv-a-b"))
+
+    def testLayerDevice(self):
+        self.assertEquals(lvm._dmNameToLv("vg-lv-real"), None)
+
+    def testMultipathName(self):
+        self.assertEquals(lvm._dmNameToLv("360014057b367e3a53b44ab392ae0f25f"),
+                          None)
+
+
+class UeventTests(TestCaseBase):
+    def _lvEvent(self, action, devName, dmName=None):
+        event = {uevent.ACTION: action, uevent.DEVNAME: devName}
+        if dmName is not None:
+            event[uevent.DM_NAME] = dmName
+            event[uevent.DM_UUID] = "LVM-vguuidlvuuid"
+        return event
+
+    def testInvalidateLv(self):
+        cache = FakeLVMCache({"vg-1": ["lv1", "lv2"]})
+        cache._reloadlvsNow("vg-1")
+        cache.handleUevent(self._lvEvent(uevent.CHANGE, "dm-3",
+                                         "vg--1-lv1"))
+        self.assertTrue(isinstance(cache._lvs["vg-1"].lvs["lv1"], lvm.Stub))
+        self.assertFalse(isinstance(cache._lvs["vg-1"].lvs["lv2"], lvm.Stub))
+
+    def testRemoveUsesKnownDevice(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadlvsNow("vg1")
+        cache.handleUevent(self._lvEvent(uevent.CHANGE, "dm-3", "vg1-lv1"))
+        cache._reloadlvsNow("vg1")
+        cache.handleUevent(self._lvEvent(uevent.REMOVE, "dm-3"))
+        self.assertTrue(isinstance(cache._lvs["vg1"].lvs["lv1"], lvm.Stub))
+
+    def testKernelEventReadsSysfs(self):
+        cache = FakeLVMCache({"vg1": ["lv1", "lv2"]})
+        cache._reloadlvsNow("vg1")
+        with namedTemporaryDir() as sysBlock:
+            dmDir = os.path.join(sysBlock, "dm-3", "dm")
+            os.makedirs(dmDir)
+            with open(os.path.join(dmDir, "uuid"), "w") as f:
+                f.write("LVM-vguuidlvuuid\n")
+            with open(os.path.join(dmDir, "name"), "w") as f:
+                f.write("vg1-lv1\n")
+            # As parsed from the kernel group, without udev DM_* keys
+            event = uevent.parse("add@/devices/virtual/block/dm-3\0"
+                                 "ACTION=add\0"
+                                 "DEVPATH=/devices/virtual/block/dm-3\0"
+                                 "SUBSYSTEM=block\0"
+                                 "DEVNAME=dm-3\0"
+                                 "DEVTYPE=disk\0"
+                                 "SEQNUM=2345\0")
+            with MonkeyPatchScope([(lvm, "SYS_BLOCK_DIR", sysBlock)]):
+                cache.handleUevent(event)
+        self.assertTrue(isinstance(cache._lvs["vg1"].lvs["lv1"], lvm.Stub))
+        self.assertFalse(isinstance(cache._lvs["vg1"].lvs["lv2"], lvm.Stub))
+
+        # The device is known now, its remove event invalidates it too
+        cache._reloadlvsNow("vg1")
+        cache.handleUevent({uevent.ACTION: uevent.REMOVE,
+                            uevent.DEVNAME: "dm-3"})
+        self.assertTrue(isinstance(cache._lvs["vg1"].lvs["lv1"], lvm.Stub))
+
+    def testLostEvents(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadlvsNow("vg1")
+        cache.handleUevent(None)
+        self.assertEquals(cache._lvs["vg1"].lvs, {})
+        self.assertTrue(cache._lvs["vg1"].stale)
+
+    def testKeepLvsOnInvalidateCache(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadlvsNow("vg1")
+        cache._monitoringUevents = True
+        cache.invalidateCache()
+        self.assertTrue("lv1" in cache._lvs["vg1"].lvs)
+
+
+class PartitionTests(TestCaseBase):
+    def testGetLvReloadsOnlyStaleVg(self):
+        cache = FakeLVMCache({"vg1": ["lv1"], "vg2": ["lv2"]})
+        cache._reloadlvsBatch(frozenset(["vg1", "vg2"]))
+        cache._invalidatelvs("vg1", "lv1")
+        del cache.cmds[:]
+        self.assertEquals([lv.name for lv in cache.getLv("vg2")], ["lv2"])
+        self.assertEquals(cache.cmds, [])
+
+    def testInvalidateDuringReload(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cmd = cache.cmd
+
+        def invalidatingCmd(*args, **kwargs):
+            # Simulate an invalidation racing with the reload
+            cache._invalidatelvs("vg1")
+            return cmd(*args, **kwargs)
+
+        cache.cmd = invalidatingCmd
+        lvs = cache._reloadlvsNow("vg1")
+        self.assertTrue(("vg1", "lv1") in lvs)
+        # The result may predate the invalidation, so it is not cached
+        self.assertTrue(cache._lvs["vg1"].stale)
+
+    def testInvalidateAllLvs(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadlvsNow("vg1")
+        cache._invalidateAllLvs()
+        self.assertEquals(cache._lvs["vg1"].lvs, {})
+        self.assertEquals([lv.name for lv in cache.getAllLvs()], ["lv1"])
+        self.assertFalse(cache._stalelv)
+
+    def testInvalidateAllLvsDuringReload(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadlvsNow("vg1")
+        cache._invalidatelvs("vg1")
+        cmd = cache.cmd
+
+        def flushingCmd(*args, **kwargs):
+            cache._invalidateAllLvs()
+            return cmd(*args, **kwargs)
+
+        cache.cmd = flushingCmd
+        cache._reloadlvsNow("vg1")
+        # The partition was kept, so the reload saw the invalidation
+        self.assertTrue(cache._lvs["vg1"].stale)
+        self.assertEquals(cache._lvs["vg1"].lvs, {})
+
+    def testReloadVgs(self):
+        cache = FakeLVMCache({"vg1": ["lv1"], "vg2": ["lv2"]})
+        vgs = cache._reloadvgsNow()
+        self.assertEquals(sorted(vgs), ["vg1", "vg2"])
+        self.assertEquals(sorted(cache._vgs), ["vg1", "vg2"])
+        self.assertFalse(cache._stalevg)
+
+    def testInvalidateAllVgsDuringReload(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cmd = cache.cmd
+
+        def flushingCmd(*args, **kwargs):
+            cache._invalidateAllVgs()
+            return cmd(*args, **kwargs)
+
+        cache.cmd = flushingCmd
+        vgs = cache._reloadvgsNow(["vg1"])
+        self.assertTrue("vg1" in vgs)
+        self.assertEquals(cache._vgs, {})
+
+    def testInvalidateVgDuringReload(self):
+        cache = FakeLVMCache({"vg1": ["lv1"], "vg2": ["lv2"]})
+        cmd = cache.cmd
+
+        def invalidatingCmd(*args, **kwargs):
+            cache._invalidatevgs("vg1")
+            return cmd(*args, **kwargs)
+
+        cache.cmd = invalidatingCmd
+        cache._reloadvgsNow(["vg1", "vg2"])
+        self.assertTrue(isinstance(cache._vgs["vg1"], lvm.Stub))
+        self.assertFalse(isinstance(cache._vgs["vg2"], lvm.Stub))
+
+    def testRemoveVg(self):
+        cache = FakeLVMCache({"vg1": ["lv1"]})
+        cache._reloadvgsNow(["vg1"])
+        cache._removevgs("vg1")
+        self.assertEquals(cache._vgs, {})
@@ -38,6 +38,7 @@ import storage.outOfProcess as oop
 import storage.misc as misc
 import storage.fileUtils as fileUtils
 from testValidation import checkSudo
+from monkeypatch import MonkeyPatchScope
 
 EXT_CHMOD = "/bin/chmod"
 EXT_CHOWN = "/bin/chown"
@@ -202,6 +203,57 @@ class ITMap(TestCaseBase):
         self.assertRaises(ValueError, misc.itmap(int, data, 0).next)
 
 
+class BatcherTests(TestCaseBase):
+    def testSingleCall(self):
+        batcher = misc.Batcher(sorted)
+        self.assertEquals(batcher([2, 1]), [1, 2])
+
+    def testMergeConcurrentCalls(self):
+        calls = []
+        running = threading.Event()
+        proceed = threading.Event()
+
+        def func(keys):
+            calls.append(keys)
+            running.set()
+            proceed.wait()
+            return keys
+
+        batcher = misc.Batcher(func)
+        results = {}
+
+        def call(key):
+            results[key] = batcher([key])
+
+        first = threading.Thread(target=call, args=("a",))
+        first.start()
+        running.wait()
+        # These callers arrive while "a" is running and share the next batch
+        others = [threading.Thread(target=call, args=(key,))
+                  for key in ("b", "c", "d")]
+        for t in others:
+            t.start()
+        time.sleep(0.2)
+        proceed.set()
+        for t in [first] + others:
+            t.join()
+
+        self.assertEquals(calls, [frozenset("a"), frozenset("bcd")])
+        self.assertEquals(results["a"], frozenset("a"))
+        for key in "bcd":
+            self.assertEquals(results[key], frozenset("bcd"))
+
+    def testErrorSharedByBatch(self):
+        def func(keys):
+            raise RuntimeError("batch failed")
+
+        batcher = misc.Batcher(func)
+        self.assertRaises(RuntimeError, batcher, ["a"])
+        # A failed batch does not prevent the next one
+        batcher._func = sorted
+        self.assertEquals(batcher(["b"]), ["b"])
+
+
 class RotateFiles(TestCaseBase):
     def testNonExistingDir(self, persist=False):
         """
@@ -790,6 +842,58 @@ class ReadBlock(TestCaseBase):
         os.unlink(path)
 
 
+class DirectRead(TestCaseBase):
+
+    def testReadSpeed(self):
+        with temporaryPath(data="x" * 8192) as path:
+            stats = misc.readspeed(path, 4096)
+        self.assertEquals(stats['bytes'], 4096)
+        self.assertTrue(stats['seconds'] >= 0)
+
+    def testReadSpeedWholeFile(self):
+        with temporaryPath(data="x" * 8192) as path:
+            stats = misc.readspeed(path)
+        self.assertEquals(stats['bytes'], 8192)
+
+    def testReadSpeedMissing(self):
+        self.assertRaises(misc.se.MiscFileReadException, misc.readspeed,
+                          os.path.join(TEMPDIR, "missing"), 4096)
+
+    def testReadChunkShort(self):
+        with temporaryPath(data="x" * 4096) as path:
+            self.assertEquals(misc.readchunk(path, 0, 8192), "x" * 4096)
+
+    def testReadChunkMissing(self):
+        self.assertRaises(misc.se.MiscBlockReadException, misc.readchunk,
+                          os.path.join(TEMPDIR, "missing"), 0, 4096)
+
+    def testTimeout(self):
+        release = threading.Event()
+
+        def blockedRead(path, offset, size):
+            release.wait()
+            return "x" * size
+
+        def ddRead(path, offset, size):
+            return ["dd"]
+
+        with MonkeyPatchScope([(misc, 'DIRECTIO_TIMEOUT', 0.1),
+                               (misc.directio, 'read', blockedRead),
+                               (misc, '_ddReadblock', ddRead)]):
+            try:
+                self.assertRaises(misc.se.MiscBlockReadException,
+                                  misc.readblock, "path", 0, 512)
+                # The direct read is stuck, use dd until it returns
+                self.assertEquals(misc.readblock("path", 0, 512), ["dd"])
+            finally:
+                release.set()
+            for i in range(50):
+                if not misc._isStuck("path"):
+                    break
+                time.sleep(0.1)
+            self.assertEquals(misc.readblock("path", 0, 512), ["x" * 512])
+
+
 class CleanUpDir(TestCaseBase):
     def testFullDir(self):
         """
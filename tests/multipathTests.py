@@ -0,0 +1,83 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+from storage import multipath
+from storage import uevent
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class DeviceInfoCacheTests(TestCaseBase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = multipath.DeviceInfoCache(ttl=60, clock=self.clock)
+        self.info = {"serial": "serial0"}
+        self.cache.set("dm-1", "guid1", ("sdb", "sdc"), self.info)
+
+    def testGet(self):
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          self.info)
+
+    def testMissing(self):
+        self.assertEquals(self.cache.get("dm-2", "guid2", ("sdd",)), None)
+
+    def testExpired(self):
+        self.clock.now = 60
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          None)
+
+    def testGuidChanged(self):
+        self.assertEquals(self.cache.get("dm-1", "guid2", ("sdb", "sdc")),
+                          None)
+
+    def testSlavesChanged(self):
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb",)), None)
+
+    def testUeventDmDevice(self):
+        self.cache.handleUevent({uevent.ACTION: uevent.CHANGE,
+                                 uevent.DEVNAME: "dm-1"})
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          None)
+
+    def testUeventSlave(self):
+        self.cache.handleUevent({uevent.ACTION: uevent.REMOVE,
+                                 uevent.DEVNAME: "sdc"})
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          None)
+
+    def testUeventOtherDevice(self):
+        self.cache.handleUevent({uevent.ACTION: uevent.CHANGE,
+                                 uevent.DEVNAME: "sdd"})
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          self.info)
+
+    def testUeventsLost(self):
+        self.cache.handleUevent(None)
+        self.assertEquals(self.cache.get("dm-1", "guid1", ("sdb", "sdc")),
+                          None)
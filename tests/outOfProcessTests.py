@@ -54,3 +54,26 @@ class OopWrapperTests(TestCaseBase):
         self.pool.utils.rmFile(tmpfile)
         os.close(tmpfd)
         return True
+
+    def testMultiCall(self):
+        results = self.pool.multiCall([
+            ("os.path.exists", ("/dev/null",)),
+            ("os.stat", ("/no/such/file",)),
+            ("fileUtils.pathExists", ("/dev/null",), {"writable": True}),
+        ])
+        self.assertEquals(len(results), 3)
+        self.assertEquals(results[0], (True, None))
+        res, err = results[1]
+        self.assertEquals(res, None)
+        self.assertTrue(isinstance(err, OSError))
+        self.assertEquals(results[2], (True, None))
+
+    def testMultiCallEmpty(self):
+        self.assertEquals(self.pool.multiCall([]), [])
+
+    def testMultiCallResults(self):
+        self.assertEquals(oop.multiCallResults([(1, None), (2, None)]),
+                          [1, 2])
+        err = OSError(2, "No such file or directory")
+        self.assertRaises(OSError, oop.multiCallResults,
+                          [(1, None), (None, err)])
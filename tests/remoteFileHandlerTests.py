@@ -17,12 +17,16 @@
 #
 # Refer to the README and COPYING files for full details of the license
 #
+import logging
 import os
 import string
 import tempfile
+import threading
+import time
 from vdsm import utils
 
 from testrunner import VdsmTestCase as TestCaseBase
+from testValidation import slowtest
 import storage.remoteFileHandler as rhandler
 
 HANDLERS_NUM = 10
@@ -100,3 +104,137 @@ class RemoteFileHandlerTruncateTests(TestCaseBase):
     def checkData(self, expected):
         actual = open(self.path).read()
         self.assertEquals(expected, actual)
+
+
+class RemoteFileHandlerPipeliningTests(TestCaseBase):
+
+    def callInThreads(self, pool, calls):
+        results = [None] * len(calls)
+
+        def run(i, args):
+            try:
+                results[i] = pool.callCrabRPCFunction(*args)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i, args))
+                   for i, args in enumerate(calls)]
+        for t in threads:
+            t.start()
+            # Keep the calls order
+            time.sleep(0.1)
+        for t in threads:
+            t.join()
+        return results
+
+    def testConcurrentCalls(self):
+        pool = rhandler.RemoteFileHandlerPool(1, callsPerHandler=2)
+        try:
+            start = time.time()
+            results = self.callInThreads(pool, [(5, "sleep", 1),
+                                                (5, "echo", "data")])
+            self.assertEquals(results, [None, "data"])
+            self.assertTrue(time.time() - start < 2)
+        finally:
+            pool.close()
+
+    def testTimeoutDoesNotFailOtherCalls(self):
+        pool = rhandler.RemoteFileHandlerPool(1, callsPerHandler=2)
+        try:
+            results = self.callInThreads(pool, [(5, "sleep", 1),
+                                                (0.2, "sleep", 5)])
+            self.assertEquals(results[0], None)
+            self.assertTrue(isinstance(results[1], rhandler.Timeout))
+            # The helper is replaced after the timeout
+            self.assertEquals(pool.callCrabRPCFunction(5, "echo", "x"), "x")
+        finally:
+            pool.close()
+
+    def testNoFreeHandler(self):
+        pool = rhandler.RemoteFileHandlerPool(1)
+        try:
+            results = self.callInThreads(pool, [(5, "sleep", 1),
+                                                (5, "echo", "data")])
+            self.assertEquals(results[0], None)
+            self.assertEquals(str(results[1]), "No free file handlers in pool")
+        finally:
+            pool.close()
+
+    def testQueuedCall(self):
+        pool = rhandler.RemoteFileHandlerPool(1, maxQueuedCalls=1)
+        try:
+            results = self.callInThreads(pool, [(5, "sleep", 1),
+                                                (5, "echo", "data")])
+            self.assertEquals(results, [None, "data"])
+        finally:
+            pool.close()
+
+    def testQueuedCallTimeout(self):
+        pool = rhandler.RemoteFileHandlerPool(1, maxQueuedCalls=1)
+        try:
+            results = self.callInThreads(pool, [(5, "sleep", 1),
+                                                (0.2, "echo", "data")])
+            self.assertEquals(results[0], None)
+            self.assertTrue(isinstance(results[1], rhandler.Timeout))
+        finally:
+            pool.close()
+
+
+class WireFormatTests(TestCaseBase):
+
+    def testMarshal(self):
+        msg = (1, "readLines", ("/path",), {"key": None})
+        data = rhandler.encode(msg, rhandler.FORMAT_MARSHAL)
+        self.assertEquals(data[0], rhandler.FORMAT_MARSHAL)
+        self.assertEquals(rhandler.decode(data),
+                          (rhandler.FORMAT_MARSHAL, msg))
+
+    def testPickle(self):
+        msg = (1, ["line\n"] * 3, None)
+        data = rhandler.encode(msg, rhandler.FORMAT_PICKLE)
+        self.assertEquals(data[0], rhandler.FORMAT_PICKLE)
+        self.assertEquals(rhandler.decode(data), (rhandler.FORMAT_PICKLE, msg))
+
+    def testUnmarshallable(self):
+        msg = (1, None, OSError(2, "No such file or directory"))
+        data = rhandler.encode(msg, rhandler.FORMAT_MARSHAL)
+        self.assertEquals(data[0], rhandler.FORMAT_PICKLE)
+        wireFormat, (reqId, res, err) = rhandler.decode(data)
+        self.assertEquals(err.args, msg[2].args)
+
+    def testDecodeBytearray(self):
+        for wireFormat in (rhandler.FORMAT_MARSHAL, rhandler.FORMAT_PICKLE):
+            msg = (1, ["line\n"] * 3, None)
+            data = bytearray(rhandler.encode(msg, wireFormat))
+            self.assertEquals(rhandler.decode(data), (wireFormat, msg))
+
+    def testUnknownFormat(self):
+        self.assertRaises(ValueError, rhandler.decode, "X")
+
+    def testPickleHandler(self):
+        p = rhandler.PoolHandler(rhandler.FORMAT_PICKLE)
+        try:
+            self.assertEquals(p.proxy.callCrabRPCFunction(4, "echo", "data"),
+                              "data")
+        finally:
+            p.stop()
+
+    def testUnmarshallableResult(self):
+        p = rhandler.PoolHandler()
+        try:
+            st = p.proxy.callCrabRPCFunction(4, "os.stat", "/")
+            self.assertEquals(st.st_ino, os.stat("/").st_ino)
+        finally:
+            p.stop()
+
+    @slowtest
+    def testBenchmark(self):
+        lines = ["line %d of a metadata file\n" % i for i in range(100000)]
+        msg = (1, lines, None)
+        for wireFormat in (rhandler.FORMAT_PICKLE, rhandler.FORMAT_MARSHAL):
+            start = time.time()
+            for i in range(10):
+                data = rhandler.encode(msg, wireFormat)
+                rhandler.decode(bytearray(data))
+            logging.info("format %s: %d bytes, %.6f seconds per message",
+                         wireFormat, len(data), (time.time() - start) / 10)
@@ -20,12 +20,14 @@
 
 import os
 import tempfile
+import threading
 import shutil
 
 import virt.sampling as sampling
 
 from testrunner import VdsmTestCase as TestCaseBase
 from monkeypatch import MonkeyPatchScope
+from vdsm import utils
 
 
 class SamplingTests(TestCaseBase):
@@ -101,3 +103,251 @@ procs_blocked 0
         with MonkeyPatchScope([(sampling, '_PROC_STAT_PATH',
                                 self._extra_path)]):
             self.assertEquals(sampling.getBootTime(), 1395249141)
+
+
+class TimerWheelTests(TestCaseBase):
+
+    def testAdvance(self):
+        wheel = sampling.TimerWheel(size=4)
+        wheel.add(1, "a")
+        wheel.add(3, "b")
+        wheel.add(6, "c")
+        due = [wheel.advance() for i in range(8)]
+        self.assertEquals(due, [["a"], [], ["b"], [], [], ["c"], [], []])
+
+    def testFullRound(self):
+        wheel = sampling.TimerWheel(size=4)
+        wheel.add(4, "a")
+        wheel.add(8, "b")
+        due = [wheel.advance() for i in range(8)]
+        self.assertEquals(due, [[], [], [], ["a"], [], [], [], ["b"]])
+
+
+class FakeStatsFunction(object):
+    def __init__(self, interval, func=None):
+        self.interval = interval
+        self.calls = 0
+        self._func = func
+
+    def __call__(self):
+        self.calls += 1
+        if self._func:
+            self._func()
+
+
+class StatsSchedulerTests(TestCaseBase):
+
+    def setUp(self):
+        # Not started, ticks are triggered by the tests
+        self.scheduler = sampling.StatsScheduler(1, 1)
+        self.func = FakeStatsFunction(2)
+        self.collector = sampling.AdvancedStatsCollector(
+            scheduler=self.scheduler)
+        self.collector.addStatsFunction(self.func)
+        self.collector.start()
+
+    def runQueued(self):
+        ran = []
+        while not self.scheduler._queue.empty():
+            collector, functions = self.scheduler._queue.get()
+            collector.collect(functions)
+            collector.queued = False
+            ran.extend(functions)
+        return ran
+
+    def testSchedule(self):
+        ran = []
+        for now in range(6):
+            self.scheduler._tick(now)
+            ran.append(len(self.runQueued()))
+        self.assertEquals(ran, [1, 0, 1, 0, 1, 0])
+        self.assertEquals(self.func.calls, 3)
+        self.assertNotEquals(self.collector.getLastSampleTime(), None)
+
+    def testPause(self):
+        self.collector.pause()
+        for now in range(4):
+            self.scheduler._tick(now)
+        self.assertEquals(self.runQueued(), [])
+        self.collector.cont()
+        for now in range(4, 6):
+            self.scheduler._tick(now)
+        self.assertEquals(self.runQueued(), [self.func])
+
+    def testStop(self):
+        self.collector.stop()
+        for now in range(4):
+            self.scheduler._tick(now)
+        self.assertEquals(self.runQueued(), [])
+        self.assertFalse(self.collector.isAlive())
+
+    def testBackoff(self):
+        self.scheduler._tick(0)
+        # Job is started but never completes
+        self.scheduler._queue.get()
+        self.collector.runStart = 0
+        queued = []
+        for now in range(1, 12):
+            self.scheduler._tick(now)
+            queued.append(self.scheduler._queue.qsize())
+        # Blocked at 2, delayed by 2 << 1 ticks, blocked again at 6,
+        # delayed by 2 << 2 ticks.
+        self.assertEquals(queued, [0] * 11)
+        self.assertEquals(self.collector.backoff, 2)
+        # Once the collector completes, it runs on the next due tick
+        self.collector.runStart = None
+        self.collector.queued = False
+        for now in range(12, 15):
+            self.scheduler._tick(now)
+        self.assertEquals(self.runQueued(), [self.func])
+        self.assertEquals(self.collector.backoff, 0)
+
+    def testQueuedNotBackedOff(self):
+        self.scheduler._tick(0)
+        # Job is queued but no worker has started it yet
+        for now in range(1, 12):
+            self.scheduler._tick(now)
+        self.assertEquals(self.scheduler._queue.qsize(), 1)
+        self.assertEquals(self.collector.backoff, 0)
+        # Once the job runs, the collector runs again on the next tick
+        self.assertEquals(self.runQueued(), [self.func])
+        self.scheduler._tick(12)
+        self.assertEquals(self.runQueued(), [self.func])
+
+    def testAddFunctionAfterStart(self):
+        self.assertRaises(RuntimeError, self.collector.addStatsFunction,
+                          FakeStatsFunction(1))
+
+
+class StatsSchedulerIsolationTests(TestCaseBase):
+
+    def testBlockedCollector(self):
+        scheduler = sampling.StatsScheduler(1, 2)
+        scheduler.TICK = 0.1
+        scheduler.start()
+        release = threading.Event()
+        try:
+            blocked = sampling.AdvancedStatsCollector(scheduler=scheduler)
+            blocked.addStatsFunction(FakeStatsFunction(1, release.wait))
+            blocked.start()
+
+            counter = FakeStatsFunction(1)
+            other = sampling.AdvancedStatsCollector(scheduler=scheduler)
+            other.addStatsFunction(counter)
+            other.start()
+
+            def sampled():
+                self.assertTrue(counter.calls > 2)
+
+            utils.retry(sampled, AssertionError, timeout=3, sleep=0.1)
+        finally:
+            release.set()
+            scheduler.stop()
+
+
+class AdvancedStatsCollectorGenerationTests(TestCaseBase):
+
+    def testGeneration(self):
+        sampled = sampling.AdvancedStatsFunction(lambda: 1, window=2)
+        notSampled = sampling.AdvancedStatsFunction(lambda: 1)
+        collector = sampling.AdvancedStatsCollector()
+        collector.addStatsFunction(sampled, notSampled)
+        generation = collector.generation
+        collector.collect([notSampled])
+        self.assertEquals(collector.generation, generation)
+        collector.collect([sampled])
+        self.assertNotEquals(collector.generation, generation)
+
+
+def _linkStats(name, index, flags):
+    return {'name': name, 'index': index, 'flags': flags, 'master': 0,
+            'rx_bytes': 0, 'tx_bytes': 0, 'rx_errors': 0, 'tx_errors': 0,
+            'rx_dropped': 0, 'tx_dropped': 0}
+
+
+class InterfaceSampleTests(TestCaseBase):
+
+    def testOperstate(self):
+        link = _linkStats('eth0', 1, sampling.ethtool.IFF_RUNNING)
+        self.assertEquals(sampling.InterfaceSample(link).operstate, 'up')
+        link['flags'] = 0
+        self.assertEquals(sampling.InterfaceSample(link).operstate, 'down')
+
+
+class HostStatsThreadLinkSpeedsTests(TestCaseBase):
+
+    def testLinkSpeedsCached(self):
+        links = [_linkStats('eth0', 1, sampling.ethtool.IFF_RUNNING)]
+        calls = []
+
+        def getLinks():
+            calls.append(True)
+            return []
+
+        with MonkeyPatchScope([
+                (sampling.netlink, 'iter_links_stats', lambda: iter(links)),
+                (sampling, 'getLinks', getLinks)]):
+            thread = sampling.HostStatsThread(sampling.logging.getLogger())
+            self.assertEquals(len(calls), 1)
+            links[0]['rx_bytes'] = 1000
+            thread._updateIfidsIfrates(links)
+            self.assertEquals(len(calls), 1)
+            links[0]['flags'] = 0
+            thread._updateIfidsIfrates(links)
+            self.assertEquals(len(calls), 2)
+            links.append(_linkStats('eth1', 2, 0))
+            thread._updateIfidsIfrates(links)
+            self.assertEquals(len(calls), 3)
+            self.assertEquals(thread._ifids, ['eth0', 'eth1'])
+            self.assertEquals(thread._ifrates, [0, 0])
+
+
+class _FakeHostSample(object):
+    def __init__(self, timestamp, cpuCores):
+        self.timestamp = timestamp
+        self.cpuCores = cpuCores
+
+
+class CpuCoresStatsTests(TestCaseBase):
+    proc_stat = """\
+cpu  4350684 14521 1120299 20687999 677480 197238 48056 0 1383 0
+cpu0 %d 1040 %d 19253788 628168 104752 21570 0 351 0
+cpu1 1010362 2065 294113 474697 18915 41743 9793 0 308 0
+intr 0
+ctxt 690239751
+"""
+
+    def _sample(self, user, sys):
+        return sampling.CpuCoreSample(self.proc_stat % (user, sys))
+
+    def testCoreSample(self):
+        sample = self._sample(1082143, 335283)
+        self.assertEquals(list(sample.coreIds), [0, 1])
+        self.assertEquals(list(sample.user), [1082143, 1010362])
+        self.assertEquals(list(sample.sys), [335283, 294113])
+
+    def testTotalSample(self):
+        sample = sampling.TotalCpuSample(self.proc_stat % (0, 0))
+        self.assertEquals((sample.user, sample.sys, sample.idle),
+                          (4350684 + 14521, 1120299, 20687999))
+
+    def testCoresStats(self):
+        topology = {'0': {'cpus': [0]}, '1': {'cpus': [1]}}
+        with MonkeyPatchScope([
+                (sampling.netlink, 'iter_links_stats', lambda: iter([])),
+                (sampling, 'getLinks', lambda: []),
+                (sampling.caps, 'getNumaTopology', lambda: topology)]):
+            thread = sampling.HostStatsThread(sampling.logging.getLogger())
+            thread._samples = [_FakeHostSample(0, self._sample(100, 100)),
+                               _FakeHostSample(2, self._sample(150, 110))]
+            stats = thread._getCpuCoresStats()
+            self.assertEquals(stats['0'], {'nodeIndex': 0,
+                                           'cpuUser': '25.00',
+                                           'cpuSys': '5.00',
+                                           'cpuIdle': '70.00'})
+            self.assertEquals(stats['1'], {'nodeIndex': 1,
+                                           'cpuUser': '0.00',
+                                           'cpuSys': '0.00',
+                                           'cpuIdle': '100.00'})
+            # Computed once per sample
+            self.assertTrue(thread._getCpuCoresStats() is stats)
@@ -0,0 +1,153 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import json
+import threading
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+from rpc import StatsPublisher
+
+TOPIC = "/topic/test"
+
+
+class _FakeServer(object):
+    def __init__(self):
+        self.connected = True
+        self.messages = []
+        self.published = threading.Event()
+
+    def publish(self, subid, destination, message):
+        self.messages.append((subid, destination, json.loads(message)))
+        self.published.set()
+
+
+class _Sampler(object):
+    def __init__(self, sample):
+        self.sample = sample
+
+    def __call__(self):
+        return dict(self.sample)
+
+
+class DeltaTests(TestCaseBase):
+
+    def testHostUnchanged(self):
+        stats = {'cpuIdle': '99.0', 'memFree': 1024}
+        self.assertEquals(StatsPublisher.hostStatsDelta(stats, stats), None)
+
+    def testHostChanged(self):
+        old = {'cpuIdle': '99.0', 'memFree': 1024, 'haScore': 1}
+        new = {'cpuIdle': '98.0', 'memFree': 1024, 'ksmCpu': 0}
+        self.assertEquals(StatsPublisher.hostStatsDelta(old, new),
+                          {'full': False,
+                           'changed': {'cpuIdle': '98.0', 'ksmCpu': 0},
+                           'removed': ['haScore']})
+
+    def testVmUnchanged(self):
+        stats = {'vm1': {'status': 'Up'}, 'vm2': {'status': 'Paused'}}
+        self.assertEquals(StatsPublisher.vmStatsDelta(stats, stats), None)
+
+    def testVmChanged(self):
+        old = {'vm1': {'status': 'Up', 'cpuUser': '1.0', 'hash': '1'},
+               'vm2': {'status': 'Up'},
+               'vm3': {'status': 'Up'}}
+        new = {'vm1': {'status': 'Up', 'cpuUser': '2.0'},
+               'vm2': {'status': 'Up'},
+               'vm4': {'status': 'Migration Destination'}}
+        self.assertEquals(StatsPublisher.vmStatsDelta(old, new),
+                          {'full': False,
+                           'changed': {'vm1': {'cpuUser': '2.0'},
+                                       'vm4': new['vm4']},
+                           'removed': ['vm3'],
+                           'removedFields': {'vm1': ['hash']}})
+
+
+class TopicTests(TestCaseBase):
+
+    def setUp(self):
+        self.sampler = _Sampler({'a': 1, 'b': 2})
+        self.topic = StatsPublisher.Topic(TOPIC, self.sampler,
+                                          StatsPublisher.hostStatsDelta)
+
+    def testFullThenDelta(self):
+        server = _FakeServer()
+        self.topic.subscribe(server, 'sub')
+        self.topic.publish()
+        self.sampler.sample['b'] = 3
+        self.topic.publish()
+        self.assertEquals(server.messages, [
+            ('sub', TOPIC, {'full': True, 'changed': {'a': 1, 'b': 2},
+                            'removed': []}),
+            ('sub', TOPIC, {'full': False, 'changed': {'b': 3},
+                            'removed': []})])
+
+    def testNothingChanged(self):
+        server = _FakeServer()
+        self.topic.subscribe(server, 'sub')
+        self.topic.publish()
+        self.topic.publish()
+        self.assertEquals(len(server.messages), 1)
+
+    def testLateSubscriber(self):
+        first = _FakeServer()
+        self.topic.subscribe(first, 'sub')
+        self.topic.publish()
+        self.sampler.sample['a'] = 0
+        second = _FakeServer()
+        self.topic.subscribe(second, 'sub')
+        self.topic.publish()
+        self.assertEquals(first.messages[-1][2]['changed'], {'a': 0})
+        self.assertEquals(second.messages, [
+            ('sub', TOPIC, {'full': True, 'changed': {'a': 0, 'b': 2},
+                            'removed': []})])
+
+    def testUnsubscribe(self):
+        server = _FakeServer()
+        self.topic.subscribe(server, 'sub')
+        self.topic.unsubscribe(server, 'sub')
+        self.assertFalse(self.topic.active)
+
+    def testClosedConnection(self):
+        server = _FakeServer()
+        self.topic.subscribe(server, 'sub')
+        server.connected = False
+        self.topic.publish()
+        self.assertEquals(server.messages, [])
+        self.assertFalse(self.topic.active)
+
+
+class StatsPublisherTests(TestCaseBase):
+
+    def testUnknownDestination(self):
+        publisher = StatsPublisher.StatsPublisher([], 60)
+        self.assertFalse(publisher.subscribe(_FakeServer(), 'sub', TOPIC))
+
+    def testPublishOnSubscribe(self):
+        topic = StatsPublisher.Topic(TOPIC, _Sampler({'a': 1}),
+                                     StatsPublisher.hostStatsDelta)
+        publisher = StatsPublisher.StatsPublisher([topic], 60)
+        publisher.start()
+        try:
+            server = _FakeServer()
+            self.assertTrue(publisher.subscribe(server, 'sub', TOPIC))
+            self.assertTrue(server.published.wait(5))
+        finally:
+            publisher.stop()
@@ -0,0 +1,303 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+import logging
+import select
+import socket
+import threading
+import time
+
+from testrunner import VdsmTestCase as TestCaseBase
+from testValidation import slowtest
+
+from yajsonrpc import stomp
+from yajsonrpc.stompReactor import StompReactor, StompServer
+
+DESTINATION = "/queue/_local/vdsm/requests"
+TIMEOUT = 30
+
+
+def _frame(body, contentLength=True):
+    data = stomp.Frame(stomp.Command.SEND, {"destination": DESTINATION},
+                       body).encode()
+    if not contentLength:
+        data = data.replace("content-length:%d\n" % len(body), "")
+    return data
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in xrange(0, len(data), size)]
+
+
+class ParserTests(TestCaseBase):
+
+    def _parse(self, chunks):
+        parser = stomp.Parser()
+        for chunk in chunks:
+            parser.parse(chunk)
+        frames = []
+        while parser.pending:
+            frames.append(parser.popFrame())
+        return frames
+
+    def testContentLength(self):
+        body = "body with\0null\nand newline"
+        frames = self._parse([_frame(body)])
+        self.assertEquals(len(frames), 1)
+        self.assertEquals(frames[0].command, stomp.Command.SEND)
+        self.assertEquals(frames[0].headers["destination"], DESTINATION)
+        self.assertEquals(frames[0].body, body)
+
+    def testNullTerminated(self):
+        frames = self._parse([_frame("body", contentLength=False)])
+        self.assertEquals(frames[0].body, "body")
+        self.assertNotIn("content-length", frames[0].headers)
+
+    def testByteByByte(self):
+        data = _frame("first") + _frame("second", contentLength=False)
+        frames = self._parse(data)
+        self.assertEquals([f.body for f in frames], ["first", "second"])
+
+    def testBodyWithoutTerminator(self):
+        data = _frame("body")
+        frames = self._parse([data[:-1]])
+        self.assertEquals(frames, [])
+        frames = self._parse([data[:-1], data[-1:]])
+        self.assertEquals(frames[0].body, "body")
+
+    def testManyFramesInOneChunk(self):
+        bodies = ["body %d" % i for i in range(100)]
+        data = "".join(_frame(b, contentLength=i % 2)
+                       for i, b in enumerate(bodies))
+        frames = self._parse([data])
+        self.assertEquals([f.body for f in frames], bodies)
+
+    def testCarriageReturn(self):
+        data = "SEND\r\ndestination:%s\r\n\r\nbody\0" % DESTINATION
+        frames = self._parse([data])
+        self.assertEquals(frames[0].headers["destination"], DESTINATION)
+        self.assertEquals(frames[0].body, "body")
+
+    def testHeartBeats(self):
+        frames = self._parse(["\n\n", _frame("body"), "\n"])
+        self.assertEquals([f.body for f in frames], ["body"])
+
+    def testEscapedHeaders(self):
+        data = stomp.Frame(stomp.Command.SEND,
+                           {"key": "a:b\nc"}, "body").encode()
+        frames = self._parse([data])
+        self.assertEquals(frames[0].headers["key"], "a:b\nc")
+
+    def testLargeFrame(self):
+        body = "x" * (5 * 1024 ** 2)
+        frames = self._parse(_split(_frame(body), 4096))
+        self.assertEquals(frames[0].body, body)
+
+
+class _FakeDispatcher(object):
+    """
+    Accepts at most maxSend bytes on each send.
+    """
+
+    def __init__(self, maxSend):
+        self.maxSend = maxSend
+        self.sent = []
+
+    def send(self, data):
+        data = str(data)[:self.maxSend]
+        self.sent.append(data)
+        return len(data)
+
+
+class AsyncDispatcherTests(TestCaseBase):
+
+    def testPartialWrites(self):
+        adisp = stomp.AsyncDispatcher(None, bufferSize=64)
+        frames = [stomp.Frame(stomp.Command.MESSAGE, {}, "x" * 1000),
+                  stomp.Frame(stomp.Command.MESSAGE, {}, "y" * 10)]
+        for frame in frames:
+            adisp.send_raw(frame)
+
+        disp = _FakeDispatcher(50)
+        while adisp.writable(disp):
+            adisp.handle_write(disp)
+
+        self.assertEquals("".join(disp.sent),
+                          "".join(f.encode() for f in frames))
+        self.assertEquals(adisp.outgoing, 0)
+
+
+class StompServerBenchmarkTests(TestCaseBase):
+
+    def setUp(self):
+        self.reactor = StompReactor()
+        t = threading.Thread(target=self.reactor.process_requests)
+        t.setDaemon(True)
+        t.start()
+        self.serverSock, self.clientSock = socket.socketpair()
+        self.server = StompServer(self.serverSock, self.reactor)
+        self.messages = []
+        self.received = threading.Event()
+        self.expected = 0
+        self.server.setMessageHandler(self._handleMessage)
+        self.reactor.wakeup()
+
+    def tearDown(self):
+        self.reactor.stop()
+        self.clientSock.close()
+
+    def _handleMessage(self, msg):
+        server, data = msg
+        self.messages.append(data)
+        if len(self.messages) == self.expected:
+            self.received.set()
+
+    @slowtest
+    def testLargeFrames(self):
+        count = 10
+        body = "x" * (5 * 1024 ** 2)
+
+        self.expected = count
+        start = time.time()
+        data = _frame(body)
+        for i in range(count):
+            self.clientSock.sendall(data)
+        self.assertTrue(self.received.wait(TIMEOUT))
+        elapsed = time.time() - start
+        logging.info("received %d frames of %d bytes, %.6f seconds per "
+                     "frame", count, len(body), elapsed / count)
+        self.assertEquals(self.messages, [body] * count)
+
+        parser = stomp.Parser()
+        start = time.time()
+        for i in range(count):
+            self.server.send(body)
+            while not parser.pending:
+                parser.parse(self.clientSock.recv(65536))
+            self.assertEquals(parser.popFrame().body, body)
+        elapsed = time.time() - start
+        logging.info("sent %d frames of %d bytes, %.6f seconds per frame",
+                     count, len(body), elapsed / count)
+
+
+class StompReactorTests(TestCaseBase):
+
+    def setUp(self):
+        self.reactor = StompReactor()
+        t = threading.Thread(target=self.reactor.process_requests)
+        t.setDaemon(True)
+        t.start()
+
+    def tearDown(self):
+        self.reactor.stop()
+
+    def _echoServer(self, sock):
+        server = StompServer(sock, self.reactor)
+
+        def echo(msg):
+            server, data = msg
+            server.send(data)
+
+        server.setMessageHandler(echo)
+        self.reactor.wakeup()
+        return server
+
+    def _recv(self, sock):
+        parser = stomp.Parser()
+        while not parser.pending:
+            data = sock.recv(4096)
+            self.assertNotEquals(data, "")
+            parser.parse(data)
+        return parser.popFrame()
+
+    def testManyConnections(self):
+        clients = []
+        try:
+            for i in range(50):
+                serverSock, clientSock = socket.socketpair()
+                clientSock.settimeout(TIMEOUT)
+                clients.append(clientSock)
+                self._echoServer(serverSock)
+
+            for i, sock in enumerate(clients):
+                sock.sendall(_frame("message %d" % i))
+
+            for i, sock in enumerate(clients):
+                self.assertEquals(self._recv(sock).body, "message %d" % i)
+        finally:
+            for sock in clients:
+                sock.close()
+
+    def testWriteInterestCleared(self):
+        serverSock, clientSock = socket.socketpair()
+        clientSock.settimeout(TIMEOUT)
+        try:
+            server = self._echoServer(serverSock)
+            clientSock.sendall(_frame("x" * 1024 ** 2))
+            self.assertEquals(self._recv(clientSock).body, "x" * 1024 ** 2)
+            fd = server._stompConn._dispatcher._fileno
+            # The reactor stops polling for writing after the frame was sent
+            for i in range(50):
+                if not self.reactor._map._events[fd] & select.EPOLLOUT:
+                    break
+                time.sleep(0.1)
+            self.assertFalse(self.reactor._map._events[fd] & select.EPOLLOUT)
+        finally:
+            clientSock.close()
+
+    def testClosedConnection(self):
+        serverSock, clientSock = socket.socketpair()
+        server = self._echoServer(serverSock)
+        fd = server._stompConn._dispatcher._fileno
+        clientSock.close()
+        for i in range(50):
+            if fd not in self.reactor._map:
+                break
+            time.sleep(0.1)
+        self.assertNotIn(fd, self.reactor._map)
+
+    def testSubscription(self):
+        serverSock, clientSock = socket.socketpair()
+        clientSock.settimeout(TIMEOUT)
+        subscribed = threading.Event()
+
+        class Handler(object):
+            def subscribe(self, server, subid, destination):
+                server.publish(subid, destination, '{"full": true}')
+                subscribed.set()
+                return True
+
+            def unsubscribe(self, server, subid):
+                pass
+
+        try:
+            server = self._echoServer(serverSock)
+            server.setSubscriptionHandler(Handler())
+            clientSock.sendall(stomp.Frame(
+                stomp.Command.SUBSCRIBE,
+                {"destination": "/topic/test", "id": "sub"}).encode())
+            self.assertTrue(subscribed.wait(TIMEOUT))
+            frame = self._recv(clientSock)
+            self.assertEquals(frame.command, stomp.Command.MESSAGE)
+            self.assertEquals(frame.headers["subscription"], "sub")
+            self.assertEquals(frame.headers["destination"], "/topic/test")
+            self.assertEquals(frame.body, '{"full": true}')
+        finally:
+            clientSock.close()
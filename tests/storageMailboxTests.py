@@ -20,14 +20,19 @@
 
 from uuid import uuid4
 import threading
+import logging
 import os
 import shutil
+import struct
+import time
 
 from testrunner import VdsmTestCase as TestCaseBase
 
 import storage.storage_mailbox as sm
 from storage.sd import DOMAIN_META_DATA
 from vdsm.utils import retry
+from testValidation import slowtest
+import storage.misc as misc
 import tempfile
 
 
@@ -39,6 +44,8 @@ class StoragePoolStub(object):
                                         "mastersd", DOMAIN_META_DATA)
 
         os.makedirs(self.__masterDir)
+        self.inbox = os.path.join(self.__masterDir, "inbox")
+        self.outbox = os.path.join(self.__masterDir, "outbox")
         for fname in ["id", "inbox", "outbox"]:
             with open(os.path.join(self.__masterDir, fname), "w") as f:
                 f.write("DATA")
@@ -49,6 +56,20 @@ class StoragePoolStub(object):
 
 
 class SPM_MailMonitorTests(TestCaseBase):
+
+    def stoppedMailer(self, hosts):
+        # The mailer thread is stopped so the tests can check the mail
+        # without racing with it
+        self.pool = StoragePoolStub()
+        mailer = sm.SPM_MailMonitor(self.pool, hosts, 0.1)
+        mailer.stop()
+
+        def assertStopped():
+            self.assertTrue(mailer.isStopped())
+
+        retry(AssertionError, assertStopped, timeout=4, sleep=0.1)
+        return mailer
+
     def testThreadLeak(self):
         mailer = sm.SPM_MailMonitor(StoragePoolStub(), 100)
         threadCount = len(threading.enumerate())
@@ -56,3 +77,74 @@ class SPM_MailMonitorTests(TestCaseBase):
         mailer.run()
         t = lambda: self.assertEquals(threadCount, len(threading.enumerate()))
         retry(AssertionError, t, timeout=4, sleep=0.1)
+
+    def testSendReply(self):
+        pool = StoragePoolStub()
+        mailer = sm.SPM_MailMonitor(pool, 4)
+        try:
+            msg = FakeMessage("r" * sm.MESSAGE_SIZE)
+            msgID = sm.SLOTS_PER_MAILBOX + 1
+            mailer.sendReply(msgID, msg)
+            with open(pool.outbox) as f:
+                outbox = f.read()
+            self.assertEquals(len(outbox), 4 * sm.MAILBOX_SIZE)
+            offset = msgID * sm.MESSAGE_SIZE
+            self.assertEquals(outbox[offset:offset + sm.MESSAGE_SIZE],
+                              msg.payload)
+            self.assertEquals(outbox.count("\0"),
+                              4 * sm.MAILBOX_SIZE - sm.MESSAGE_SIZE)
+        finally:
+            mailer.stop()
+
+    def testHandleRequestsUnchanged(self):
+        mailer = self.stoppedMailer(4)
+        newMail = mailbox(sm.CLEAN_MESSAGE)
+        newMail = sm.EMPTYMAILBOX * 2 + newMail + sm.EMPTYMAILBOX
+        self.assertTrue(mailer._handleRequests(newMail))
+        offset = (2 * sm.SLOTS_PER_MAILBOX) * sm.MESSAGE_SIZE
+        self.assertEquals(
+            mailer._outgoingMail[offset:offset + sm.MESSAGE_SIZE],
+            sm.CLEAN_MESSAGE)
+        # Nothing changed since the last read
+        self.assertFalse(mailer._handleRequests(newMail))
+
+    def testHandleRequestsInvalidChecksum(self):
+        mailer = self.stoppedMailer(2)
+        invalid = sm.CLEAN_MESSAGE + sm.EMPTYMAILBOX[sm.MESSAGE_SIZE:]
+        self.assertFalse(mailer._handleRequests(sm.EMPTYMAILBOX + invalid))
+        self.assertEquals(mailer._incomingMail, sm.EMPTYMAILBOX * 2)
+
+    def testSetMaxHostID(self):
+        mailer = self.stoppedMailer(4)
+        mailer.setMaxHostID(6)
+        self.assertEquals(len(mailer._outgoingMail), 6 * sm.MAILBOX_SIZE)
+        self.assertEquals(len(mailer._incomingMail), 6 * sm.MAILBOX_SIZE)
+        mailer.setMaxHostID(2)
+        self.assertEquals(len(mailer._outgoingMail), 2 * sm.MAILBOX_SIZE)
+        self.assertEquals(len(mailer._incomingMail), 2 * sm.MAILBOX_SIZE)
+
+    @slowtest
+    def testHandleRequestsBenchmark(self):
+        hosts = 2000
+        mailer = self.stoppedMailer(hosts)
+        newMail = sm.EMPTYMAILBOX * (hosts - 1) + mailbox(sm.CLEAN_MESSAGE)
+        self.assertTrue(mailer._handleRequests(newMail))
+        count = 100
+        start = time.time()
+        for i in range(count):
+            mailer._handleRequests(newMail)
+        elapsed = time.time() - start
+        logging.info("Scanned %d unchanged mailboxes in %.6f seconds",
+                     hosts, elapsed / count)
+
+
+def mailbox(*messages):
+    data = "".join(messages)
+    data += "\0" * (sm.MAILBOX_SIZE - sm.CHECKSUM_BYTES - len(data))
+    chk = misc.checksum(data, sm.CHECKSUM_BYTES)
+    return data + struct.pack('<l', chk)
+
+
+class FakeMessage(object):
+    def __init__(self, payload):
+        self.payload = payload
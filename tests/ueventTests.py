@@ -0,0 +1,79 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+import storage.uevent as uevent
+
+KERNEL_EVENT = "\0".join((
+    "change@/devices/virtual/block/dm-3",
+    "ACTION=change",
+    "DEVPATH=/devices/virtual/block/dm-3",
+    "SUBSYSTEM=block",
+    "DM_COOKIE=4194304",
+    "MAJOR=253",
+    "MINOR=3",
+    "DEVNAME=dm-3",
+    "DEVTYPE=disk",
+    "SEQNUM=2341",
+    "DM_NAME=vg--1-lv1",
+    "DM_UUID=LVM-vguuidlvuuid",
+    ""))
+
+UDEV_EVENT = "libudev\0\xfe\xed\xca\xfe(\0\0\0(\0\0\0"
+
+
+class ParseTests(TestCaseBase):
+    def testKernelEvent(self):
+        event = uevent.parse(KERNEL_EVENT)
+        self.assertEquals(event[uevent.ACTION], uevent.CHANGE)
+        self.assertEquals(event[uevent.DEVNAME], "dm-3")
+        self.assertEquals(event[uevent.DM_NAME], "vg--1-lv1")
+        self.assertEquals(event[uevent.SUBSYSTEM], "block")
+
+    def testActionFromHeader(self):
+        event = uevent.parse("remove@/devices/virtual/block/dm-3\0"
+                             "DEVNAME=dm-3\0")
+        self.assertEquals(event[uevent.ACTION], uevent.REMOVE)
+
+    def testUdevEvent(self):
+        self.assertEquals(uevent.parse(UDEV_EVENT), None)
+
+
+class DispatchTests(TestCaseBase):
+    def testCallbackError(self):
+        events = []
+
+        def failing(event):
+            raise RuntimeError("callback failed")
+
+        monitor = uevent.UeventMonitor()
+        monitor.register(failing)
+        monitor.register(events.append)
+        monitor._dispatch({uevent.ACTION: uevent.ADD})
+        self.assertEquals(events, [{uevent.ACTION: uevent.ADD}])
+
+    def testUnregister(self):
+        events = []
+        monitor = uevent.UeventMonitor()
+        monitor.register(events.append)
+        monitor.unregister(events.append)
+        monitor._dispatch(None)
+        self.assertEquals(events, [])
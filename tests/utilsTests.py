@@ -23,6 +23,7 @@ import contextlib
 import errno
 import logging
 import sys
+import tempfile
 import threading
 
 from testrunner import VdsmTestCase as TestCaseBase
@@ -74,6 +75,34 @@ class PidStatTests(TestCaseBase):
         sproc.wait()
 
 
+class ProcFileTests(TestCaseBase):
+    def testReadAgain(self):
+        with tempfile.NamedTemporaryFile() as f:
+            procFile = utils.ProcFile(f.name, bufsize=4)
+            try:
+                f.write('first')
+                f.flush()
+                self.assertEquals(procFile.read(), 'first')
+                f.seek(0)
+                f.write('second content')
+                f.flush()
+                self.assertEquals(procFile.read(), 'second content')
+            finally:
+                procFile.close()
+
+    def testProcFile(self):
+        procFile = utils.ProcFile('/proc/self/stat')
+        try:
+            self.assertEquals(int(procFile.read().split()[0]), os.getpid())
+            self.assertEquals(int(procFile.read().split()[0]), os.getpid())
+        finally:
+            procFile.close()
+
+    def testMissing(self):
+        procFile = utils.ProcFile('/no/such/file')
+        self.assertRaises(IOError, procFile.read)
+
+
 class PgrepTests(TestCaseBase):
     def test(self):
         sleepProcs = []
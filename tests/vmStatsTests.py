@@ -0,0 +1,113 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from testrunner import VdsmTestCase as TestCaseBase
+
+from virt import vmstats
+
+
+def _stats(vmId, **kwargs):
+    stats = {'vmId': vmId, 'elapsedTime': '1', 'statsAge': '0.5',
+             'cpuUser': '1.00'}
+    stats.update(kwargs)
+    return stats
+
+
+class StatsChangeTrackerTests(TestCaseBase):
+
+    def setUp(self):
+        self.tracker = vmstats.StatsChangeTracker(maxRemoved=2)
+
+    def testNoToken(self):
+        statsList = [_stats('a'), _stats('b')]
+        changes = self.tracker.changes(statsList)
+        self.assertTrue(changes['full'])
+        self.assertEquals(changes['statsList'], statsList)
+        self.assertEquals(changes['removed'], [])
+
+    def testUnchanged(self):
+        token = self.tracker.changes([_stats('a')])['token']
+        changes = self.tracker.changes([_stats('a')], token)
+        self.assertFalse(changes['full'])
+        self.assertEquals(changes['statsList'], [])
+        self.assertEquals(changes['removed'], [])
+        self.assertEquals(changes['token'], token)
+
+    def testVolatileFieldsIgnored(self):
+        token = self.tracker.changes([_stats('a')])['token']
+        changes = self.tracker.changes(
+            [_stats('a', elapsedTime='2', statsAge='1.5')], token)
+        self.assertEquals(changes['statsList'], [])
+
+    def testChanged(self):
+        token = self.tracker.changes([_stats('a'), _stats('b')])['token']
+        changed = _stats('b', cpuUser='2.00')
+        changes = self.tracker.changes([_stats('a'), changed], token)
+        self.assertFalse(changes['full'])
+        self.assertEquals(changes['statsList'], [changed])
+
+    def testAdded(self):
+        token = self.tracker.changes([_stats('a')])['token']
+        changes = self.tracker.changes([_stats('a'), _stats('b')], token)
+        self.assertEquals(changes['statsList'], [_stats('b')])
+
+    def testRemoved(self):
+        token = self.tracker.changes([_stats('a'), _stats('b')])['token']
+        changes = self.tracker.changes([_stats('a')], token)
+        self.assertEquals(changes['statsList'], [])
+        self.assertEquals(changes['removed'], ['b'])
+        changes = self.tracker.changes([_stats('a')], changes['token'])
+        self.assertEquals(changes['removed'], [])
+
+    def testOlderTokenSeesAllChanges(self):
+        first = self.tracker.changes([_stats('a'), _stats('b')])['token']
+        self.tracker.changes([_stats('a', cpuUser='2.00'), _stats('b')])
+        changes = self.tracker.changes(
+            [_stats('a', cpuUser='2.00'), _stats('b', cpuUser='3.00')],
+            first)
+        self.assertEquals(sorted(s['vmId'] for s in changes['statsList']),
+                          ['a', 'b'])
+
+    def testRemovedAndAddedBack(self):
+        token = self.tracker.changes([_stats('a')])['token']
+        self.tracker.changes([])
+        changes = self.tracker.changes([_stats('a')], token)
+        self.assertEquals(changes['statsList'], [_stats('a')])
+        self.assertEquals(changes['removed'], [])
+
+    def testTooOldToken(self):
+        token = self.tracker.changes(
+            [_stats('a'), _stats('b'), _stats('c')])['token']
+        self.tracker.changes([])
+        changes = self.tracker.changes([_stats('d')], token)
+        self.assertTrue(changes['full'])
+        self.assertEquals(changes['statsList'], [_stats('d')])
+
+    def testInvalidToken(self):
+        self.tracker.changes([_stats('a')])
+        for token in ('', 'garbage', 'other:1', '%s:x' % self.tracker._epoch,
+                      '%s:100' % self.tracker._epoch):
+            changes = self.tracker.changes([_stats('a')], token)
+            self.assertTrue(changes['full'])
+
+    def testTokenOfOtherTracker(self):
+        token = vmstats.StatsChangeTracker().changes([_stats('a')])['token']
+        changes = self.tracker.changes([_stats('a')], token)
+        self.assertTrue(changes['full'])
@@ -1064,6 +1064,42 @@ class TestVmStatsThread(TestCaseBase):
                 self.assertIn('port', statsDev)
 
 
+class FakeSampledVmStats(object):
+    """
+    Reports the balloon target of the vm conf, with no new samples.
+    """
+    generation = 0
+
+    def __init__(self, vm):
+        self._vm = vm
+
+    def get(self):
+        target = self._vm.conf['devices'][0]['target']
+        return {'statsAge': 0,
+                'balloonInfo': {'balloon_target': target}}
+
+
+class TestSampledStatsCache(TestCaseBase):
+    DEV_BALLOON = [{'type': 'balloon', 'specParams': {'model': 'virtio'},
+                    'target': 1024}]
+
+    def testCached(self):
+        with FakeVM(devices=self.DEV_BALLOON) as fake:
+            fake._vmStats = FakeSampledVmStats(fake)
+            first = fake._getSampledStats()
+            self.assertTrue(fake._getSampledStats() is first)
+
+    def testConfChangeWithoutSamples(self):
+        with FakeVM(devices=self.DEV_BALLOON) as fake:
+            fake._vmStats = FakeSampledVmStats(fake)
+            stats = fake._getSampledStats()
+            self.assertEqual(stats['balloonInfo']['balloon_target'], 1024)
+            fake.conf['devices'][0]['target'] = 512
+            fake.saveState()
+            stats = fake._getSampledStats()
+            self.assertEqual(stats['balloonInfo']['balloon_target'], 512)
+
+
 class TestLibVirtCallbacks(TestCaseBase):
     FAKE_ERROR = 'EFAKERROR'
 
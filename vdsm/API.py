@@ -1223,14 +1223,33 @@ class Global(APIBase):
         Get statistics of all running VMs.
         """
         hooks.before_get_all_vm_stats()
+        statsList = self._getAllVmStats()
+        statsList = hooks.after_get_all_vm_stats(statsList)
+        return {'status': doneCode, 'statsList': statsList}
+
+    def getChangedVmStats(self, token=None):
+        """
+        Get statistics of the running VMs that changed since token.
+
+        :param token: the token returned by a previous call, or None to get
+                      the statistics of all the VMs.
+        """
+        hooks.before_get_all_vm_stats()
+        changes = self._cif.vmStatsTracker.changes(self._getAllVmStats(),
+                                                   token)
+        changes['statsList'] = hooks.after_get_all_vm_stats(
+            changes['statsList'])
+        changes['status'] = doneCode
+        return changes
+
+    def _getAllVmStats(self):
         vms = self.getVMList()
         statsList = []
         for s in vms['vmList']:
             response = VM(s['vmId']).getStats(runHooks=False)
             if response:
                 statsList.append(response['statsList'][0])
-        statsList = hooks.after_get_all_vm_stats(statsList)
-        return {'status': doneCode, 'statsList': statsList}
+        return statsList
 
     def getStats(self):
         """
@@ -44,6 +44,7 @@ from protocoldetector import MultiProtocolAcceptor
 from virt import migration
 from virt import sampling
 from virt import vm
+from virt import vmstats
 from virt import vmstatus
 from virt.vm import Vm
 from virt.vmchannels import Listener
@@ -90,6 +91,7 @@ class clientIF:
             self.gluster = None
         try:
             self.vmContainer = {}
+            self.vmStatsTracker = vmstats.StatsChangeTracker()
             self._hostStats = sampling.HostStatsThread(log=log)
             self._hostStats.start()
             self.lastRemoteAccess = 0
@@ -190,6 +192,7 @@ class clientIF:
         if config.getboolean('vars', 'jsonrpc_enable'):
             try:
                 from rpc import Bridge
+                from rpc import StatsPublisher
                 from rpc.BindingJsonRpc import BindingJsonRpc
                 from yajsonrpc.stompReactor import StompDetector
             except ImportError:
@@ -197,7 +200,10 @@ class clientIF:
                               'Please make sure it is installed.')
             else:
                 bridge = Bridge.DynamicBridge()
-                json_binding = BindingJsonRpc(bridge)
+                publisher = StatsPublisher.StatsPublisher(
+                    StatsPublisher.defaultTopics(),
+                    config.getint('vars', 'jsonrpc_stats_push_interval'))
+                json_binding = BindingJsonRpc(bridge, publisher)
                 self.bindings['jsonrpc'] = json_binding
                 stomp_detector = StompDetector(json_binding)
                 self._acceptor.add_detector(stomp_detector)
@@ -239,6 +245,7 @@ class clientIF:
             self._enabled = False
             self.channelListener.stop()
             self._hostStats.stop()
+            sampling.stopStatsScheduler()
             if self.mom:
                 self.mom.stop()
             if self.irs:
@@ -39,6 +39,8 @@ Return codes:
 import json
 import os
 import sys
+import traceback
+from StringIO import StringIO
 from xml.dom import minidom
 
 from vdsm.utils import execCmd
@@ -77,3 +79,66 @@ def exit_hook(message, return_code=2):
     """
     sys.stderr.write(message + "\n")
     sys.exit(return_code)
+
+
+def run_persistent(hook):
+    """
+    Run hook, a function without arguments, as a persistent hook.
+
+    vdsm starts a persistent hook once, and calls it for every hook
+    invocation, saving the fork and exec of the script and the python start
+    up on each call. A script opts in by containing the line:
+
+    # vdsm: persistent-hook
+
+    and by running its main function with run_persistent(main). When it is
+    run as a regular hook, hook is simply called once.
+
+    Each call is a json line on stdin, {"env": {name: value, ...}}, holding
+    the variables to add to os.environ during the call, like _hook_domxml or
+    _hook_json. The hook reads and writes its data as usual. The reply is a
+    json line on stdout, {"rc": rc, "err": err}, with the exit code of the
+    hook and what it wrote to stderr.
+    """
+    if os.environ.get('_hook_persistent') != '1':
+        hook()
+        return
+
+    # Keep the replies away from anything written to stdout, including by
+    # child processes.
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        environ = os.environ.copy()
+        for name, value in request['env'].iteritems():
+            os.environ[name.encode('utf-8')] = value.encode('utf-8')
+
+        err = StringIO()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = err
+        try:
+            hook()
+            rc = 0
+        except SystemExit as e:
+            if e.code is None:
+                rc = 0
+            elif isinstance(e.code, int):
+                rc = e.code
+            else:
+                err.write('%s\n' % e.code)
+                rc = 1
+        except Exception:
+            traceback.print_exc(file=err)
+            rc = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            os.environ.clear()
+            os.environ.update(environ)
+
+        errors = err.getvalue()
+        if isinstance(errors, str):
+            errors = errors.decode('utf-8', 'replace')
+        replies.write(json.dumps({'rc': rc, 'err': errors}) + '\n')
+        replies.flush()
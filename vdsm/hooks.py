@@ -19,6 +19,7 @@
 #
 
 from vdsm import utils
+import errno
 import glob
 import hashlib
 import itertools
@@ -26,16 +27,211 @@ import json
 import logging
 import os
 import os.path
+import select
 import sys
 import tempfile
+import threading
+import time
+
+from cpopen import CPopen
 
 from vdsm.constants import P_VDSM_HOOKS, P_VDSM
+import zombiereaper
+
+# A hook script containing this line is run by hooking.run_persistent
+_PERSISTENT_HOOK_MARKER = '# vdsm: persistent-hook'
+# How much of a script is searched for the marker
+_PERSISTENT_HOOK_HEAD = 4096
 
 
 class HookError(Exception):
     pass
 
 
+class PersistentHookError(Exception):
+    pass
+
+
+class _PersistentHook(object):
+    """
+    A hook script loaded once in a long lived process, and called for each
+    hook invocation over its stdin and stdout. This saves the fork and exec
+    of the script, and the python start up, on every call. See
+    hooking.run_persistent for the protocol.
+
+    The process is restarted when the script is modified. Any error stops
+    the process; the caller is expected to run the script the usual way
+    instead.
+    """
+    TIMEOUT = 60
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._proc = None
+        self._mtime = None
+
+    def _start(self, mtime):
+        env = os.environ.copy()
+        env['PYTHONPATH'] = _pythonPath(env)
+        env['_hook_persistent'] = '1'
+        logging.debug('Starting persistent hook %s', self.path)
+        # No deathSignal, the process must outlive the calling thread. It
+        # exits when vdsm closes its stdin.
+        self._proc = CPopen([self.path], close_fds=True, env=env)
+        self._mtime = mtime
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if self._proc is None:
+            return
+        logging.debug('Stopping persistent hook %s (pid=%d)', self.path,
+                      self._proc.pid)
+        try:
+            self._proc.kill()
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                logging.warning('Cannot kill persistent hook %s', self.path,
+                                exc_info=True)
+        zombiereaper.autoReapPID(self._proc.pid)
+        self._proc = None
+
+    def _readReply(self):
+        out = []
+        outFd = self._proc.stdout.fileno()
+        errFd = self._proc.stderr.fileno()
+        poller = select.epoll()
+        poller.register(outFd, select.EPOLLIN | select.EPOLLPRI)
+        poller.register(errFd, select.EPOLLIN | select.EPOLLPRI)
+        deadline = time.time() + self.TIMEOUT
+
+        try:
+            while not out or not out[-1].endswith('\n'):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PersistentHookError('Timeout waiting for hook')
+
+                for fd, event in utils.NoIntrPoll(poller.poll, remaining):
+                    data = os.read(fd, 4096)
+                    if not data:
+                        raise PersistentHookError('Hook terminated')
+                    if fd == outFd:
+                        out.append(data)
+                    else:
+                        # Written outside of a call, e.g. on import
+                        logging.info(data)
+        finally:
+            poller.close()
+
+        reply = json.loads(''.join(out))
+        return reply['rc'], reply['err']
+
+    def call(self, env):
+        """
+        Call the hook with the variables in env added to its environment,
+        returning its exit code and standard error like a regular hook.
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if self._proc is not None and mtime != self._mtime:
+                    self._stop()
+                if self._proc is None:
+                    self._start(mtime)
+                self._proc.stdin.write(json.dumps({'env': env}) + '\n')
+                self._proc.stdin.flush()
+                return self._readReply()
+            except PersistentHookError:
+                self._stop()
+                raise
+            except (IOError, OSError, ValueError, KeyError) as e:
+                self._stop()
+                raise PersistentHookError(str(e))
+
+
+def _isPersistentHook(script):
+    try:
+        with open(script) as f:
+            head = f.read(_PERSISTENT_HOOK_HEAD)
+    except IOError:
+        return False
+    return _PERSISTENT_HOOK_MARKER in head.splitlines()
+
+
+class _HookScripts(object):
+    """
+    Cache the entries of the hook directories, so running the hooks of an
+    empty directory, the common case, costs a single stat.
+
+    A directory is listed again when its mtime changes. Directories modified
+    during the last second are not cached, since file systems with a one
+    second mtime resolution would miss a change in the same second. The
+    executable bit is checked on every call, since changing it does not
+    modify the directory.
+    """
+    RACY_INTERVAL = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # path: (mtime, [entry, ...])
+        self._dirs = {}
+        # script path: _PersistentHook
+        self._persistent = {}
+
+    def scripts(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return []
+
+        removed = []
+        with self._lock:
+            cached = self._dirs.get(path)
+            if cached is not None and cached[0] == mtime:
+                entries = cached[1]
+            else:
+                entries, removed = self._scan(path)
+                if time.time() - mtime > self.RACY_INTERVAL:
+                    self._dirs[path] = (mtime, entries)
+
+        # Stopping waits for a call in progress, do not block other
+        # directories meanwhile.
+        for hook in removed:
+            hook.stop()
+
+        return [s for s in entries if os.access(s, os.X_OK)]
+
+    def persistentHook(self, script):
+        return self._persistent.get(script)
+
+    def _scan(self, path):
+        """
+        Return the entries of path, and the persistent hooks which are not
+        persistent anymore and should be stopped.
+        """
+        entries = sorted(glob.glob(path + '/*'))
+        removed = []
+        for script in entries:
+            persistent = _isPersistentHook(script)
+            if persistent and script not in self._persistent:
+                self._persistent[script] = _PersistentHook(script)
+            elif not persistent and script in self._persistent:
+                removed.append(self._persistent.pop(script))
+
+        for script in self._persistent.keys():
+            if (os.path.dirname(script) == path and
+                    script not in entries):
+                removed.append(self._persistent.pop(script))
+
+        return entries, removed
+
+
+_hookScripts = _HookScripts()
+
+
 # dir path is relative to '/' for test purposes
 # otherwise path is relative to P_VDSM_HOOKS
 def _scriptsPerDir(dir):
@@ -43,18 +239,21 @@ def _scriptsPerDir(dir):
         path = dir
     else:
         path = P_VDSM_HOOKS + dir
-    return [s for s in glob.glob(path + '/*')
-            if os.access(s, os.X_OK)]
+    return _hookScripts.scripts(path.rstrip('/'))
 
 _DOMXML_HOOK = 1
 _JSON_HOOK = 2
 
 
+def _pythonPath(env):
+    ppath = env.get('PYTHONPATH', '')
+    return ':'.join(ppath.split(':') + [P_VDSM])
+
+
 def _runHooksDir(data, dir, vmconf={}, raiseError=True, params={},
                  hookType=_DOMXML_HOOK):
 
     scripts = _scriptsPerDir(dir)
-    scripts.sort()
 
     if not scripts:
         return data
@@ -67,36 +266,52 @@ def _runHooksDir(data, dir, vmconf={}, raiseError=True, params={},
             os.write(data_fd, json.dumps(data))
         os.close(data_fd)
 
-        scriptenv = os.environ.copy()
+        # The variables specific to this call
+        callenv = {}
 
         # Update the environment using params and custom configuration
         env_update = [params.iteritems(),
                       vmconf.get('custom', {}).iteritems()]
 
-        # Encode custom properties to UTF-8 and save them to scriptenv
+        # Encode custom properties to UTF-8 and save them to callenv
         # Pass str objects (byte-strings) without any conversion
         for k, v in itertools.chain(*env_update):
             try:
                 if isinstance(v, unicode):
-                    scriptenv[k] = v.encode('utf-8')
+                    callenv[k] = v.encode('utf-8')
                 else:
-                    scriptenv[k] = v
+                    callenv[k] = v
             except UnicodeDecodeError:
                 pass
 
         if vmconf.get('vmId'):
-            scriptenv['vmId'] = vmconf.get('vmId')
-        ppath = scriptenv.get('PYTHONPATH', '')
-        scriptenv['PYTHONPATH'] = ':'.join(ppath.split(':') + [P_VDSM])
+            callenv['vmId'] = vmconf.get('vmId')
         if hookType == _DOMXML_HOOK:
-            scriptenv['_hook_domxml'] = data_filename
+            callenv['_hook_domxml'] = data_filename
         elif hookType == _JSON_HOOK:
-            scriptenv['_hook_json'] = data_filename
+            callenv['_hook_json'] = data_filename
+
+        # Built only if a script runs as a regular hook
+        scriptenv = None
 
         errorSeen = False
         for s in scripts:
-            rc, out, err = utils.execCmd([s], raw=True,
-                                         env=scriptenv)
+            rc = None
+            persistentHook = _hookScripts.persistentHook(s)
+            if persistentHook is not None:
+                try:
+                    rc, err = persistentHook.call(callenv)
+                except PersistentHookError:
+                    logging.warning('persistent hook %s failed, running it '
+                                    'as a regular hook', s, exc_info=True)
+
+            if rc is None:
+                if scriptenv is None:
+                    scriptenv = os.environ.copy()
+                    scriptenv.update(callenv)
+                    scriptenv['PYTHONPATH'] = _pythonPath(scriptenv)
+                rc, out, err = utils.execCmd([s], raw=True,
+                                             env=scriptenv)
             logging.info(err)
             if rc != 0:
                 errorSeen = True
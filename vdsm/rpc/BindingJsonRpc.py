@@ -16,28 +16,70 @@
 import threading
 import logging
 
+from vdsm.config import config
 from yajsonrpc import JsonRpcServer
+from yajsonrpc.executor import Executor
 from yajsonrpc.stompReactor import StompReactor
 
+# Storage verbs may block for a long time on storage; they are served by
+# their own threads so they cannot starve the other verbs.
+_STORAGE_NAMESPACES = frozenset(('ConnectionRefs', 'ISCSIConnection',
+                                 'Image', 'LVMVolumeGroup', 'StorageDomain',
+                                 'StoragePool', 'StorageServer', 'Volume'))
 
-def _simpleThreadFactory(func):
-    t = threading.Thread(target=func)
-    t.setDaemon(False)
-    t.start()
+_STORAGE_HOST_VERBS = frozenset(('getConnectedStoragePools', 'getDeviceList',
+                                 'getDevicesVisibility', 'getLVMVolumeGroups',
+                                 'getStorageDomains', 'startMonitoringDomain',
+                                 'stopMonitoringDomain'))
+
+
+def _requestQueue(method):
+    namespace, _, verb = method.partition('.')
+    if (namespace in _STORAGE_NAMESPACES or
+            namespace == 'Host' and verb in _STORAGE_HOST_VERBS):
+        return 'storage'
+    return 'default'
 
 
 class BindingJsonRpc(object):
     log = logging.getLogger('BindingJsonRpc')
 
-    def __init__(self, bridge):
-        self._server = JsonRpcServer(bridge, _simpleThreadFactory)
+    def __init__(self, bridge, subscriptionHandler=None):
+        maxQueued = config.getint('vars', 'jsonrpc_max_queued_requests')
+        queues = {
+            'default': (config.getint('vars', 'jsonrpc_workers'), maxQueued),
+            'storage': (config.getint('vars', 'jsonrpc_storage_workers'),
+                        maxQueued),
+        }
+        self._executor = Executor('JsonRpc', queues)
+        self._server = JsonRpcServer(bridge, self._executor, _requestQueue)
+        self._subscriptionHandler = subscriptionHandler
         self._reactors = []
+        self._statsInterval = config.getint(
+            'vars', 'jsonrpc_executor_stats_interval')
+        self._stopEvent = threading.Event()
+
+    @property
+    def executorStats(self):
+        return self._executor.stats()
+
+    def _logExecutorStats(self):
+        while not self._stopEvent.wait(self._statsInterval):
+            for name, stats in sorted(self.executorStats.iteritems()):
+                self.log.debug(
+                    "Queue %(name)s: workers=%(workers)d busy=%(busy)d "
+                    "queued=%(queued)d maxDepth=%(maxDepth)d "
+                    "dispatched=%(dispatched)d rejected=%(rejected)d "
+                    "waitAvg=%(waitAvg).3f waitMax=%(waitMax).3f",
+                    dict(stats, name=name))
 
     def add_socket(self, reactor, client_socket, socket_address):
         reactor.createListener(client_socket, socket_address, self._onAccept)
 
     def _onAccept(self, listener, client):
         client.setMessageHandler(self._server.queueRequest)
+        if self._subscriptionHandler is not None:
+            client.setSubscriptionHandler(self._subscriptionHandler)
 
     def createStompReactor(self):
         reactor = StompReactor()
@@ -46,10 +88,18 @@ class BindingJsonRpc(object):
         return reactor
 
     def start(self):
+        self._executor.start()
+        if self._subscriptionHandler is not None:
+            self._subscriptionHandler.start()
         t = threading.Thread(target=self._server.serve_requests,
                              name='JsonRpcServer')
         t.setDaemon(True)
         t.start()
+        if self._statsInterval > 0:
+            t = threading.Thread(target=self._logExecutorStats,
+                                 name='JsonRpcExecutorStats')
+            t.setDaemon(True)
+            t.start()
 
     def startReactor(self, reactor):
         reactorName = reactor.__class__.__name__
@@ -59,6 +109,10 @@ class BindingJsonRpc(object):
         t.start()
 
     def stop(self):
+        self._stopEvent.set()
         self._server.stop()
+        self._executor.stop()
+        if self._subscriptionHandler is not None:
+            self._subscriptionHandler.stop()
         for reactor in self._reactors:
             reactor.stop()
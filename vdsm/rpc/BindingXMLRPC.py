@@ -462,6 +462,10 @@ class BindingXMLRPC(object):
         api = API.Global()
         return api.getAllVmStats()
 
+    def getChangedVmStats(self, token=None):
+        api = API.Global()
+        return api.getChangedVmStats(token)
+
     def vmMigrationCreate(self, params):
         vm = API.VM(params['vmId'])
         return vm.migrationCreate(params)
@@ -961,6 +965,7 @@ class BindingXMLRPC(object):
                 (self.getStats, 'getVdsStats'),
                 (self.vmGetStats, 'getVmStats'),
                 (self.getAllVmStats, 'getAllVmStats'),
+                (self.getChangedVmStats, 'getChangedVmStats'),
                 (self.vmMigrationCreate, 'migrationCreate'),
                 (self.vmDesktopLogin, 'desktopLogin'),
                 (self.vmDesktopLogoff, 'desktopLogoff'),
@@ -1085,8 +1090,8 @@ def wrapApiMethod(f):
     def wrapper(*args, **kwargs):
         try:
             logLevel = logging.DEBUG
-            if f.__name__ in ('getVMList', 'getAllVmStats', 'getStats',
-                              'fenceNode'):
+            if f.__name__ in ('getVMList', 'getAllVmStats',
+                              'getChangedVmStats', 'getStats', 'fenceNode'):
                 logLevel = logging.TRACE
             displayArgs = args
             if f.__name__ == 'vmDesktopLogin':
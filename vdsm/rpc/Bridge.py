@@ -263,6 +263,15 @@ def Host_getStorageRepoStats_Ret(ret):
     return ret
 
 
+def Host_getChangedVmStats_Ret(ret):
+    """
+    The changes are returned next to the status code, like for
+    Host_getStorageRepoStats.
+    """
+    del ret['status']
+    return ret
+
+
 def Host_getVMList_Call(api, args):
     """
     This call is only interested in returning the VM UUIDs so pass False for
@@ -352,6 +361,7 @@ command_info = {
     'Host_getVMList': {'call': Host_getVMList_Call, 'ret': Host_getVMList_Ret},
     'Host_getVMFullList': {'call': Host_getVMFullList_Call, 'ret': 'vmList'},
     'Host_getAllVmStats': {'ret': 'statsList'},
+    'Host_getChangedVmStats': {'ret': Host_getChangedVmStats_Ret},
     'Host_setupNetworks': {'ret': 'status'},
     'Image_delete': {'ret': 'uuid'},
     'Image_deleteVolumes': {'ret': 'uuid'},
@@ -0,0 +1,233 @@
+# Copyright (C) 2014 Red Hat Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+"""
+Push host and vm statistics to STOMP subscribers
+
+Clients subscribe to a stats topic instead of polling Host.getStats or
+Host.getAllVmStats. Every interval the publisher samples each topic that has
+subscribers and sends them a message with the values that changed since the
+previous message:
+
+    {"full": false,
+     "changed": {key: value, ...},
+     "removed": [key, ...]}
+
+The first message of a subscription is the full sample, with "full": true.
+The vms topic is keyed by vm id; the value of a changed vm holds only its
+changed fields, and "removedFields" maps vm ids to the fields that
+disappeared from their stats.
+
+Each message is serialized once and sent to all the subscribers of the
+topic.
+"""
+
+import json
+import logging
+import threading
+
+from vdsm.utils import traceback
+
+HOST_STATS_TOPIC = "/topic/vdsm/stats/host"
+VM_STATS_TOPIC = "/topic/vdsm/stats/vms"
+
+_MISSING = object()
+
+
+def _diff(old, new):
+    """
+    Return the items of new that differ from old, and the keys of old missing
+    in new.
+    """
+    changed = {}
+    for key, value in new.iteritems():
+        if old.get(key, _MISSING) != value:
+            changed[key] = value
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+
+def hostStatsDelta(old, new):
+    changed, removed = _diff(old, new)
+    if not changed and not removed:
+        return None
+    return {'full': False, 'changed': changed, 'removed': removed}
+
+
+def vmStatsDelta(old, new):
+    changed = {}
+    removedFields = {}
+    for vmId, stats in new.iteritems():
+        oldStats = old.get(vmId)
+        if oldStats is None:
+            changed[vmId] = stats
+            continue
+        vmChanged, vmRemoved = _diff(oldStats, stats)
+        if vmChanged:
+            changed[vmId] = vmChanged
+        if vmRemoved:
+            removedFields[vmId] = vmRemoved
+    removed = [vmId for vmId in old if vmId not in new]
+
+    if not changed and not removed and not removedFields:
+        return None
+    delta = {'full': False, 'changed': changed, 'removed': removed}
+    if removedFields:
+        delta['removedFields'] = removedFields
+    return delta
+
+
+class Topic(object):
+    """
+    A stats topic. sample() returns the current stats as a dict, and
+    delta(old, new) the message describing the changes between two samples,
+    or None if nothing changed.
+    """
+
+    def __init__(self, name, sample, delta):
+        self.name = name
+        self._sample = sample
+        self._delta = delta
+        self._last = None
+        self._lock = threading.Lock()
+        # (server, subid) -> True once the subscriber got a full sample
+        self._subscribers = {}
+
+    def subscribe(self, server, subid):
+        with self._lock:
+            self._subscribers[(server, subid)] = False
+
+    def unsubscribe(self, server, subid):
+        with self._lock:
+            self._subscribers.pop((server, subid), None)
+
+    @property
+    def active(self):
+        return bool(self._subscribers)
+
+    def publish(self):
+        """
+        Send the changes since the previous call to the subscribers, or the
+        full sample to new subscribers. Subscriptions of closed connections
+        are dropped.
+
+        Sampling may be slow, and is done without holding the lock, so
+        subscribing from the reactor thread is never blocked by it.
+        """
+        with self._lock:
+            for key in self._subscribers.keys():
+                if not key[0].connected:
+                    del self._subscribers[key]
+            if not self._subscribers:
+                self._last = None
+                return
+
+        sample = self._sample()
+        deltaMessage = None
+        if self._last is not None:
+            delta = self._delta(self._last, sample)
+            if delta is not None:
+                deltaMessage = json.dumps(delta)
+        self._last = sample
+
+        with self._lock:
+            subscribers = self._subscribers.items()
+            for key, synced in subscribers:
+                self._subscribers[key] = True
+
+        fullMessage = None
+        for (server, subid), synced in subscribers:
+            if synced:
+                if deltaMessage is None:
+                    continue
+                message = deltaMessage
+            else:
+                if fullMessage is None:
+                    fullMessage = json.dumps({'full': True,
+                                              'changed': sample,
+                                              'removed': []})
+                message = fullMessage
+            server.publish(subid, self.name, message)
+
+
+class StatsPublisher(object):
+    """
+    Subscription handler for StompServer (see
+    StompServer.setSubscriptionHandler), publishing a set of Topics every
+    interval seconds.
+    """
+    log = logging.getLogger("rpc.StatsPublisher")
+
+    def __init__(self, topics, interval):
+        self._topics = dict((topic.name, topic) for topic in topics)
+        self._interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def subscribe(self, server, subid, destination):
+        topic = self._topics.get(destination)
+        if topic is None:
+            return False
+
+        self.log.debug("Subscription %s to %s", subid, destination)
+        topic.subscribe(server, subid)
+        # Send the first sample now instead of after an interval
+        self._wakeup.set()
+        return True
+
+    def unsubscribe(self, server, subid):
+        for topic in self._topics.itervalues():
+            topic.unsubscribe(server, subid)
+
+    def start(self):
+        self._stopped = False
+        t = threading.Thread(target=self._run, name="StatsPublisher")
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def publish(self):
+        for topic in self._topics.itervalues():
+            if not topic.active:
+                continue
+            try:
+                topic.publish()
+            except Exception:
+                self.log.exception("Error publishing %s", topic.name)
+
+    @traceback(on=log.name)
+    def _run(self):
+        while not self._stopped:
+            self.publish()
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+
+
+def _hostStats():
+    import API
+    return API.Global().getStats()['info']
+
+
+def _vmStats():
+    import API
+    return dict((stats['vmId'], stats)
+                for stats in API.Global().getAllVmStats()['statsList'])
+
+
+def defaultTopics():
+    return [Topic(HOST_STATS_TOPIC, _hostStats, hostStatsDelta),
+            Topic(VM_STATS_TOPIC, _vmStats, vmStatsDelta)]
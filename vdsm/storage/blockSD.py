@@ -1320,6 +1320,7 @@ class BlockStorageDomain(sd.StorageDomain):
     def refresh(self):
         self.refreshDirTree()
         lvm.invalidateVG(self.sdUUID)
+        blockVolume.invalidateMetadataCache(self.sdUUID)
         self._metadata = selectMetadata(self.sdUUID)
 
     @staticmethod
@@ -66,10 +66,101 @@ SECTORS_TO_MB = 2048
 #  - 2..100  (Unassigned)
 RESERVED_LEASES = 100
 
+# Seconds to keep cached volume metadata slots. Other hosts may modify the
+# metadata, so slots are cached only long enough to serve the bursts of
+# reads of a single flow, like resolving the chain of an image.
+METADATA_CACHE_TTL = 2
+
 log = logging.getLogger('Storage.Volume')
 rmanager = rm.ResourceManager.getInstance()
 
 
+class MetadataCache(object):
+    """
+    Cache of the volume metadata slots of the block domains.
+
+    Slots are read in chunks of CHUNK_SLOTS slots with one direct read of
+    the metadata LV, so reading the metadata of all the volumes of an image
+    usually needs a single read. Writes done on this host update the cached
+    chunks; refreshing the domain or a volume drops the cached chunks of
+    the domain.
+
+    Slots are written by other hosts and reused after a volume is deleted,
+    so flows resolving a chain (Image.getChain, prepareImage) drop the
+    cached chunks of the domain when they start, and do not use metadata
+    cached before.
+    """
+
+    CHUNK_SLOTS = 2048
+
+    def __init__(self, ttl=METADATA_CACHE_TTL, clock=utils.monotonic_time):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # vgName: {chunk index: (expires, bytearray)}
+        self._chunks = {}
+        # vgName: generation, changed on writes and invalidation, so reads
+        # racing with them do not cache stale data.
+        self._generations = {}
+
+    def read(self, vgName, slot):
+        """
+        Return the content of metadata slot of the domain vgName.
+        """
+        index, start = divmod(slot, self.CHUNK_SLOTS)
+        start *= VOLUME_METASIZE
+
+        with self._lock:
+            entry = self._chunks.get(vgName, {}).get(index)
+            if entry is not None and entry[0] > self._clock():
+                return str(entry[1][start:start + VOLUME_METASIZE])
+            generation = self._generations.get(vgName, 0)
+
+        path = lvm.lvPath(vgName, sd.METADATA)
+        size = self.CHUNK_SLOTS * VOLUME_METASIZE
+        data = bytearray(misc.readchunk(path, index * size, size))
+
+        with self._lock:
+            if self._generations.get(vgName, 0) == generation:
+                self._chunks.setdefault(vgName, {})[index] = \
+                    (self._clock() + self._ttl, data)
+
+        if len(data) < start + VOLUME_METASIZE:
+            raise se.MiscBlockReadIncomplete(
+                path, slot * VOLUME_METASIZE, VOLUME_METASIZE)
+
+        return str(data[start:start + VOLUME_METASIZE])
+
+    def write(self, vgName, slot, data):
+        """
+        Update the cached content of slot after writing data to storage.
+        """
+        index, start = divmod(slot, self.CHUNK_SLOTS)
+        start *= VOLUME_METASIZE
+
+        with self._lock:
+            self._generations[vgName] = self._generations.get(vgName, 0) + 1
+            entry = self._chunks.get(vgName, {}).get(index)
+            if entry is not None and len(entry[1]) >= start + len(data):
+                entry[1][start:start + len(data)] = data
+
+    def invalidate(self, vgName):
+        with self._lock:
+            self._generations[vgName] = self._generations.get(vgName, 0) + 1
+            self._chunks.pop(vgName, None)
+
+
+_metadataCache = MetadataCache()
+
+
+def invalidateMetadataCache(vgName):
+    """
+    Drop the cached volume metadata of the domain, after it was modified by
+    another host.
+    """
+    _metadataCache.invalidate(vgName)
+
+
 class BlockVolume(volume.Volume):
     """ Actually represents a single volume (i.e. part of virtual disk).
     """
@@ -90,6 +181,11 @@ class BlockVolume(volume.Volume):
 
     def refreshVolume(self):
         lvm.refreshLVs(self.sdUUID, (self.volUUID,))
+        invalidateMetadataCache(self.sdUUID)
+
+    @classmethod
+    def invalidateMetadataCache(cls, sdUUID):
+        invalidateMetadataCache(sdUUID)
 
     @classmethod
     def halfbakedVolumeRollback(cls, taskObj, sdUUID, volUUID, volPath):
@@ -556,6 +652,8 @@ class BlockVolume(volume.Volume):
             f.seek(offs * VOLUME_METASIZE)
             f.write(data)
 
+        _metadataCache.write(vgname, offs, data)
+
     @classmethod
     def createMetadata(cls, metaId, meta):
         cls.__putMetadata(metaId, meta)
@@ -590,8 +688,7 @@ class BlockVolume(volume.Volume):
         vgname, offs = metaId
 
         try:
-            meta = misc.readblock(lvm.lvPath(vgname, sd.METADATA),
-                                  offs * VOLUME_METASIZE, VOLUME_METASIZE)
+            meta = _metadataCache.read(vgname, offs).splitlines()
             out = {}
             for l in meta:
                 if l.startswith("EOF"):
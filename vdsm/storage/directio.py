@@ -0,0 +1,200 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+In-process direct I/O
+
+Reads and writes files and block devices with O_DIRECT, bypassing the page
+cache, without forking dd. O_DIRECT requires the buffer, the offset and the
+size of each operation to be aligned to the logical block size of the
+device; buffers are anonymous mmaps, which are always page aligned.
+"""
+
+import errno
+import io
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+
+BLOCK_SIZE = 512
+
+# Free buffers of each size kept by the buffer pool
+MAX_FREE_BUFFERS = 4
+
+
+def _checkAligned(name, value):
+    if value % BLOCK_SIZE:
+        raise ValueError("%s %d is not aligned to %d bytes" %
+                         (name, value, BLOCK_SIZE))
+
+
+class BufferPool(object):
+    """
+    Aligned buffers shared by the reads of all the files, so reads do not
+    allocate and map a new buffer each time.
+    """
+
+    def __init__(self, maxFree=MAX_FREE_BUFFERS):
+        self._maxFree = maxFree
+        self._lock = threading.Lock()
+        # size: [buffer, ...]
+        self._free = {}
+
+    @contextmanager
+    def buffer(self, size):
+        with self._lock:
+            free = self._free.get(size)
+            buf = free.pop() if free else None
+        if buf is None:
+            buf = mmap.mmap(-1, size)
+        try:
+            yield buf
+        finally:
+            with self._lock:
+                free = self._free.setdefault(size, [])
+                if len(free) < self._maxFree:
+                    free.append(buf)
+                    buf = None
+            if buf is not None:
+                buf.close()
+
+
+_bufferPool = BufferPool()
+
+
+def read(path, offset, size):
+    """
+    Read size bytes at offset of path, returning a string. The string is
+    shorter than size only if the end of the file was reached.
+    """
+    _checkAligned("offset", offset)
+    _checkAligned("size", size)
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    with io.FileIO(fd, "rb", closefd=True) as f:
+        with _bufferPool.buffer(size) as buf:
+            f.seek(offset)
+            n = f.readinto(buf)
+            return buf[:n]
+
+
+class DirectFile(object):
+    """
+    A file opened with O_DIRECT, read and written at aligned offsets through
+    a reusable aligned buffer.
+
+    The file is opened on the first operation and closed when an operation
+    fails, so the next operation reopens it; this handles devices that are
+    removed and recreated (e.g. LVs deactivated and activated again) while
+    the file is in use.
+    """
+
+    def __init__(self, path, mode="r"):
+        if mode not in ("r", "r+"):
+            raise ValueError("Invalid mode %r" % mode)
+        self._path = path
+        self._mode = mode
+        self._file = None
+        self._buf = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._path
+
+    def read(self, offset, size):
+        """
+        Read size bytes at offset, returning a string. The string is shorter
+        than size only if the end of the file was reached.
+        """
+        _checkAligned("offset", offset)
+        _checkAligned("size", size)
+        with self._lock:
+            f = self._open()
+            buf = self._buffer(size)
+            try:
+                f.seek(offset)
+                n = f.readinto(buf)
+            except:
+                self._close()
+                raise
+            return buf[:n]
+
+    def write(self, offset, data):
+        """
+        Write data (a string or a bytearray) at offset. The length of data
+        must be aligned.
+        """
+        if self._mode != "r+":
+            raise IOError(errno.EBADF, "%s is not open for writing" %
+                          self._path)
+        _checkAligned("offset", offset)
+        _checkAligned("size", len(data))
+        with self._lock:
+            f = self._open()
+            buf = self._buffer(len(data))
+            buf[:] = str(data)
+            try:
+                f.seek(offset)
+                n = f.write(buf)
+            except:
+                self._close()
+                raise
+            if n != len(data):
+                self._close()
+                raise IOError(errno.EIO, "Short write to %s: %d of %d bytes" %
+                              (self._path, n, len(data)))
+
+    def close(self):
+        with self._lock:
+            self._close()
+            if self._buf is not None:
+                self._buf.close()
+                self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
+
+    def _open(self):
+        if self._file is None:
+            flags = os.O_DIRECT
+            flags |= os.O_RDWR if self._mode == "r+" else os.O_RDONLY
+            fd = os.open(self._path, flags)
+            self._file = io.FileIO(fd, self._mode + "b", closefd=True)
+        return self._file
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+
+    def _buffer(self, size):
+        # The mailboxes always use the same sizes, so a single buffer is
+        # reused as long as the size does not change.
+        if self._buf is None or len(self._buf) != size:
+            if self._buf is not None:
+                self._buf.close()
+            self._buf = mmap.mmap(-1, size)
+        return self._buf
@@ -20,14 +20,23 @@
 
 from threading import Thread, Event
 from time import time
+import heapq
+import logging
+import Queue
+import random
+import threading
 import weakref
 
-import logging
 import misc
+import storage_exception as se
 from vdsm import utils
 from vdsm.config import config
 from sdc import sdCache
 
+# Upper bounds (seconds) of the buckets of the check latency histograms. The
+# last bucket counts the checks slower than the last bound.
+LATENCY_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30)
+
 
 class DomainMonitorStatus(object):
     __slots__ = (
@@ -72,6 +81,204 @@ class DomainMonitorStatus(object):
         return res
 
 
+class LatencyHistogram(object):
+    __slots__ = ("counts", "count", "total", "max", "last")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def info(self):
+        return {
+            'bounds': list(LATENCY_BUCKETS),
+            'buckets': list(self.counts),
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'last': self.last,
+        }
+
+
+class MonitorScheduler(object):
+    """
+    Runs the checks of all the monitored domains on a pool of worker
+    threads, instead of a thread per domain.
+
+    Each domain is checked every interval seconds. A new domain is checked
+    immediately, and its second check is after a random part of the
+    interval, so the checks of many domains are spread over the interval
+    instead of running together.
+    A domain is never checked concurrently with itself; when its check is
+    still running at the next deadline, the deadline is skipped, and a
+    check running more than hungTimeout seconds is reported as hung. If all
+    the workers are busy and one of them is blocked, new workers are
+    started, up to maxWorkers, so hung domains do not delay the others.
+    """
+
+    _log = logging.getLogger("Storage.MonitorScheduler")
+
+    def __init__(self, workers, maxWorkers, hungTimeout):
+        self._minWorkers = workers
+        self._maxWorkers = max(workers, maxWorkers)
+        self._hungTimeout = hungTimeout
+        self._queue = Queue.Queue()
+        self._cond = threading.Condition(threading.Lock())
+        self._stopped = False
+        # (deadline, seq, monitor, first)
+        self._heap = []
+        self._seq = 0
+        self._workers = 0
+        # Start time of the check run by each busy worker
+        self._busy = {}
+        # Monitors with a queued or running check
+        self._running = set()
+
+    def start(self):
+        self._log.debug("Starting domain monitor scheduler")
+        with self._cond:
+            for i in range(self._minWorkers):
+                self._startWorker()
+        t = Thread(target=self._run, name="domain-monitor")
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        self._log.debug("Stopping domain monitor scheduler")
+        with self._cond:
+            self._stopped = True
+            workers = self._workers
+            self._cond.notify()
+        for i in range(workers):
+            self._queue.put(None)
+
+    def add(self, monitor):
+        """
+        Schedule monitor, checking it immediately.
+        """
+        with self._cond:
+            self._schedule(time(), monitor, first=True)
+            self._cond.notify()
+
+    def _schedule(self, deadline, monitor, first=False):
+        # Called with the lock held
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, monitor, first))
+
+    def _startWorker(self):
+        # Called with the lock held
+        self._workers += 1
+        t = Thread(target=self._work,
+                   name="domain-monitor-%d" % self._workers)
+        t.setDaemon(True)
+        t.start()
+
+    @utils.traceback(on=_log.name)
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                for deadline, seq, monitor, first in due:
+                    self._dispatch(deadline, monitor, now, first)
+                self._checkWorkers(now)
+                # Wake up at least every second to detect hung checks
+                timeout = 1.0
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                self._cond.wait(max(0, timeout))
+
+            self._checkHung(time())
+
+    def _dispatch(self, deadline, monitor, now, first):
+        # Called with the lock held
+        if monitor.stopped:
+            return
+
+        if first:
+            # Spread the next checks of new domains over the interval
+            nextDeadline = now + random.uniform(0, monitor.interval)
+        else:
+            nextDeadline = deadline + monitor.interval
+        if nextDeadline <= now:
+            # We are late, do not run the missed checks in a burst
+            nextDeadline = now + monitor.interval
+        self._schedule(nextDeadline, monitor)
+
+        if monitor in self._running:
+            monitor.missedDeadline(now)
+            return
+
+        self._running.add(monitor)
+        self._queue.put(monitor)
+
+    def _checkWorkers(self, now):
+        # Called with the lock held
+        if self._queue.empty() or len(self._busy) < self._workers:
+            return
+        if self._workers >= self._maxWorkers:
+            return
+        if any(now - start > self._hungTimeout
+               for start in self._busy.itervalues()):
+            self._log.debug("Workers are blocked, adding a worker")
+            self._startWorker()
+
+    def _checkHung(self, now):
+        with self._cond:
+            running = list(self._running)
+        for monitor in running:
+            runStart = monitor.runStart
+            if runStart is not None and now - runStart > self._hungTimeout:
+                monitor.checkHung(now)
+
+    def _work(self):
+        me = threading.current_thread()
+        while True:
+            monitor = self._queue.get()
+            if monitor is None:
+                return
+
+            with self._cond:
+                # Time waiting in the queue behind busy workers does not
+                # count as hung
+                start = time()
+                self._busy[me] = start
+                monitor.runStart = start
+            try:
+                monitor.run()
+            except Exception:
+                self._log.error("Domain monitor failed", exc_info=True)
+            finally:
+                with self._cond:
+                    del self._busy[me]
+                    self._running.discard(monitor)
+                    monitor.runStart = None
+                    # Extra workers added for hung checks exit when they
+                    # are no longer needed.
+                    if (self._workers > self._minWorkers and
+                            self._queue.empty()):
+                        self._workers -= 1
+                        return
+
+
 class DomainMonitor(object):
     log = logging.getLogger('Storage.DomainMonitor')
 
@@ -80,6 +287,11 @@ class DomainMonitor(object):
         self._interval = interval
         self.onDomainStateChange = misc.Event(
             "Storage.DomainMonitor.onDomainStateChange")
+        self._scheduler = MonitorScheduler(
+            config.getint('irs', 'sd_health_check_workers'),
+            config.getint('irs', 'sd_health_check_max_workers'),
+            config.getint('irs', 'sd_health_check_timeout'))
+        self._scheduler.start()
 
     @property
     def monitoredDomains(self):
@@ -90,23 +302,23 @@ class DomainMonitor(object):
         return [k for k, v in self._domains.iteritems() if v.poolDomain]
 
     def startMonitoring(self, sdUUID, hostId, poolDomain=True):
-        domainThread = self._domains.get(sdUUID)
+        domainMonitor = self._domains.get(sdUUID)
 
-        if domainThread is not None:
-            domainThread.poolDomain |= poolDomain
+        if domainMonitor is not None:
+            domainMonitor.poolDomain |= poolDomain
             return
 
         self.log.info("Start monitoring %s", sdUUID)
-        domainThread = DomainMonitorThread(weakref.proxy(self),
-                                           sdUUID, hostId, self._interval)
-        domainThread.poolDomain = poolDomain
-        domainThread.start()
+        domainMonitor = DomainMonitorJob(weakref.proxy(self),
+                                         sdUUID, hostId, self._interval)
+        domainMonitor.poolDomain = poolDomain
+        self._scheduler.add(domainMonitor)
         # The domain should be added only after it succesfully started
-        self._domains[sdUUID] = domainThread
+        self._domains[sdUUID] = domainMonitor
 
     def stopMonitoring(self, sdUUID):
         # The domain monitor issues events that might become raceful if
-        # stopMonitoring doesn't stop until the thread exits.
+        # stopMonitoring doesn't stop until the running check exits.
         # Eg: when a domain is detached the domain monitor is stopped and
         # the host id is released. If the monitor didn't actually exit it
         # might respawn a new acquire host id.
@@ -121,19 +333,23 @@ class DomainMonitor(object):
     def getStatus(self, sdUUID):
         return self._domains[sdUUID].getStatus()
 
+    def getCheckStats(self, sdUUID):
+        return self._domains[sdUUID].getCheckStats()
+
     def close(self):
         self.log.info("Stopping domain monitors")
         for sdUUID in self._domains.keys():
             self.stopMonitoring(sdUUID)
+        self._scheduler.stop()
 
 
-class DomainMonitorThread(object):
-    log = logging.getLogger('Storage.DomainMonitorThread')
+class DomainMonitorJob(object):
+    """
+    Monitors a domain. Checks are run by the MonitorScheduler.
+    """
+    log = logging.getLogger('Storage.DomainMonitorJob')
 
     def __init__(self, domainMonitor, sdUUID, hostId, interval):
-        self.thread = Thread(target=self._monitorLoop)
-        self.thread.setDaemon(True)
-
         self.domainMonitor = domainMonitor
         self.stopEvent = Event()
         self.domain = None
@@ -148,32 +364,72 @@ class DomainMonitorThread(object):
         self.lastRefresh = time()
         self.refreshTime = \
             config.getint("irs", "repo_stats_cache_refresh_timeout")
+        # Set by the scheduler while a check is running
+        self.runStart = None
+        self.currentCheck = None
+        self.hung = False
+        self.missed = 0
+        self._statusLock = threading.Lock()
+        self._idle = Event()
+        self._idle.set()
+        self._checkStats = {}
 
-    def start(self):
-        self.thread.start()
+    @property
+    def stopped(self):
+        return self.stopEvent.is_set()
 
     def stop(self, wait=True):
         self.stopEvent.set()
         if wait:
-            self.thread.join()
+            self._idle.wait()
+            self._releaseHostId()
 
     def getStatus(self):
-        return self.status.copy()
+        with self._statusLock:
+            return self.status.copy()
 
-    @utils.traceback(on=log.name)
-    def _monitorLoop(self):
-        self.log.debug("Starting domain monitor for %s", self.sdUUID)
+    def getCheckStats(self):
+        with self._statusLock:
+            return dict((name, hist.info())
+                        for name, hist in self._checkStats.iteritems())
 
-        while not self.stopEvent.is_set():
-            try:
+    def run(self):
+        self._idle.clear()
+        try:
+            if not self.stopped:
                 self._monitorDomain()
-            except:
-                self.log.error("The domain monitor for %s failed unexpectedly",
-                               self.sdUUID, exc_info=True)
-            self.stopEvent.wait(self.interval)
-
-        self.log.debug("Stopping domain monitor for %s", self.sdUUID)
-
+        except:
+            self.log.error("The domain monitor for %s failed unexpectedly",
+                           self.sdUUID, exc_info=True)
+        finally:
+            self._idle.set()
+
+    def missedDeadline(self, now):
+        self.missed += 1
+        self.log.debug("Check %s of domain %s is still running, skipping "
+                       "deadline (missed %d)", self.currentCheck,
+                       self.sdUUID, self.missed)
+
+    def checkHung(self, now):
+        """
+        Called by the scheduler when the running check takes too long. The
+        check cannot be interrupted, but the domain is reported as invalid
+        until it returns.
+        """
+        with self._statusLock:
+            if self.hung or self.runStart is None:
+                return
+            self.hung = True
+            hungStatus = self.status.copy()
+            hungStatus.error = se.StorageDomainAccessError(
+                "%s check %s blocked for %d seconds" %
+                (self.sdUUID, self.currentCheck, now - self.runStart))
+            hungStatus.valid = False
+        self.log.error("Domain %s check %s is blocked for %d seconds",
+                       self.sdUUID, self.currentCheck, now - self.runStart)
+        self._updateStatus(hungStatus)
+
+    def _releaseHostId(self):
         # If this is an ISO domain we didn't acquire the host id and releasing
         # it is superfluous.
         if self.domain and not self.isIsoDomain:
@@ -183,6 +439,20 @@ class DomainMonitorThread(object):
                 self.log.debug("Unable to release the host id %s for domain "
                                "%s", self.hostId, self.sdUUID, exc_info=True)
 
+    def _check(self, name, func, *args):
+        self.currentCheck = name
+        start = utils.monotonic_time()
+        try:
+            return func(*args)
+        finally:
+            elapsed = utils.monotonic_time() - start
+            with self._statusLock:
+                hist = self._checkStats.get(name)
+                if hist is None:
+                    hist = self._checkStats[name] = LatencyHistogram()
+                hist.add(elapsed)
+            self.currentCheck = None
+
     def _monitorDomain(self):
         self.nextStatus.clear()
 
@@ -194,14 +464,15 @@ class DomainMonitorThread(object):
             self.lastRefresh = time()
 
         try:
-            # We should produce the domain inside the monitoring loop because
-            # it might take some time and we don't want to slow down the thread
-            # start (and anything else that relies on that as for example
-            # updateMonitoringThreads). It also needs to be inside the loop
-            # since it might fail and we want keep trying until we succeed or
-            # the domain is deactivated.
+            # We should produce the domain inside the monitoring check because
+            # it might take some time and we don't want to slow down
+            # startMonitoring (and anything else that relies on that as for
+            # example updateMonitoringThreads). It also needs to be inside the
+            # check since it might fail and we want keep trying until we
+            # succeed or the domain is deactivated.
             if self.domain is None:
-                self.domain = sdCache.produce(self.sdUUID)
+                self.domain = self._check("produce", sdCache.produce,
+                                          self.sdUUID)
 
             if self.isIsoDomain is None:
                 # The isIsoDomain assignment is delayed because the isoPrefix
@@ -212,11 +483,12 @@ class DomainMonitorThread(object):
                     self.isoPrefix = self.domain.getIsoDomainImagesDir()
                 self.isIsoDomain = isIsoDomain
 
-            self.domain.selftest()
+            self._check("selftest", self.domain.selftest)
 
-            self.nextStatus.readDelay = self.domain.getReadDelay()
+            self.nextStatus.readDelay = self._check("readDelay",
+                                                    self.domain.getReadDelay)
 
-            stats = self.domain.getStats()
+            stats = self._check("stats", self.domain.getStats)
             self.nextStatus.diskUtilization = (stats["disktotal"],
                                                stats["diskfree"])
 
@@ -226,11 +498,14 @@ class DomainMonitorThread(object):
             self.nextStatus.vgMdHasEnoughFreeSpace = stats["mdavalid"]
             self.nextStatus.vgMdFreeBelowThreashold = stats["mdathreshold"]
 
-            masterStats = self.domain.validateMaster()
+            masterStats = self._check("validateMaster",
+                                      self.domain.validateMaster)
             self.nextStatus.masterValid = masterStats['valid']
             self.nextStatus.masterMounted = masterStats['mount']
 
-            self.nextStatus.hasHostId = self.domain.hasHostId(self.hostId)
+            self.nextStatus.hasHostId = self._check("hasHostId",
+                                                    self.domain.hasHostId,
+                                                    self.hostId)
             self.nextStatus.isoPrefix = self.isoPrefix
             self.nextStatus.version = self.domain.getVersion()
 
@@ -242,18 +517,12 @@ class DomainMonitorThread(object):
         self.nextStatus.checkTime = time()
         self.nextStatus.valid = (self.nextStatus.error is None)
 
-        if self._statusDidChange():
-            self.log.debug("Domain %s changed its status to %s", self.sdUUID,
-                           "Valid" if self.nextStatus.valid else "Invalid")
+        if self.hung:
+            self.log.info("Domain %s check returned after being blocked",
+                          self.sdUUID)
+            self.hung = False
 
-            try:
-                self.domainMonitor.onDomainStateChange.emit(
-                    self.sdUUID, self.nextStatus.valid)
-            except:
-                self.log.warn("Could not emit domain state change event",
-                              exc_info=True)
-
-        self.firstChange = False
+        self._updateStatus(self.nextStatus)
 
         # An ISO domain can be shared by multiple pools
         if (not self.isIsoDomain and self.nextStatus.valid
@@ -265,7 +534,19 @@ class DomainMonitorThread(object):
                                "request for domain %s", self.hostId,
                                self.sdUUID, exc_info=True)
 
-        self.status.update(self.nextStatus)
+    def _updateStatus(self, nextStatus):
+        with self._statusLock:
+            changed = self.firstChange or self.status.valid != nextStatus.valid
+            self.firstChange = False
+            self.status.update(nextStatus)
+
+        if changed:
+            self.log.debug("Domain %s changed its status to %s", self.sdUUID,
+                           "Valid" if nextStatus.valid else "Invalid")
 
-    def _statusDidChange(self):
-        return self.firstChange or self.status.valid != self.nextStatus.valid
+            try:
+                self.domainMonitor.onDomainStateChange.emit(
+                    self.sdUUID, nextStatus.valid)
+            except:
+                self.log.warn("Could not emit domain state change event",
+                              exc_info=True)
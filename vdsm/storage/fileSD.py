@@ -24,6 +24,7 @@ import logging
 import glob
 import fnmatch
 import re
+import time
 
 import sd
 import storage_exception as se
@@ -34,7 +35,7 @@ import outOfProcess as oop
 from remoteFileHandler import Timeout
 from persistentDict import PersistentDict, DictValidator
 from vdsm import constants
-from vdsm.utils import stripNewLines
+from vdsm.utils import monotonic_time, stripNewLines
 import supervdsm
 import mount
 
@@ -57,6 +58,13 @@ FILE_SPECIAL_VOLUME_SIZES_MIB.update({
 # Specific stat(2) block size as defined in the man page
 ST_BYTES_PER_BLOCK = 512
 
+# Seconds to reuse a file listing of getFileList
+FILE_LIST_CACHE_TTL = 60
+# Listings of directories modified this many seconds before the walk are
+# not reused, file systems with one second mtime resolution would miss a
+# change in the same second.
+FILE_LIST_RACY_INTERVAL = 1
+
 getProcPool = oop.getGlobalProcPool
 
 
@@ -142,6 +150,34 @@ FileSDMetadata = lambda metafile: DictValidator(
     PersistentDict(FileMetadataRW(metafile)), FILE_SD_MD_FIELDS)
 
 
+class ImageIndex(object):
+    """
+    The images and volumes of a file domain, built from the entries of the
+    images directory and the paths of the volume metadata files.
+
+    volumes maps each image to the list of its volumes, removed lists the
+    directories of removed images, and others the entries of the images
+    directory that have no volumes.
+    """
+
+    def __init__(self, entries, metaPaths):
+        self.volumes = {}
+        for metaPath in metaPaths:
+            head, tail = os.path.split(metaPath)
+            volUUID = os.path.splitext(tail)[0]
+            imgUUID = os.path.basename(head)
+            self.volumes.setdefault(imgUUID, []).append(volUUID)
+
+        self.removed = []
+        self.others = []
+        for entry in entries:
+            name = os.path.basename(entry)
+            if name.startswith(sd.REMOVED_IMAGE_PREFIX):
+                self.removed.append(name)
+            elif name not in self.volumes:
+                self.others.append(name)
+
+
 class FileStorageDomain(sd.StorageDomain):
     def __init__(self, domainPath):
         # Using glob might look like the simplest thing to do but it isn't
@@ -156,6 +192,9 @@ class FileStorageDomain(sd.StorageDomain):
         sdUUID = os.path.basename(domainPath)
         validateFileSystemFeatures(sdUUID, self.mountpoint)
 
+        # (created, basedir, dirs, files) of the last getFileList walk
+        self._fileList = None
+
         metadata = FileSDMetadata(self.metafile)
         domaindir = os.path.join(self.mountpoint, sdUUID)
         sd.StorageDomain.__init__(self, sdUUID, domaindir, metadata)
@@ -265,35 +304,60 @@ class FileStorageDomain(sd.StorageDomain):
         extension.
         """
         basedir = self.getIsoDomainImagesDir()
-        filesList = self.oop.simpleWalk(basedir)
+        files = self._walkFiles(basedir)
 
         if pattern != '*':
             if caseSensitive:
-                filesList = fnmatch.filter(filesList, pattern)
+                match = lambda path: fnmatch.fnmatchcase(path, pattern)
             else:
-                regex = fnmatch.translate(pattern)
-                reobj = re.compile(regex, re.IGNORECASE)
-                filesList = [f for f in filesList if reobj.match(f)]
+                match = re.compile(fnmatch.translate(pattern),
+                                   re.IGNORECASE).match
+            files = [entry for entry in files if match(entry[0])]
 
         filesDict = {}
         filePrefixLen = len(basedir) + 1
-        for entry in filesList:
-            st = self.oop.os.stat(entry)
-            stats = {'size': str(st.st_size), 'ctime': str(st.st_ctime)}
-
-            try:
-                self.oop.fileUtils.validateQemuReadable(entry)
-                stats['status'] = 0  # Status OK
-            except OSError as e:
-                if e.errno != errno.EACCES:
-                    raise
-
-                stats['status'] = se.StorageServerAccessPermissionError.code
-
-            fileName = entry[filePrefixLen:]
-            filesDict[fileName] = stats
+        for path, size, ctime, readable in files:
+            if readable:
+                status = 0  # Status OK
+            else:
+                status = se.StorageServerAccessPermissionError.code
+            filesDict[path[filePrefixLen:]] = {'size': str(size),
+                                               'ctime': str(ctime),
+                                               'status': status}
         return filesDict
 
+    def _walkFiles(self, basedir):
+        """
+        Return the statWalk files of basedir, reusing the previous listing
+        if no directory under basedir was modified since.
+
+        Directory mtimes do not change when a file is modified in place or
+        when its permissions change, so the listing is also dropped after
+        FILE_LIST_CACHE_TTL seconds. A listing is not kept if a directory
+        was modified within FILE_LIST_RACY_INTERVAL seconds of the walk.
+        """
+        cached = self._fileList
+        if (cached is not None and cached[1] == basedir and
+                monotonic_time() - cached[0] < FILE_LIST_CACHE_TTL):
+            created, top, dirs, files = cached
+            results = self.oop.multiCall([("os.stat", (path,))
+                                          for path, mtime in dirs])
+            for (path, mtime), (st, err) in zip(dirs, results):
+                if err is not None or st.st_mtime != mtime:
+                    break
+            else:
+                return files
+
+        created = monotonic_time()
+        walkTime = time.time()
+        dirs, files = self.oop.statWalk(basedir)
+        if all(walkTime - mtime > FILE_LIST_RACY_INTERVAL
+               for path, mtime in dirs):
+            self._fileList = (created, basedir, dirs, files)
+        else:
+            self._fileList = None
+        return files
+
     def getVolumeClass(self):
         """
         Return a type specific volume generator object
@@ -344,21 +408,41 @@ class FileStorageDomain(sd.StorageDomain):
     def validateMasterMount(self):
         return self.oop.fileUtils.pathExists(self.getMasterDir())
 
+    def getImageIndex(self, volumes=True):
+        """
+        Return the ImageIndex of the domain, walking the images directory
+        in a single round trip. If volumes is False, only the entries of
+        the images directory are listed, and the index has no volumes.
+        """
+        imagesDir = os.path.join(self.mountpoint, self.sdUUID,
+                                 sd.DOMAIN_IMAGES)
+        calls = [("glob.glob", (os.path.join(imagesDir, "*"),))]
+        if volumes:
+            calls.append(
+                ("glob.glob", (os.path.join(imagesDir, "*", "*.meta"),)))
+        results = oop.multiCallResults(self.oop.multiCall(calls))
+        entries = results[0]
+        metaPaths = results[1] if volumes else ()
+        return ImageIndex(entries, metaPaths)
+
     def getAllImages(self):
         """
         Fetch the set of the Image UUIDs in the SD.
         """
-        # Get Volumes of an image
-        pattern = os.path.join(self.storage_repository,
-                               # ISO domains don't have images,
-                               # we can assume single domain
-                               self.getPools()[0],
-                               self.sdUUID, sd.DOMAIN_IMAGES)
-        pattern = os.path.join(pattern, constants.UUID_GLOB_PATTERN)
-        files = self.oop.glob.glob(pattern)
-        images = set()
-        for i in files:
-            if self.oop.os.path.isdir(i):
+        index = self.getImageIndex()
+        images = set(imgUUID for imgUUID in index.volumes
+                     if fnmatch.fnmatch(imgUUID, constants.UUID_GLOB_PATTERN))
+        # Entries without volumes may be empty image directories
+        imagesDir = os.path.join(self.mountpoint, self.sdUUID,
+                                 sd.DOMAIN_IMAGES)
+        candidates = [os.path.join(imagesDir, name)
+                      for name in index.removed + index.others
+                      if name not in images and
+                      fnmatch.fnmatch(name, constants.UUID_GLOB_PATTERN)]
+        isDir = oop.multiCallResults(
+            self.oop.multiCall([("os.path.isdir", (i,)) for i in candidates]))
+        for i, d in zip(candidates, isDir):
+            if d:
                 images.add(os.path.basename(i))
         return images
 
@@ -418,36 +502,31 @@ class FileStorageDomain(sd.StorageDomain):
         metadata.
         Setting parent = None for compatibility with block version.
         """
-        volMetaPattern = os.path.join(self.mountpoint, self.sdUUID,
-                                      sd.DOMAIN_IMAGES, "*", "*.meta")
-        volMetaPaths = self.oop.glob.glob(volMetaPattern)
+        index = self.getImageIndex()
         volumes = {}
-        for metaPath in volMetaPaths:
-            head, tail = os.path.split(metaPath)
-            volUUID, volExt = os.path.splitext(tail)
-            imgUUID = os.path.basename(head)
-            if volUUID in volumes:
-                # Templates have no parents
-                volumes[volUUID]['parent'] = sd.BLANK_UUID
-                # Template volumes are hard linked in every image directory
-                # which is derived from that template, therefore:
-                # 1. a template volume which is in use will appear at least
-                # twice (in the template image dir and in the derived image
-                # dir)
-                # 2. Any volume which appears more than once in the dir tree is
-                # by definition a template volume.
-                # 3. Any image which has more than 1 volume is not a template
-                # image. Therefore if imgUUID appears in more than one path
-                # then it is not a template.
-                if len(tuple(vPath for vPath in volMetaPaths
-                             if imgUUID in vPath)) > 1:
-                    # Add template additonal image
-                    volumes[volUUID]['imgs'].append(imgUUID)
+        for imgUUID, volUUIDs in index.volumes.iteritems():
+            for volUUID in volUUIDs:
+                if volUUID in volumes:
+                    # Templates have no parents
+                    volumes[volUUID]['parent'] = sd.BLANK_UUID
+                    # Template volumes are hard linked in every image
+                    # directory which is derived from that template,
+                    # therefore:
+                    # 1. a template volume which is in use will appear at
+                    # least twice (in the template image dir and in the
+                    # derived image dir)
+                    # 2. Any volume which appears more than once in the dir
+                    # tree is by definition a template volume.
+                    # 3. Any image which has more than 1 volume is not a
+                    # template image.
+                    if len(volUUIDs) > 1:
+                        # Add template additonal image
+                        volumes[volUUID]['imgs'].append(imgUUID)
+                    else:
+                        # Insert at head the template self image
+                        volumes[volUUID]['imgs'].insert(0, imgUUID)
                 else:
-                    # Insert at head the template self image
-                    volumes[volUUID]['imgs'].insert(0, imgUUID)
-            else:
-                volumes[volUUID] = {'imgs': [imgUUID], 'parent': None}
+                    volumes[volUUID] = {'imgs': [imgUUID], 'parent': None}
         return dict((k, sd.ImgsPar(tuple(v['imgs']), v['parent']))
                     for k, v in volumes.iteritems())
 
@@ -601,9 +680,9 @@ class FileStorageDomain(sd.StorageDomain):
         remove the remnants of the removed images (they could be left sometimes
         (on NFS mostly) due to lazy file removal
         """
-        removedPattern = os.path.join(self.domaindir, sd.DOMAIN_IMAGES,
-                                      sd.REMOVED_IMAGE_PREFIX + '*')
-        removedImages = self.oop.glob.glob(removedPattern)
+        imagesDir = os.path.join(self.domaindir, sd.DOMAIN_IMAGES)
+        removedImages = [os.path.join(imagesDir, name)
+                         for name in self.getImageIndex(volumes=False).removed]
         self.log.debug("Removing remnants of deleted images %s" %
                        removedImages)
         for imageDir in removedImages:
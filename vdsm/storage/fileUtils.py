@@ -85,15 +85,25 @@ def validateAccess(targetPath, perms=(os.R_OK | os.W_OK | os.X_OK)):
         raise OSError(errno.EACCES, os.strerror(errno.EACCES))
 
 
+def qemuGids():
+    return (grp.getgrnam(constants.DISKIMAGE_GROUP).gr_gid,
+            grp.getgrnam(constants.METADATA_GROUP).gr_gid)
+
+
+def isQemuReadable(st, gids):
+    """
+    Return True if qemu process can read a file with stat result st
+    """
+    return bool(st.st_gid in gids and st.st_mode & stat.S_IRGRP or
+                st.st_mode & stat.S_IROTH)
+
+
 def validateQemuReadable(targetPath):
     """
     Validate that qemu process can read file
     """
-    gids = (grp.getgrnam(constants.DISKIMAGE_GROUP).gr_gid,
-            grp.getgrnam(constants.METADATA_GROUP).gr_gid)
     st = os.stat(targetPath)
-    if not (st.st_gid in gids and st.st_mode & stat.S_IRGRP or
-            st.st_mode & stat.S_IROTH):
+    if not isQemuReadable(st, qemuGids()):
         raise OSError(errno.EACCES, os.strerror(errno.EACCES))
 
 
@@ -476,19 +476,66 @@ class FileVolume(volume.Volume):
         self.volUUID = newUUID
         self.volumePath = volPath
 
+    def validate(self):
+        """
+        Validate that the volume can be accessed.
+
+        Does the checks of validateImagePath and validateVolumePath in a
+        single call to the out of process helper.
+        """
+        checkMeta = not sdCache.produce(self.sdUUID).isISO()
+        self._validatePaths(imagePath=True, volumePath=True,
+                            metaPath=checkMeta)
+
+    def _validatePaths(self, imagePath=False, volumePath=False,
+                       metaPath=False):
+        """
+        Run the requested path checks using a single multiCall, raising
+        like the validate*Path method of each check.
+        """
+        if imagePath:
+            imageDir = image.Image(self.repoPath).getImageDir(self.sdUUID,
+                                                              self.imgUUID)
+        else:
+            imageDir = self.imagePath
+        volPath = os.path.join(imageDir, self.volUUID) if volumePath else None
+
+        calls = []
+        if imagePath:
+            calls.append(("os.path.isdir", (imageDir,)))
+            calls.append(("os.access",
+                          (imageDir, os.R_OK | os.W_OK | os.X_OK)))
+        if volumePath:
+            calls.append(("fileUtils.pathExists", (volPath,)))
+        if metaPath:
+            calls.append(("fileUtils.pathExists",
+                          (self._getMetaVolumePath(volPath),)))
+
+        results = iter(oop.multiCallResults(self.oop.multiCall(calls)))
+
+        if imagePath:
+            isDir = next(results)
+            isAccessible = next(results)
+            if not isDir or not isAccessible:
+                raise se.ImagePathError(imageDir)
+            self.imagePath = imageDir
+
+        if volumePath:
+            self.log.debug("validate path for %s" % self.volUUID)
+            if not next(results):
+                raise se.VolumeDoesNotExist(self.volUUID)
+            self.volumePath = volPath
+
+        if metaPath and not next(results):
+            raise se.VolumeDoesNotExist(self.volUUID)
+
     def validateImagePath(self):
         """
         Validate that the image dir exists and valid.
         In the file volume repositories,
         the image dir must exists after creation its first volume.
         """
-        imageDir = image.Image(self.repoPath).getImageDir(self.sdUUID,
-                                                          self.imgUUID)
-        if not self.oop.os.path.isdir(imageDir):
-            raise se.ImagePathError(imageDir)
-        if not self.oop.os.access(imageDir, os.R_OK | os.W_OK | os.X_OK):
-            raise se.ImagePathError(imageDir)
-        self.imagePath = imageDir
+        self._validatePaths(imagePath=True)
 
     @classmethod
     def __metaVolumePath(cls, volPath):
@@ -526,25 +573,16 @@ class FileVolume(volume.Volume):
         the volume file and the volume md must exists after
         the image/volume is created.
         """
-        self.log.debug("validate path for %s" % self.volUUID)
-        if not self.imagePath:
-            self.validateImagePath()
-        volPath = os.path.join(self.imagePath, self.volUUID)
-        if not self.oop.fileUtils.pathExists(volPath):
-            raise se.VolumeDoesNotExist(self.volUUID)
-
-        self.volumePath = volPath
-        if not sdCache.produce(self.sdUUID).isISO():
-            self.validateMetaVolumePath()
+        checkMeta = not sdCache.produce(self.sdUUID).isISO()
+        self._validatePaths(imagePath=not self.imagePath, volumePath=True,
+                            metaPath=checkMeta)
 
     def validateMetaVolumePath(self):
         """
         In file volume repositories,
         the volume metadata must exists after the image/volume is created.
         """
-        metaVolumePath = self._getMetaVolumePath()
-        if not self.oop.fileUtils.pathExists(metaVolumePath):
-            raise se.VolumeDoesNotExist(self.volUUID)
+        self._validatePaths(metaPath=True)
 
     def getVolumeSize(self, bs=BLOCK_SIZE):
         """
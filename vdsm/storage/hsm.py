@@ -34,6 +34,7 @@ from functools import partial, wraps
 import errno
 import time
 import signal
+import socket
 import types
 import math
 import stat
@@ -73,6 +74,7 @@ import mount
 import dispatcher
 import supervdsm
 import storageServer
+import uevent
 from vdsm import utils
 from vdsm import qemuimg
 
@@ -360,6 +362,16 @@ class HSM:
 
         self.__validateLvmLockingType()
 
+        self._ueventMonitor = uevent.UeventMonitor(subsystems=("block",))
+        if config.getboolean('irs', 'lvm_uevents'):
+            try:
+                self._ueventMonitor.start()
+            except socket.error:
+                self.log.warning("Cannot monitor uevents", exc_info=True)
+            else:
+                lvm.monitorUevents(self._ueventMonitor)
+                multipath.monitorUevents(self._ueventMonitor)
+
         self.domainStateChangeCallbacks = set()
 
         # cleanStorageRepoitory uses tasksDir value, this must be assigned
@@ -3172,6 +3184,8 @@ class HSM:
 
         imgVolumesInfo = []
         dom = sdCache.produce(sdUUID)
+        # Volumes may have been created or deleted by the SPM
+        dom.getVolumeClass().invalidateMetadataCache(sdUUID)
         allVols = dom.getAllVolumes()
         # Filter volumes related to this image
         imgVolumes = sd.getVolsOfImage(allVols, imgUUID).keys()
@@ -3404,6 +3418,7 @@ class HSM:
         #                          stop spm tasks if spm etc.)
         try:
             self._connectionMonitor.stopMonitoring()
+            self._ueventMonitor.stop()
             sp.StoragePool.cleanupMasterMount()
             self.__releaseLocks()
 
@@ -3563,6 +3578,7 @@ class HSM:
                     'version': domStatus.version,
                     # domStatus.hasHostId can also be None
                     'acquired': domStatus.hasHostId is True,
+                    'checkStats': domainMonitor.getCheckStats(sdUUID),
                 },
 
                 'disktotal': disktotal,
@@ -163,6 +163,8 @@ class Image:
         """
         chain = []
         volclass = sdCache.produce(sdUUID).getVolumeClass()
+        # Volumes may have been created or deleted by the SPM
+        volclass.invalidateMetadataCache(sdUUID)
 
         # Use volUUID when provided
         if volUUID:
@@ -26,23 +26,33 @@ Incapsulates the actual LVM mechanics.
 """
 import errno
 
+import glob
 import os
 import re
 import pwd
 import grp
+import json
 import logging
-from collections import namedtuple
+import select
+import signal
+import time
+from collections import namedtuple, OrderedDict
 import pprint as pp
 import threading
 from itertools import chain
 from subprocess import list2cmdline
 
+from cpopen import CPopen
+
 from vdsm import constants
+from vdsm import utils
+import zombiereaper
 import misc
 import multipath
 import storage_exception as se
 from vdsm.config import config
 import devicemapper
+import uevent
 
 log = logging.getLogger("Storage.LVM")
 
@@ -89,10 +99,6 @@ PV_PREFIX = "/dev/mapper"
 # Assuming there are no spaces in the PV name
 re_pvName = re.compile(PV_PREFIX + '[^\s\"]+', re.MULTILINE)
 
-# operations lock
-LVM_OP_INVALIDATE = "lvm invalidate operation"
-LVM_OP_RELOAD = "lvm reload operation"
-
 PVS_CMD = ("pvs",) + LVM_FLAGS + ("-o", PV_FIELDS)
 VGS_CMD = ("vgs",) + LVM_FLAGS + ("-o", VG_FIELDS)
 LVS_CMD = ("lvs",) + LVM_FLAGS + ("-o", LV_FIELDS)
@@ -130,6 +136,24 @@ VDSM_LVM_CONF = os.path.join(VDSM_LVM_SYSTEM_DIR, "lvm.conf")
 
 USER_DEV_LIST = filter(None, config.get("irs", "lvm_dev_whitelist").split(","))
 
+# Report commands that may run in the long lived lvm shell
+LVM_SHELL_CMDS = frozenset(("pvs", "vgs", "lvs"))
+LVM_SHELL_PROMPT = "lvm> "
+LVM_SHELL_REPORT_ARGS = ("--reportformat", "json",
+                         "--config", "log{report_command_log=1}")
+# lvm return code of a successfully processed command
+LVM_ECMD_PROCESSED = 1
+# Give up using the lvm shell after this many consecutive failures
+LVM_SHELL_MAX_FAILURES = 3
+
+# Device mapper uuid prefixes of LVs and multipath devices
+DM_LVM_UUID_PREFIX = "LVM-"
+DM_MPATH_UUID_PREFIX = "mpath-"
+# Device mapper name of an LV: vg-lv, with hyphens in the names doubled
+re_dmLvName = re.compile(r"^((?:[^-]|--)+)-((?:[^-]|--)+)$")
+
+SYS_BLOCK_DIR = "/sys/block"
+
 
 def _buildFilter(devices):
     strippeds = set(d.strip() for d in devices)
@@ -156,10 +180,14 @@ def _updateLvmConf(conf):
         if not os.path.isdir(VDSM_LVM_SYSTEM_DIR):
             os.mkdir(VDSM_LVM_SYSTEM_DIR)
 
-        with open(VDSM_LVM_CONF, "w") as lvmconf:
+        # The lvm shell reloads this file when it changes, make sure it never
+        # sees a partial configuration.
+        tmpConf = VDSM_LVM_CONF + ".tmp"
+        with open(tmpConf, "w") as lvmconf:
             lvmconf.write(conf)
+        os.rename(tmpConf, VDSM_LVM_CONF)
 
-    except IOError as e:
+    except (IOError, OSError) as e:
         # We are not interested in exceptions here, note it and
         log.warning("Cannot create %s file %s", VDSM_LVM_CONF, str(e))
 
@@ -188,6 +216,35 @@ def _tags2Tuple(sTags):
     return tuple(sTags.split(",")) if sTags else tuple()
 
 
+def _dmNameToLv(dmName):
+    """
+    Return the (vgName, lvName) of an LV device mapper name, or None for
+    other devices (e.g. snapshot or thin pool layers).
+    """
+    m = re_dmLvName.match(dmName)
+    if m is None:
+        return None
+    return tuple(name.replace("--", "-") for name in m.groups())
+
+
+def _readDmInfo(devName):
+    """
+    Return the (uuid, name) of device mapper device devName from sysfs, or
+    None if the device is gone or has no device mapper info.
+    """
+    dmDir = os.path.join(SYS_BLOCK_DIR, devName, "dm")
+    try:
+        with open(os.path.join(dmDir, "uuid")) as f:
+            uuid = f.readline().rstrip("\n")
+        with open(os.path.join(dmDir, "name")) as f:
+            name = f.readline().rstrip("\n")
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+    return uuid, name
+
+
 def makePV(*args):
     guid = os.path.basename(args[1])
     args += (guid,)
@@ -231,6 +288,176 @@ def makeLV(*args):
     return LV(*args)
 
 
+class LVMShellError(Exception):
+    pass
+
+
+class LVMShell(object):
+    """
+    Long lived lvm shell running report commands.
+
+    Running lvm for every query costs a sudo and an lvm fork and exec, which
+    dominate the latency of short queries. The shell reads commands from its
+    stdin and prints its prompt after each of them, marking the end of the
+    command output. The shell is started with LVM_SYSTEM_DIR pointing to the
+    configuration written by _updateLvmConf, so commands are sent without the
+    --config filter; lvm reloads the configuration when the file changes.
+
+    Commands are run with a json report including the command log, which is
+    the only reliable way to get their return code from the shell. This
+    requires lvm2 2.02.158 or later.
+
+    Any error kills the shell, the caller is expected to run the command the
+    usual way instead.
+    """
+    log = logging.getLogger("Storage.LVM.Shell")
+
+    def __init__(self, timeout):
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._proc = None
+
+    def _start(self):
+        cmd = [constants.EXT_LVM]
+        if os.geteuid() != 0:
+            cmd = [constants.EXT_SUDO, utils.SUDO_NON_INTERACTIVE_FLAG] + cmd
+        env = os.environ.copy()
+        env["LVM_SYSTEM_DIR"] = VDSM_LVM_SYSTEM_DIR
+        self.log.debug("Starting lvm shell: %s", cmd)
+        self._proc = CPopen(cmd, close_fds=True, env=env,
+                            deathSignal=signal.SIGKILL)
+        misc.setNonBlocking(self._proc.stdout)
+        misc.setNonBlocking(self._proc.stderr)
+        # Consume the first prompt
+        self._readUntilPrompt()
+
+    def stop(self):
+        if self._proc is None:
+            return
+        self.log.debug("Stopping lvm shell (pid=%d)", self._proc.pid)
+        try:
+            self._proc.kill()
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                self.log.warning("Cannot kill lvm shell", exc_info=True)
+        zombiereaper.autoReapPID(self._proc.pid)
+        self._proc = None
+
+    def _readUntilPrompt(self):
+        """
+        Read the shell output until the next prompt.
+
+        Returns the output and error lines received so far.
+        """
+        out = []
+        err = []
+        outFd = self._proc.stdout.fileno()
+        errFd = self._proc.stderr.fileno()
+        poller = select.epoll()
+        poller.register(outFd, select.EPOLLIN | select.EPOLLPRI)
+        poller.register(errFd, select.EPOLLIN | select.EPOLLPRI)
+        deadline = time.time() + self._timeout
+
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise LVMShellError("Timeout waiting for lvm shell")
+
+                for fd, event in misc.NoIntrPoll(poller.poll, remaining):
+                    data = os.read(fd, 4096)
+                    if not data:
+                        raise LVMShellError("lvm shell terminated")
+                    if fd == outFd:
+                        out.append(data)
+                    else:
+                        err.append(data)
+
+                if out and "".join(out).endswith(LVM_SHELL_PROMPT):
+                    break
+        finally:
+            poller.close()
+
+        out = "".join(out)[:-len(LVM_SHELL_PROMPT)]
+        return out, "".join(err).splitlines()
+
+    def _parseReport(self, out):
+        """
+        Convert a json report to the lines of the separated report format,
+        and extract the command return code from the command log.
+        """
+        start = out.find("{")
+        end = out.rfind("}")
+        if start == -1 or end == -1:
+            raise LVMShellError("Invalid lvm shell output: %r" % out)
+        try:
+            report = json.loads(out[start:end + 1],
+                                object_pairs_hook=OrderedDict)
+        except ValueError as e:
+            raise LVMShellError("Invalid lvm report: %s" % e)
+
+        lines = []
+        for section in report.get("report", ()):
+            for rows in section.itervalues():
+                for row in rows:
+                    lines.append(SEPARATOR.join(row.itervalues()))
+
+        for entry in report.get("log", ()):
+            if (entry.get("log_type") == "status" and
+                    entry.get("log_object_type") == "cmd"):
+                retCode = int(entry["log_ret_code"])
+                break
+        else:
+            raise LVMShellError("No command status in lvm report")
+
+        rc = 0 if retCode == LVM_ECMD_PROCESSED else retCode
+        return rc, lines
+
+    def run(self, cmd):
+        """
+        Run an lvm report command in the shell, returning (rc, out, err) like
+        misc.execCmd.
+        """
+        line = " ".join(tuple(cmd) + LVM_SHELL_REPORT_ARGS)
+        with self._lock:
+            try:
+                if self._proc is None:
+                    self._start()
+                self.log.debug("lvm shell: %s", line)
+                self._proc.stdin.write(line + "\n")
+                self._proc.stdin.flush()
+                out, err = self._readUntilPrompt()
+                rc, out = self._parseReport(out)
+            except (LVMShellError, IOError, OSError):
+                self.stop()
+                raise
+
+        self.log.debug("lvm shell: <err> = %r; <rc> = %d", err, rc)
+        return rc, out, err
+
+
+class _VGPartition(object):
+    """
+    The cached LVs of a single VG.
+
+    Each VG has its own lock and generation counters, so reloading or
+    invalidating a VG never waits for operations on other VGs.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        # {lvName: LV or Stub}
+        self.lvs = {}
+        # All the LVs of the VG must be reloaded
+        self.stale = True
+        # Bumped when LVs of the VG are invalidated
+        self.generation = 0
+        # Bumped when the VG itself is invalidated, protected by the cache
+        # lock like the VGs table
+        self.vgGeneration = 0
+
+
 class LVMCache(object):
     """
     Keep all the LVM information.
@@ -269,21 +496,146 @@ class LVMCache(object):
 
     def invalidateCache(self):
         self.invalidateFilter()
-        self.flush()
+        if self._monitoringUevents:
+            # Changes of the LVs on this host are tracked by uevents
+            self._invalidateAllPvs()
+            self._invalidateAllVgs()
+        else:
+            self.flush()
+
+    def monitorUevents(self, monitor):
+        """
+        Invalidate the cache entries of the devices reported by uevents.
+        """
+        for dmPath in glob.glob(os.path.join(SYS_BLOCK_DIR, "dm-*")):
+            devName = os.path.basename(dmPath)
+            info = _readDmInfo(devName)
+            if info is not None:
+                self._dmDevs[devName] = info
+
+        monitor.register(self.handleUevent)
+        self._monitoringUevents = True
+
+    def handleUevent(self, event):
+        if event is None:
+            log.warning("Uevents were lost, invalidating lvm cache")
+            self.invalidateFilter()
+            self.flush()
+            return
+
+        devName = event.get(uevent.DEVNAME, "")
+        if not devName.startswith("dm-"):
+            # New disks are relevant only when mapped by multipath
+            return
+
+        action = event[uevent.ACTION]
+        if action == uevent.REMOVE:
+            # Remove events do not carry the device mapper name
+            uuid, name = self._dmDevs.pop(devName, (None, None))
+        else:
+            uuid = event.get(uevent.DM_UUID)
+            name = event.get(uevent.DM_NAME)
+            if uuid is None or name is None:
+                # Kernel events do not carry the device mapper info, udev
+                # adds it. The device is still there, so read it from sysfs.
+                uuid, name = _readDmInfo(devName) or (None, None)
+            if uuid is not None and name is not None:
+                self._dmDevs[devName] = (uuid, name)
+
+        if uuid is None or name is None:
+            return
+
+        if uuid.startswith(DM_LVM_UUID_PREFIX):
+            lv = _dmNameToLv(name)
+            if lv is not None:
+                vgName, lvName = lv
+                log.debug("LV %s/%s %s, invalidating", vgName, lvName, action)
+                self._invalidatelvs(vgName, lvName)
+        elif uuid.startswith(DM_MPATH_UUID_PREFIX):
+            pvName = os.path.join(PV_PREFIX, name)
+            log.debug("Multipath device %s %s, invalidating", pvName, action)
+            if action != uevent.CHANGE:
+                self.invalidateFilter()
+            self._invalidatepvs(pvName)
+            vgNames = [vg.name for vg in self._vgs.values()
+                       if not isinstance(vg, Stub) and pvName in vg.pv_name]
+            if vgNames:
+                self._invalidatevgs(vgNames)
 
     def __init__(self):
         self._filterStale = True
         self._extraCfg = None
         self._filterLock = threading.Lock()
-        self._oplock = misc.OperationMutex()
+        # Protects the PVs, the VGs and LVs partitions tables and the stale
+        # flags. Never held while running lvm commands. May be taken before
+        # a partition lock, never after it.
+        self._lock = threading.Lock()
+        # Generation counters are bumped by invalidations, results of reloads
+        # which raced with an invalidation are not cached.
+        self._pvsGeneration = 0
+        self._vgsGeneration = 0
+        self._lvsGeneration = 0
         self._stalepv = True
         self._stalevg = True
         self._stalelv = True
         self._pvs = {}
         self._vgs = {}
+        # {vgName: _VGPartition}
         self._lvs = {}
+        # Concurrent reloads of whole VGs are merged into one lvm command
+        self._vgsBatch = misc.Batcher(self._reloadvgsBatch)
+        self._lvsBatch = misc.Batcher(self._reloadlvsBatch)
+        if config.getboolean("irs", "lvm_shell"):
+            self._shell = LVMShell(config.getint("irs", "lvm_shell_timeout"))
+        else:
+            self._shell = None
+        self._shellFailures = 0
+        self._monitoringUevents = False
+        # Device mapper devices seen in uevents {devName: (uuid, name)}
+        self._dmDevs = {}
+
+    def _canUseShell(self, cmd):
+        # The shell splits its input on white space and cannot handle quoting
+        return (self._shell is not None and cmd[0] in LVM_SHELL_CMDS and
+                not any(re.search(r"[\s'\"]", arg) for arg in cmd))
+
+    def _shellCmd(self, cmd):
+        """
+        Run a report command in the lvm shell, returning None if the shell is
+        not usable.
+        """
+        shell = self._shell
+        if shell is None:
+            return None
+        # Make sure the configuration used by the shell is up to date
+        self._getCachedExtraCfg()
+        try:
+            res = shell.run(cmd)
+        except Exception:
+            self._shellFailures += 1
+            log.warning("lvm shell failed (%d/%d), running command directly",
+                        self._shellFailures, LVM_SHELL_MAX_FAILURES,
+                        exc_info=True)
+            if self._shellFailures >= LVM_SHELL_MAX_FAILURES:
+                log.error("Disabling lvm shell after %d failures",
+                          self._shellFailures)
+                self._shell = None
+                shell.stop()
+            return None
+
+        self._shellFailures = 0
+        return res
 
     def cmd(self, cmd, devices=tuple()):
+        if self._canUseShell(cmd):
+            res = self._shellCmd(cmd)
+            if res is not None:
+                rc, out, err = res
+                if rc == 0:
+                    return res
+                # Filter might be stale, retry the usual way
+                self.invalidateFilter()
+
         finalCmd = self._addExtraCfg(cmd, devices)
         rc, out, err = misc.execCmd(finalCmd, sudo=True)
         if rc != 0:
@@ -300,43 +652,69 @@ class LVMCache(object):
         return rc, out, err
 
     def __str__(self):
+        lvs = dict(((vgName, lvName), lv)
+                   for vgName, part in self._lvs.items()
+                   for lvName, lv in part.lvs.items())
         return ("PVS:\n%s\n\nVGS:\n%s\n\nLVS:\n%s" %
                 (pp.pformat(self._pvs),
                  pp.pformat(self._vgs),
-                 pp.pformat(self._lvs)))
+                 pp.pformat(lvs)))
 
     def bootstrap(self):
         self._reloadpvs()
         self._reloadvgs()
         self._reloadAllLvs()
 
+    def _getPartition(self, vgName):
+        part = self._lvs.get(vgName)
+        if part is None:
+            with self._lock:
+                part = self._getPartitionLocked(vgName)
+        return part
+
+    def _getPartitionLocked(self, vgName):
+        """
+        Must be called with the cache lock held.
+        """
+        part = self._lvs.get(vgName)
+        if part is None:
+            part = self._lvs[vgName] = _VGPartition(vgName)
+        return part
+
     def _reloadpvs(self, pvName=None):
         cmd = list(PVS_CMD)
         pvNames = _normalizeargs(pvName)
         cmd.extend(pvNames)
-        with self._oplock.acquireContext(LVM_OP_RELOAD):
-            rc, out, err = self.cmd(cmd)
-            if rc != 0:
-                log.warning("lvm pvs failed: %s %s %s", str(rc), str(out),
-                            str(err))
+        generation = self._pvsGeneration
+        rc, out, err = self.cmd(cmd)
+        if rc != 0:
+            log.warning("lvm pvs failed: %s %s %s", str(rc), str(out),
+                        str(err))
+            with self._lock:
                 pvNames = pvNames if pvNames else self._pvs.keys()
                 for p in pvNames:
                     if isinstance(self._pvs.get(p), Stub):
                         self._pvs[p] = Unreadable(self._pvs[p].name, True)
                 return dict(self._pvs)
 
-            updatedPVs = {}
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                pv = makePV(*fields)
-                self._pvs[pv.name] = pv
-                updatedPVs[pv.name] = pv
+        updatedPVs = {}
+        for line in out:
+            fields = [field.strip() for field in line.split(SEPARATOR)]
+            pv = makePV(*fields)
+            updatedPVs[pv.name] = pv
+
+        with self._lock:
+            if generation != self._pvsGeneration:
+                log.debug("PVs invalidated during reload, not caching")
+                return updatedPVs
+
+            self._pvs.update(updatedPVs)
             # If we updated all the PVs drop stale flag
             if not pvName:
                 self._stalepv = False
                 # Remove stalePVs
                 stalePVs = [staleName for staleName in self._pvs.keys()
-                            if staleName not in updatedPVs.iterkeys()]
+                            if staleName not in updatedPVs]
                 for staleName in stalePVs:
                     log.warning("Removing stale PV: %s", staleName)
                     self._pvs.pop((staleName), None)
@@ -358,168 +736,300 @@ class LVMCache(object):
         return devices
 
     def _reloadvgs(self, vgName=None):
+        vgNames = _normalizeargs(vgName)
+        if vgNames:
+            return self._vgsBatch(vgNames)
+        return self._reloadvgsNow()
+
+    def _reloadvgsBatch(self, vgNames):
+        return self._reloadvgsNow(sorted(vgNames))
+
+    def _reloadvgsNow(self, vgName=None):
         cmd = list(VGS_CMD)
         vgNames = _normalizeargs(vgName)
         cmd.extend(vgNames)
 
-        with self._oplock.acquireContext(LVM_OP_RELOAD):
-            rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
+        allGeneration = self._vgsGeneration
+        if vgNames:
+            parts = [self._getPartition(name) for name in vgNames]
+        else:
+            parts = self._lvs.values()
+        generations = dict((part.name, part.vgGeneration) for part in parts)
+        rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
 
-            if rc != 0:
-                log.warning("lvm vgs failed: %s %s %s", str(rc), str(out),
-                            str(err))
-                vgNames = vgNames if vgNames else self._vgs.keys()
-                for v in vgNames:
+        if rc != 0:
+            log.warning("lvm vgs failed: %s %s %s", str(rc), str(out),
+                        str(err))
+            with self._lock:
+                for v in (vgNames if vgNames else self._vgs.keys()):
                     if isinstance(self._vgs.get(v), Stub):
                         self._vgs[v] = Unreadable(self._vgs[v].name, True)
 
-            if not len(out):
-                return dict(self._vgs)
-
-            updatedVGs = {}
-            vgsFields = {}
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                uuid = fields[VG._fields.index("uuid")]
-                pvNameIdx = VG._fields.index("pv_name")
-                pv_name = fields[pvNameIdx]
-                if uuid not in vgsFields:
-                    fields[pvNameIdx] = [pv_name]  # Make a pv_names list
-                    vgsFields[uuid] = fields
-                else:
-                    vgsFields[uuid][pvNameIdx].append(pv_name)
-            for fields in vgsFields.itervalues():
-                vg = makeVG(*fields)
-                if int(vg.pv_count) != len(vg.pv_name):
-                    log.error("vg %s has pv_count %s but pv_names %s",
-                              vg.name, vg.pv_count, vg.pv_name)
-                self._vgs[vg.name] = vg
-                updatedVGs[vg.name] = vg
+        if not len(out):
+            return dict(self._vgs)
+
+        updatedVGs = {}
+        vgsFields = {}
+        for line in out:
+            fields = [field.strip() for field in line.split(SEPARATOR)]
+            uuid = fields[VG._fields.index("uuid")]
+            pvNameIdx = VG._fields.index("pv_name")
+            pv_name = fields[pvNameIdx]
+            if uuid not in vgsFields:
+                fields[pvNameIdx] = [pv_name]  # Make a pv_names list
+                vgsFields[uuid] = fields
+            else:
+                vgsFields[uuid][pvNameIdx].append(pv_name)
+        for fields in vgsFields.itervalues():
+            vg = makeVG(*fields)
+            if int(vg.pv_count) != len(vg.pv_name):
+                log.error("vg %s has pv_count %s but pv_names %s",
+                          vg.name, vg.pv_count, vg.pv_name)
+            updatedVGs[vg.name] = vg
+
+        with self._lock:
+            if allGeneration != self._vgsGeneration:
+                log.debug("VGs invalidated during reload, not caching")
+                return updatedVGs
+
+            for vg in updatedVGs.itervalues():
+                part = self._getPartitionLocked(vg.name)
+                # Partitions created during the reload were not invalidated
+                if part.vgGeneration == generations.get(vg.name, 0):
+                    self._vgs[vg.name] = vg
+
             # If we updated all the VGs drop stale flag
             if not vgName:
                 self._stalevg = False
-                # Remove stale VGs
                 staleVGs = [staleName for staleName in self._vgs.keys()
-                            if staleName not in updatedVGs.iterkeys()]
+                            if staleName not in updatedVGs]
                 for staleName in staleVGs:
-                    removeVgMapping(staleName)
                     log.warning("Removing stale VG: %s", staleName)
-                    self._vgs.pop((staleName), None)
+                    del self._vgs[staleName]
+            else:
+                staleVGs = []
+
+        # Runs dmsetup, not under the lock
+        for staleName in staleVGs:
+            removeVgMapping(staleName)
 
         return updatedVGs
 
+    def _parseLvs(self, out):
+        """
+        Parse lvs output, returning the LVs of every VG as
+        {vgName: {lvName: lv}}.
+        """
+        vgsLvs = {}
+        for line in out:
+            fields = [field.strip() for field in line.split(SEPARATOR)]
+            lv = makeLV(*fields)
+            # For LV we are only interested in its first extent
+            if lv.seg_start_pe == "0":
+                vgsLvs.setdefault(lv.vg_name, {})[lv.name] = lv
+        return vgsLvs
+
+    def _updatePartition(self, part, generation, lvs, lvNames=None):
+        """
+        Cache the reloaded lvs of a VG, unless the VG was invalidated while
+        reloading. If lvNames is not specified all the LVs of the VG were
+        reloaded.
+        """
+        with part.lock:
+            if part.generation != generation:
+                log.debug("vg %s invalidated during reload, not caching",
+                          part.name)
+                return
+
+            part.lvs.update(lvs)
+            # Determine if there are stale LVs
+            if lvNames:
+                staleLVs = [lvName for lvName in lvNames
+                            if lvName not in lvs]
+            else:
+                # All the LVs in the VG
+                staleLVs = [lvName for lvName in part.lvs
+                            if lvName not in lvs]
+                part.stale = False
+
+            for lvName in staleLVs:
+                log.warning("Removing stale lv: %s/%s", part.name, lvName)
+                part.lvs.pop(lvName, None)
+
     def _reloadlvs(self, vgName, lvNames=None):
         lvNames = _normalizeargs(lvNames)
-        cmd = list(LVS_CMD)
         if lvNames:
-            cmd.extend(["%s/%s" % (vgName, lvName) for lvName in lvNames])
-        else:
-            cmd.append(vgName)
+            return self._reloadlvsNow(vgName, lvNames)
+
+        # Reloading all the LVs of a VG, join the other threads doing the
+        # same for other VGs and filter our VG out of the shared result.
+        lvs = self._lvsBatch((vgName,))
+        return dict((key, lv) for key, lv in lvs.iteritems()
+                    if key[0] == vgName)
+
+    def _reloadlvsBatch(self, vgNames):
+        """
+        Reload all the LVs of several VGs using a single lvs command.
 
-        with self._oplock.acquireContext(LVM_OP_RELOAD):
-            rc, out, err = self.cmd(cmd, self._getVGDevs((vgName, )))
+        If the command fails, fall back to reloading each VG on its own so
+        an unreachable VG does not invalidate the results of the others.
+        """
+        if len(vgNames) == 1:
+            vgName, = vgNames
+            return self._reloadlvsNow(vgName)
 
-            if rc != 0:
-                log.warning("lvm lvs failed: %s %s %s", str(rc), str(out),
-                            str(err))
-                lvNames = lvNames if lvNames else self._lvs.keys()
-                for l in lvNames:
-                    if isinstance(self._lvs.get(l), Stub):
-                        self._lvs[l] = Unreadable(self._lvs[l].name, True)
-                return dict(self._lvs)
+        vgNames = sorted(vgNames)
+        cmd = list(LVS_CMD)
+        cmd.extend(vgNames)
 
+        parts = [self._getPartition(name) for name in vgNames]
+        generations = [part.generation for part in parts]
+        rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
+        if rc == 0:
+            vgsLvs = self._parseLvs(out)
             updatedLVs = {}
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
-                # For LV we are only interested in its first extent
-                if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs[(lv.vg_name, lv.name)] = lv
+            for part, generation in zip(parts, generations):
+                lvs = vgsLvs.get(part.name, {})
+                self._updatePartition(part, generation, lvs)
+                updatedLVs.update(((part.name, lvName), lv)
+                                  for lvName, lv in lvs.iteritems())
+
+            log.debug("lvs reloaded for vgs: %s", vgNames)
+            return updatedLVs
+
+        log.warning("lvm lvs failed for vgs %s, reloading them one by one: "
+                    "%s %s %s", vgNames, str(rc), str(out), str(err))
+        updatedLVs = {}
+        for vgName in vgNames:
+            updatedLVs.update(self._reloadlvsNow(vgName))
+        return updatedLVs
 
-            # Determine if there are stale LVs
-            if lvNames:
-                staleLVs = (lvName for lvName in lvNames
-                            if (vgName, lvName) not in updatedLVs.iterkeys())
-            else:
-                # All the LVs in the VG
-                staleLVs = (lvName for v, lvName in self._lvs.keys()
-                            if (v == vgName) and
-                            ((vgName, lvName) not in updatedLVs.iterkeys()))
+    def _reloadlvsNow(self, vgName, lvNames=None):
+        lvNames = _normalizeargs(lvNames)
+        cmd = list(LVS_CMD)
+        if lvNames:
+            cmd.extend(["%s/%s" % (vgName, lvName) for lvName in lvNames])
+        else:
+            cmd.append(vgName)
 
-            for lvName in staleLVs:
-                log.warning("Removing stale lv: %s/%s", vgName, lvName)
-                self._lvs.pop((vgName, lvName), None)
+        part = self._getPartition(vgName)
+        generation = part.generation
+        rc, out, err = self.cmd(cmd, self._getVGDevs((vgName, )))
 
-            log.debug("lvs reloaded")
+        if rc != 0:
+            log.warning("lvm lvs failed: %s %s %s", str(rc), str(out),
+                        str(err))
+            with part.lock:
+                for l in (lvNames if lvNames else part.lvs.keys()):
+                    if isinstance(part.lvs.get(l), Stub):
+                        part.lvs[l] = Unreadable(part.lvs[l].name, True)
+                return dict(((vgName, lvName), lv)
+                            for lvName, lv in part.lvs.iteritems())
 
-        return updatedLVs
+        lvs = self._parseLvs(out).get(vgName, {})
+        self._updatePartition(part, generation, lvs, lvNames)
+        log.debug("lvs reloaded")
+
+        return dict(((vgName, lvName), lv) for lvName, lv in lvs.iteritems())
 
     def _reloadAllLvs(self):
         """
-        Used only during bootstrap.
+        Reload the LVs of all the VGs with a single lvs command.
         """
         cmd = list(LVS_CMD)
+        allGeneration = self._lvsGeneration
+        parts = self._lvs.values()
+        generations = dict((part.name, part.generation) for part in parts)
         rc, out, err = self.cmd(cmd)
         if rc == 0:
-            updatedLVs = set()
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
-                # For LV we are only interested in its first extent
-                if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs.add((lv.vg_name, lv.name))
-
-            # Remove stales
-            for vgName, lvName in self._lvs.keys():
-                if (vgName, lvName) not in updatedLVs:
-                    self._lvs.pop((vgName, lvName), None)
-                    log.error("Removing stale lv: %s/%s", vgName, lvName)
-            self._stalelv = False
-        return dict(self._lvs)
+            vgsLvs = self._parseLvs(out)
+
+            with self._lock:
+                if allGeneration != self._lvsGeneration:
+                    log.debug("LVs invalidated during reload, not caching")
+                    return dict(((v, lvName), lv)
+                                for v, lvs in vgsLvs.iteritems()
+                                for lvName, lv in lvs.iteritems())
+
+                for vgName, lvs in vgsLvs.iteritems():
+                    # Partitions created during the reload were not
+                    # invalidated
+                    self._updatePartition(self._getPartitionLocked(vgName),
+                                          generations.get(vgName, 0), lvs)
+
+                # Remove stales
+                for part in parts:
+                    if part.name not in vgsLvs:
+                        self._updatePartition(part, generations[part.name],
+                                              {})
+
+                self._stalelv = False
+
+        return dict(((part.name, lvName), lv)
+                    for part in self._lvs.values()
+                    for lvName, lv in part.lvs.items())
 
     def _invalidatepvs(self, pvNames):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
-            pvNames = _normalizeargs(pvNames)
+        pvNames = _normalizeargs(pvNames)
+        with self._lock:
+            self._pvsGeneration += 1
             for pvName in pvNames:
                 self._pvs[pvName] = Stub(pvName, True)
 
     def _invalidateAllPvs(self):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lock:
+            self._pvsGeneration += 1
             self._stalepv = True
             self._pvs.clear()
 
     def _invalidatevgs(self, vgNames):
         vgNames = _normalizeargs(vgNames)
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lock:
             for vgName in vgNames:
+                part = self._getPartitionLocked(vgName)
+                part.vgGeneration += 1
                 self._vgs[vgName] = Stub(vgName, True)
 
+    def _removevgs(self, vgNames):
+        vgNames = _normalizeargs(vgNames)
+        with self._lock:
+            for vgName in vgNames:
+                self._vgs.pop(vgName, None)
+
     def _invalidateAllVgs(self):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lock:
+            self._vgsGeneration += 1
             self._stalevg = True
             self._vgs.clear()
 
     def _invalidatelvs(self, vgName, lvNames=None):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
-            lvNames = _normalizeargs(lvNames)
+        lvNames = _normalizeargs(lvNames)
+        part = self._getPartition(vgName)
+        with part.lock:
+            part.generation += 1
             # Invalidate LVs in a specific VG
             if lvNames:
                 # Invalidate a specific LVs
                 for lvName in lvNames:
-                    self._lvs[(vgName, lvName)] = Stub(lvName, True)
+                    part.lvs[lvName] = Stub(lvName, True)
             else:
                 # Invalidate all the LVs in a given VG
-                for lv in self._lvs.values():
+                part.stale = True
+                for lv in part.lvs.values():
                     if not isinstance(lv, Stub):
-                        if lv.vg_name == vgName:
-                            self._lvs[(vgName, lv.name)] = Stub(lv.name, True)
+                        part.lvs[lv.name] = Stub(lv.name, True)
 
     def _invalidateAllLvs(self):
-        with self._oplock.acquireContext(LVM_OP_INVALIDATE):
+        with self._lock:
+            self._lvsGeneration += 1
             self._stalelv = True
-            self._lvs.clear()
+            # Keep the partitions, reloads in progress compare their
+            # generations
+            for part in self._lvs.itervalues():
+                with part.lock:
+                    part.generation += 1
+                    part.stale = True
+                    part.lvs.clear()
 
     def flush(self):
         self._invalidateAllPvs()
@@ -579,18 +1089,12 @@ class LVMCache(object):
         return vgs.values()
 
     def getLv(self, vgName, lvName=None):
-        # Checking self._stalelv here is suboptimal, because
-        # unnecessary reloads
-        # are done.
-
         # Return vgName/lvName info
-        # If both 'vgName' and 'lvName' are None then return everything
         # If only 'lvName' is None then return all the LVs in the given VG
-        # If only 'vgName' is None it is weird, so return nothing
-        # (we can consider returning all the LVs with a given name)
+        part = self._getPartition(vgName)
         if lvName:
             # vgName, lvName
-            lv = self._lvs.get((vgName, lvName))
+            lv = part.lvs.get(lvName)
             if not lv or isinstance(lv, Stub):
                 # while we here reload all the LVs in the VG
                 lvs = self._reloadlvs(vgName)
@@ -602,28 +1106,25 @@ class LVMCache(object):
         else:
             # vgName, None
             # If there any stale LVs reload the whole VG, since it would
-            # cost us around same efforts anyhow and these stale LVs can
-            # be in the vg.
-            # Will be better when the pvs dict will be part of the vg.
-            # Fix me: should not be more stubs
-            if self._stalelv or any(isinstance(lv, Stub)
-                                    for lv in self._lvs.values()):
-                lvs = self._reloadlvs(vgName)
-            else:
-                lvs = dict(self._lvs)
-            # lvs = self._reloadlvs()
-            lvs = [lv for lv in lvs.values()
-                   if not isinstance(lv, Stub) and (lv.vg_name == vgName)]
-            res = lvs
+            # cost us around same efforts anyhow.
+            lvs = part.lvs.values()
+            if part.stale or any(isinstance(lv, Stub) for lv in lvs):
+                lvs = self._reloadlvs(vgName).values()
+            res = [lv for lv in lvs if not isinstance(lv, Stub)]
         return res
 
     def getAllLvs(self):
         # None, None
-        if self._stalelv or any(isinstance(lv, Stub)
-                                for lv in self._lvs.values()):
+        parts = self._lvs.values()
+        if self._stalelv or any(part.stale or
+                                any(isinstance(lv, Stub)
+                                    for lv in part.lvs.itervalues())
+                                for part in parts):
             lvs = self._reloadAllLvs()
         else:
-            lvs = dict(self._lvs)
+            lvs = dict(((part.name, lvName), lv)
+                       for part in parts
+                       for lvName, lv in part.lvs.items())
         return lvs.values()
 
 _lvminfo = LVMCache()
@@ -677,6 +1178,10 @@ def invalidateCache():
     _lvminfo.invalidateCache()
 
 
+def monitorUevents(monitor):
+    _lvminfo.monitorUevents(monitor)
+
+
 def _fqpvname(pv):
     if pv and not pv.startswith(PV_PREFIX):
         pv = os.path.join(PV_PREFIX, pv)
@@ -940,7 +1445,7 @@ def removeVG(vgName):
         raise se.VolumeGroupRemoveError("VG %s remove failed." % vgName)
     else:
         # Remove the vg from the cache
-        _lvminfo._vgs.pop(vgName, None)
+        _lvminfo._removevgs(vgName)
 
 
 def removeVGbyUUID(vgUUID):
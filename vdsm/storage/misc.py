@@ -53,6 +53,7 @@ from vdsm import constants
 from vdsm import utils
 import storage_exception as se
 import logUtils
+import directio
 
 IOUSER = "vdsm"
 DIRECTFLAG = "direct"
@@ -60,6 +61,14 @@ DATASYNCFLAG = "fdatasync"
 STR_UUID_SIZE = 36
 UUID_HYPHENS = [8, 13, 18, 23]
 MEGA = 1 << 20
+
+# Seconds to wait for an in-process direct read before giving up on it
+DIRECTIO_TIMEOUT = 30
+
+# Paths with in-process direct reads that did not finish in time
+_stuckReads = set()
+_stuckReadsLock = threading.Lock()
+
 UNLIMITED_THREADS = -1
 
 log = logging.getLogger('Storage.Misc')
@@ -194,11 +203,7 @@ _readspeed_regex = re.compile(
 )
 
 
-def readspeed(path, buffersize=None):
-    """
-    Measures the amount of bytes transferred and the time elapsed
-    reading the content of the file/device
-    """
+def _ddReadspeed(path, buffersize=None):
     cmd = [constants.EXT_DD, "if=%s" % path, "iflag=%s" % DIRECTFLAG,
            "of=/dev/null"]
 
@@ -227,15 +232,7 @@ def readspeed(path, buffersize=None):
     }
 
 
-def readblock(name, offset, size):
-    '''
-    Read (direct IO) the content of device 'name' at offset, size bytes
-    '''
-
-    # direct io must be aligned on block size boundaries
-    if (size % 512) or (offset % 512):
-        raise se.MiscBlockReadException(name, offset, size)
-
+def _ddRead(name, offset, size):
     left = size
     ret = ""
     baseoffset = offset
@@ -255,7 +252,133 @@ def readblock(name, offset, size):
         ret += out
         left = left % iounit
         offset = baseoffset + size - left
-    return ret.splitlines()
+    return ret
+
+
+def _ddReadblock(name, offset, size):
+    return _ddRead(name, offset, size).splitlines()
+
+
+class _DirectReadTimeout(Exception):
+    pass
+
+
+def _guardedRead(path, func, *args):
+    """
+    Run func(*args), reading from path, in a guard thread and wait up to
+    DIRECTIO_TIMEOUT seconds for it.
+
+    A read blocked on unresponsive storage cannot be interrupted, so when
+    the timeout expires the thread is left behind and path is marked as
+    stuck until the read returns. Reads from stuck paths use dd, so the
+    blocked reads do not pile up threads in this process.
+    """
+    result = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            result['value'] = func(*args)
+        except Exception as e:
+            result['error'] = e
+        finally:
+            with _stuckReadsLock:
+                done.set()
+                _stuckReads.discard(path)
+
+    t = threading.Thread(target=run, name="directio")
+    t.daemon = True
+    t.start()
+
+    if not done.wait(DIRECTIO_TIMEOUT):
+        with _stuckReadsLock:
+            if not done.isSet():
+                _stuckReads.add(path)
+                raise _DirectReadTimeout(path)
+
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def _isStuck(path):
+    with _stuckReadsLock:
+        return path in _stuckReads
+
+
+def _directReadspeed(path, buffersize):
+    start = utils.monotonic_time()
+    if buffersize:
+        size = len(directio.read(path, 0, buffersize))
+    else:
+        size = 0
+        while True:
+            n = len(directio.read(path, size, MEGA))
+            size += n
+            if n < MEGA:
+                break
+    return {
+        'bytes': size,
+        'seconds': utils.monotonic_time() - start,
+    }
+
+
+def readspeed(path, buffersize=None):
+    """
+    Measures the amount of bytes transferred and the time elapsed
+    reading the content of the file/device
+    """
+    if _isStuck(path):
+        log.warning("Previous read from '%s' is stuck, using dd", path)
+        return _ddReadspeed(path, buffersize)
+
+    try:
+        return _guardedRead(path, _directReadspeed, path, buffersize)
+    except _DirectReadTimeout:
+        log.error("Timeout reading file '%s'", path)
+        raise se.MiscFileReadException(path)
+    except (EnvironmentError, ValueError):
+        log.error("Unable to read file '%s'", path, exc_info=True)
+        raise se.MiscFileReadException(path)
+
+
+def readblock(name, offset, size):
+    '''
+    Read (direct IO) the content of device 'name' at offset, size bytes
+    '''
+
+    # direct io must be aligned on block size boundaries
+    if (size % 512) or (offset % 512):
+        raise se.MiscBlockReadException(name, offset, size)
+
+    if _isStuck(name):
+        log.warning("Previous read from '%s' is stuck, using dd", name)
+        return _ddReadblock(name, offset, size)
+
+    data = readchunk(name, offset, size)
+    if len(data) != size:
+        raise se.MiscBlockReadIncomplete(name, offset, size)
+    return data.splitlines()
+
+
+def readchunk(name, offset, size):
+    """
+    Read (direct IO) size bytes of device 'name' at offset, returning a
+    string. The string is shorter than size only if the end of the device
+    was reached. offset and size must be aligned on block size boundaries.
+    """
+    if _isStuck(name):
+        log.warning("Previous read from '%s' is stuck, using dd", name)
+        return _ddRead(name, offset, size)
+
+    try:
+        return _guardedRead(name, directio.read, name, offset, size)
+    except _DirectReadTimeout:
+        log.error("Timeout reading '%s'", name)
+        raise se.MiscBlockReadException(name, offset, size)
+    except EnvironmentError:
+        log.error("Unable to read '%s'", name, exc_info=True)
+        raise se.MiscBlockReadException(name, offset, size)
 
 
 def validateDDBytes(ddstderr, size):
@@ -768,6 +891,67 @@ def samplingmethod(func):
     return helper
 
 
+class Batcher(object):
+    """
+    Merge concurrent requests for sets of keys into a single call.
+
+    Every caller adds its keys to the pending batch. The first caller finding
+    no batch in progress becomes the leader, runs func once with all the keys
+    queued so far and shares the result (or the exception) with the other
+    callers of the same batch. Callers arriving while a batch is running are
+    queued for the next one, so they never get a result computed before they
+    asked for it.
+
+    func is called with a frozenset of keys.
+    """
+    _log = logging.getLogger("Storage.Batcher")
+
+    class _Batch(object):
+        def __init__(self):
+            self.keys = set()
+            self.done = False
+            self.result = None
+            self.error = None
+
+    def __init__(self, func):
+        self._func = func
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = self._Batch()
+        self._running = False
+
+    def __call__(self, keys):
+        with self._cond:
+            batch = self._pending
+            batch.keys.update(keys)
+            while self._running and not batch.done:
+                self._cond.wait()
+
+            if not batch.done:
+                # Nobody is running, take the pending batch
+                self._running = True
+                self._pending = self._Batch()
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            self._log.debug("Running batch of %d keys", len(batch.keys))
+            try:
+                batch.result = self._func(frozenset(batch.keys))
+            except Exception as e:
+                batch.error = e
+            finally:
+                with self._cond:
+                    batch.done = True
+                    self._running = False
+                    self._cond.notifyAll()
+
+        if batch.error is not None:
+            raise batch.error
+
+        return batch.result
+
+
 def tmap(func, iterable):
     resultsDict = {}
     error = [None]
@@ -28,6 +28,8 @@ from glob import glob
 import tempfile
 import logging
 import re
+import threading
+import time
 from collections import namedtuple
 
 from vdsm import constants
@@ -36,6 +38,7 @@ import misc
 import iscsi
 import supervdsm
 import devicemapper
+import uevent
 
 import storage_exception as se
 
@@ -45,6 +48,13 @@ DEV_MIXED = "MIXED"
 
 MAX_CONF_COPIES = 5
 
+# Seconds to keep the sysfs information and serial of a multipath device
+DEV_INFO_TTL = 60
+# Threads reading the sysfs information of the multipath devices
+SYSFS_SCAN_THREADS = 16
+# scsi_id processes run concurrently by getScsiSerials
+SCSI_ID_THREADS = 8
+
 TOXIC_CHARS = '()*+?|^$.\\'
 
 MPATH_CONF = "/etc/multipath.conf"
@@ -243,97 +253,254 @@ def getHBTL(physdev):
     return HBTL(*hbtl[0].split(":"))
 
 
+def getScsiSerials(physdevs):
+    """
+    Return a dict mapping each of physdevs to its scsi serial, running
+    scsi_id for several devices concurrently.
+    """
+    def serial(physdev):
+        return physdev, getScsiSerial(physdev)
+
+    serials = {}
+    for res in misc.itmap(serial, physdevs, SCSI_ID_THREADS):
+        if isinstance(res, Exception):
+            raise res
+        physdev, value = res
+        serials[physdev] = value
+    return serials
+
+
+class DeviceInfoCache(object):
+    """
+    Keep the information read from sysfs and the serial of the multipath
+    devices, keyed by the dm device.
+
+    An entry is used only if the device still has the same guid and slaves,
+    and is dropped after ttl seconds, or when a uevent reports a change of
+    the device or one of its slaves.
+    """
+
+    def __init__(self, ttl=DEV_INFO_TTL, clock=time.time):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # dmId: (expires, guid, slaves, info)
+        self._entries = {}
+
+    def get(self, dmId, guid, slaves):
+        with self._lock:
+            entry = self._entries.get(dmId)
+            if entry is None:
+                return None
+            expires, cachedGuid, cachedSlaves, info = entry
+            if (expires <= self._clock() or cachedGuid != guid or
+                    cachedSlaves != slaves):
+                del self._entries[dmId]
+                return None
+            return info
+
+    def set(self, dmId, guid, slaves, info):
+        with self._lock:
+            self._entries[dmId] = (self._clock() + self._ttl, guid, slaves,
+                                   info)
+
+    def invalidate(self, devName=None):
+        """
+        Drop the entries of the dm device or slave devName, or all the
+        entries if devName is None.
+        """
+        with self._lock:
+            if devName is None:
+                self._entries.clear()
+                return
+            for dmId, entry in self._entries.items():
+                if dmId == devName or devName in entry[2]:
+                    del self._entries[dmId]
+
+    def handleUevent(self, event):
+        if event is None:
+            log.warning("Uevents were lost, invalidating multipath devices "
+                        "cache")
+            self.invalidate()
+            return
+
+        devName = event.get(uevent.DEVNAME)
+        if devName:
+            self.invalidate(devName)
+
+
+_devInfoCache = DeviceInfoCache()
+
+
+def monitorUevents(monitor):
+    """
+    Invalidate the cached devices information when uevents report changes
+    of the multipath devices or their paths.
+    """
+    monitor.register(_devInfoCache.handleUevent)
+
+
+def _readDeviceInfo(dev):
+    """
+    Read the information of the multipath device from the sysfs entries of
+    its slaves. Called from the scanning threads.
+    """
+    dmId, guid, slaves = dev
+    devInfo = {
+        "vendor": "",
+        "product": "",
+        "fwrev": "",
+        "logicalblocksize": "",
+        "physicalblocksize": "",
+        "paths": [],
+    }
+
+    for slave in slaves:
+        if not devicemapper.isBlockDevice(slave):
+            log.warning("No such physdev '%s' is ignored" % slave)
+            continue
+
+        if not devInfo["vendor"]:
+            try:
+                devInfo["vendor"] = getVendor(slave)
+            except Exception:
+                log.warn("Problem getting vendor from device `%s`",
+                         slave, exc_info=True)
+
+        if not devInfo["product"]:
+            try:
+                devInfo["product"] = getModel(slave)
+            except Exception:
+                log.warn("Problem getting model name from device `%s`",
+                         slave, exc_info=True)
+
+        if not devInfo["fwrev"]:
+            try:
+                devInfo["fwrev"] = getFwRev(slave)
+            except Exception:
+                log.warn("Problem getting fwrev from device `%s`",
+                         slave, exc_info=True)
+
+        if (not devInfo["logicalblocksize"] or
+                not devInfo["physicalblocksize"]):
+            try:
+                logBlkSize, phyBlkSize = getDeviceBlockSizes(slave)
+                devInfo["logicalblocksize"] = str(logBlkSize)
+                devInfo["physicalblocksize"] = str(phyBlkSize)
+            except Exception:
+                log.warn("Problem getting blocksize from device `%s`",
+                         slave, exc_info=True)
+
+        pathInfo = {"physdev": slave}
+        try:
+            hbtl = getHBTL(slave)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                log.warn("Device has no hbtl: %s", slave)
+                pathInfo["lun"] = 0
+            else:
+                log.error("Error: %s while trying to get hbtl of device: "
+                          "%s", str(e.message), slave)
+                raise
+        else:
+            pathInfo["lun"] = hbtl.lun
+
+        if iscsi.devIsiSCSI(slave):
+            pathInfo["type"] = DEV_ISCSI
+            pathInfo["sessionID"] = iscsi.getiScsiSession(slave)
+        else:
+            pathInfo["type"] = DEV_FCP
+
+        devInfo["paths"].append(pathInfo)
+
+    return dev, devInfo
+
+
+def _getDevicesInfo(devs):
+    """
+    Return a dict mapping the dm device of each of devs, a list of
+    (dmId, guid, slaves) tuples, to its cached information, scanning the
+    devices missing from the cache concurrently.
+    """
+    infos = {}
+    missing = []
+    for dev in devs:
+        info = _devInfoCache.get(*dev)
+        if info is None:
+            missing.append(dev)
+        else:
+            infos[dev[0]] = info
+
+    if not missing:
+        return infos
+
+    serials = supervdsm.getProxy().getScsiSerials(
+        [dmId for dmId, guid, slaves in missing])
+
+    for res in misc.itmap(_readDeviceInfo, missing, SYSFS_SCAN_THREADS):
+        if isinstance(res, Exception):
+            raise res
+        dev, info = res
+        dmId = dev[0]
+        info["serial"] = serials.get(dmId, "")
+        _devInfoCache.set(dmId, dev[1], dev[2], info)
+        infos[dmId] = info
+
+    return infos
+
+
 def pathListIter(filterGuids=None):
     filteringOn = filterGuids is not None
     filterLen = len(filterGuids) if filteringOn else -1
-    devsFound = 0
-
-    knownSessions = {}
-
-    svdsm = supervdsm.getProxy()
-    pathStatuses = devicemapper.getPathsStatus()
 
+    devs = []
     for dmId, guid in getMPDevsIter():
-        if devsFound == filterLen:
+        if len(devs) == filterLen:
             break
 
         if filteringOn and guid not in filterGuids:
             continue
 
-        devsFound += 1
+        devs.append((dmId, guid, tuple(sorted(devicemapper.getSlaves(dmId)))))
+
+    if not devs:
+        return
 
+    knownSessions = {}
+
+    pathStatuses = devicemapper.getPathsStatus()
+    infos = _getDevicesInfo(devs)
+
+    for dmId, guid, slaves in devs:
+        info = infos[dmId]
         devInfo = {
             "guid": guid,
             "dm": dmId,
             "capacity": str(getDeviceSize(dmId)),
-            "serial": svdsm.getScsiSerial(dmId),
+            "serial": info["serial"],
             "paths": [],
             "connections": [],
             "devtypes": [],
             "devtype": "",
-            "vendor": "",
-            "product": "",
-            "fwrev": "",
-            "logicalblocksize": "",
-            "physicalblocksize": "",
+            "vendor": info["vendor"],
+            "product": info["product"],
+            "fwrev": info["fwrev"],
+            "logicalblocksize": info["logicalblocksize"],
+            "physicalblocksize": info["physicalblocksize"],
         }
 
-        for slave in devicemapper.getSlaves(dmId):
-            if not devicemapper.isBlockDevice(slave):
-                log.warning("No such physdev '%s' is ignored" % slave)
-                continue
-
-            if not devInfo["vendor"]:
-                try:
-                    devInfo["vendor"] = getVendor(slave)
-                except Exception:
-                    log.warn("Problem getting vendor from device `%s`",
-                             slave, exc_info=True)
-
-            if not devInfo["product"]:
-                try:
-                    devInfo["product"] = getModel(slave)
-                except Exception:
-                    log.warn("Problem getting model name from device `%s`",
-                             slave, exc_info=True)
-
-            if not devInfo["fwrev"]:
-                try:
-                    devInfo["fwrev"] = getFwRev(slave)
-                except Exception:
-                    log.warn("Problem getting fwrev from device `%s`",
-                             slave, exc_info=True)
-
-            if (not devInfo["logicalblocksize"] or
-                    not devInfo["physicalblocksize"]):
-                try:
-                    logBlkSize, phyBlkSize = getDeviceBlockSizes(slave)
-                    devInfo["logicalblocksize"] = str(logBlkSize)
-                    devInfo["physicalblocksize"] = str(phyBlkSize)
-                except Exception:
-                    log.warn("Problem getting blocksize from device `%s`",
-                             slave, exc_info=True)
-
-            pathInfo = {}
-            pathInfo["physdev"] = slave
-            pathInfo["state"] = pathStatuses.get(slave, "failed")
-            try:
-                hbtl = getHBTL(slave)
-            except OSError as e:
-                if e.errno == errno.ENOENT:
-                    log.warn("Device has no hbtl: %s", slave)
-                    pathInfo["lun"] = 0
-                else:
-                    log.error("Error: %s while trying to get hbtl of device: "
-                              "%s", str(e.message), slave)
-                    raise
-            else:
-                pathInfo["lun"] = hbtl.lun
+        for path in info["paths"]:
+            slave = path["physdev"]
+            pathInfo = {
+                "physdev": slave,
+                "state": pathStatuses.get(slave, "failed"),
+                "lun": path["lun"],
+                "type": path["type"],
+            }
 
-            if iscsi.devIsiSCSI(slave):
+            if pathInfo["type"] == DEV_ISCSI:
                 devInfo["devtypes"].append(DEV_ISCSI)
-                pathInfo["type"] = DEV_ISCSI
-                sessionID = iscsi.getiScsiSession(slave)
+                sessionID = path["sessionID"]
                 if sessionID not in knownSessions:
                     # FIXME: This entire part is for BC. It should be moved to
                     # hsm and not preserved for new APIs. New APIs should keep
@@ -358,7 +525,6 @@ def pathListIter(filterGuids=None):
                 devInfo["connections"].append(knownSessions[sessionID])
             else:
                 devInfo["devtypes"].append(DEV_FCP)
-                pathInfo["type"] = DEV_FCP
 
             if devInfo["devtype"] == "":
                 devInfo["devtype"] = pathInfo["type"]
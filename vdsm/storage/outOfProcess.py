@@ -27,6 +27,8 @@ from remoteFileHandler import RemoteFileHandlerPool
 
 DEFAULT_TIMEOUT = config.getint("irs", "process_pool_timeout")
 HELPERS_PER_DOMAIN = config.getint("irs", "process_pool_max_slots_per_domain")
+CALLS_PER_HELPER = config.getint("irs", "process_pool_max_calls_per_slot")
+MAX_QUEUED_CALLS = config.getint("irs", "process_pool_max_queued_calls")
 
 _poolsLock = threading.Lock()
 _pools = {}
@@ -39,7 +41,9 @@ def getProcessPool(clientName):
         with _poolsLock:
             if clientName not in _pools:
                 _pools[clientName] = OopWrapper(
-                    RemoteFileHandlerPool(HELPERS_PER_DOMAIN))
+                    RemoteFileHandlerPool(HELPERS_PER_DOMAIN,
+                                          CALLS_PER_HELPER,
+                                          MAX_QUEUED_CALLS))
 
             return _pools[clientName]
 
@@ -75,6 +79,41 @@ class _ModuleWrapper(types.ModuleType):
         return partial(self._procPool.callCrabRPCFunction, self._timeout,
                        fullName)
 
+    def multiCall(self, calls):
+        """
+        Run several calls in a single round trip to a helper.
+
+        calls is a sequence of (name, args) or (name, args, kwargs) tuples,
+        where name is relative to the oop module, e.g. "os.path.isdir".
+        Returns a list of (result, error) tuples in the order of the calls,
+        where error is None if the call succeeded.
+        """
+        if not calls:
+            return []
+
+        requests = []
+        for call in calls:
+            name, args = call[:2]
+            kwargs = call[2] if len(call) > 2 else {}
+            requests.append((name, tuple(args), kwargs))
+
+        return self._procPool.callCrabRPCFunction(self._timeout, "multiCall",
+                                                  requests)
+
+
+def multiCallResults(results):
+    """
+    Return the results of a multiCall, raising the error of the first call
+    that failed.
+    """
+    values = []
+    for res, err in results:
+        if err is not None:
+            raise err
+        values.append(res)
+
+    return values
+
 
 def OopWrapper(procPool):
     return _ModuleWrapper("oop", procPool, DEFAULT_TIMEOUT,
@@ -19,16 +19,17 @@
 #
 
 from struct import unpack, pack, calcsize
-from threading import Lock
 from time import time, sleep
 import errno
 import glob
+import io
 import logging
+import marshal
 import os
 import signal
 import sys
 import select
-from contextlib import contextmanager
+import threading
 
 if __name__ != "__main__":
     # The following modules are not used by the newly spawned child porcess.
@@ -54,12 +55,52 @@ from vdsm import utils
 LENGTH_STRUCT_FMT = "Q"
 LENGTH_STRUCT_LENGTH = calcsize(LENGTH_STRUCT_FMT)
 
+# Every message starts with the format of its payload. The server answers
+# in the format of the request. Messages that cannot be marshalled (e.g.
+# exceptions or os.stat results) are pickled instead.
+FORMAT_PICKLE = "P"
+FORMAT_MARSHAL = "M"
+MARSHAL_VERSION = 2
+
+
+def encode(obj, wireFormat):
+    if wireFormat == FORMAT_MARSHAL:
+        try:
+            return FORMAT_MARSHAL + marshal.dumps(obj, MARSHAL_VERSION)
+        except ValueError:
+            pass  # Unmarshallable object
+
+    return FORMAT_PICKLE + pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(data):
+    """
+    Decode a message from a string or a bytearray, returning the format of
+    the message and the decoded object. Marshalled messages are decoded
+    without copying the data.
+    """
+    wireFormat = chr(data[0]) if isinstance(data, bytearray) else data[0]
+    if wireFormat == FORMAT_MARSHAL:
+        return wireFormat, marshal.loads(buffer(data, 1))
+    elif wireFormat == FORMAT_PICKLE:
+        return wireFormat, pickle.loads(str(buffer(data, 1)))
+    else:
+        raise ValueError("Unknown wire format %r" % wireFormat)
+
 
 class Timeout(RuntimeError):
     pass
 
 
 class CrabRPCServer(object):
+    """
+    Serves calls from a CrabRPCProxy.
+
+    Every request carries an id which is sent back with the response, so
+    the proxy may send several requests without waiting for the responses.
+    Each request is served in its own thread and the responses are sent in
+    the order the calls complete.
+    """
     log = logging.getLogger("Storage.CrabRPCServer")
 
     def __init__(self, myRead, myWrite):
@@ -67,6 +108,8 @@ class CrabRPCServer(object):
         self.wfile = os.fdopen(myWrite, "wa")
         self.registeredFunctions = {}
         self.registeredModules = {}
+        self._writeLock = threading.Lock()
+        self.registerFunction(self.multiCall)
 
     def registerFunction(self, func, name=None):
         if name is None:
@@ -90,22 +133,35 @@ class CrabRPCServer(object):
 
     def serve_once(self):
         rawLength = self.rfile.read(LENGTH_STRUCT_LENGTH)
+        if len(rawLength) < LENGTH_STRUCT_LENGTH:
+            raise Exception("Pipe broke")
+
         length = unpack(LENGTH_STRUCT_FMT, rawLength)[0]
-        pickledCall = self.rfile.read(length)
-        if len(pickledCall) < length:
+        rawCall = self.rfile.read(length)
+        if len(rawCall) < length:
             raise Exception("Pipe broke")
 
-        name, args, kwargs = pickle.loads(pickledCall)
+        t = threading.Thread(target=self.serveRequest, args=(rawCall,))
+        t.setDaemon(True)
+        t.start()
+
+    def serveRequest(self, rawCall):
+        wireFormat, (reqId, name, args, kwargs) = decode(rawCall)
         err = res = None
         try:
             res = self.callRegisteredFunction(name, args, kwargs)
         except Exception as ex:
             err = ex
 
-        resp = pickle.dumps((res, err))
-        self.wfile.write(pack(LENGTH_STRUCT_FMT, len(resp)))
-        self.wfile.write(resp)
-        self.wfile.flush()
+        try:
+            resp = encode((reqId, res, err), wireFormat)
+        except Exception as ex:
+            resp = encode((reqId, None, ex), wireFormat)
+
+        with self._writeLock:
+            self.wfile.write(pack(LENGTH_STRUCT_FMT, len(resp)))
+            self.wfile.write(resp)
+            self.wfile.flush()
 
     def callRegisteredFunction(self, name, args, kwargs):
         if "." not in name:
@@ -119,99 +175,198 @@ class CrabRPCServer(object):
 
         return func(*args, **kwargs)
 
+    def multiCall(self, calls):
+        """
+        Call several registered functions, given as (name, args, kwargs)
+        tuples. Returns a (result, error) tuple for each call; a failing call
+        does not prevent the next calls.
+        """
+        results = []
+        for name, args, kwargs in calls:
+            try:
+                res = self.callRegisteredFunction(name, args, kwargs)
+            except Exception as ex:
+                results.append((None, ex))
+            else:
+                results.append((res, None))
+
+        return results
+
+
+class _Call(object):
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._res = None
+        self._err = None
+
+    def wait(self, timeout):
+        if timeout > 0:
+            self._done.wait(timeout)
+        return self._done.isSet()
+
+    def set(self, res, err):
+        self._res = res
+        self._err = err
+        self._done.set()
+
+    def result(self):
+        if self._err is not None:
+            raise self._err
+
+        return self._res
+
 
 class CrabRPCProxy(object):
+    """
+    Sends calls to a CrabRPCServer.
+
+    Several threads may call concurrently; a reader thread receives the
+    responses and hands them to the waiting callers by request id. Each call
+    has its own timeout. When the connection is lost, all pending calls
+    fail with Timeout.
+    """
     log = logging.getLogger("Storage.CrabRPCProxy")
 
-    def __init__(self, myRead, myWrite):
+    def __init__(self, myRead, myWrite, wireFormat=FORMAT_MARSHAL):
         self._myWrite = myWrite
         self._myRead = myRead
+        self._wireFormat = wireFormat
         misc.setNonBlocking(self._myWrite)
-        misc.setNonBlocking(self._myRead)
         self._poller = select.poll()
+        self._lock = threading.Lock()
+        self._writeLock = threading.Lock()
+        self._calls = {}
+        self._nextId = 0
+        self._connected = True
+        self._reader = threading.Thread(target=self._readResponses,
+                                        name="crab-rpc-reader")
+        self._reader.setDaemon(True)
+        self._reader.start()
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def pendingCalls(self):
+        return len(self._calls)
+
+    def _recvAll(self, rfile, length):
+        # Large responses are read directly into a single buffer
+        buf = bytearray(length)
+        view = memoryview(buf)
+        pos = 0
+        while pos < length:
+            try:
+                n = rfile.readinto(view[pos:])
+            except (IOError, OSError) as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if not n:
+                raise EOFError("Pipe broke")
+
+            pos += n
+
+        return buf
 
-    @contextmanager
-    def _poll(self, fd, events, timeout):
-        self._poller.register(fd, events)
+    def _readResponses(self):
+        rfile = io.FileIO(self._myRead, "r", closefd=False)
         try:
-            res = misc.NoIntrPoll(self._poller.poll, timeout)
-            for fd, event in res:
-                if event & (select.POLLERR | select.POLLHUP):
-                    raise Timeout()
+            while True:
+                rawLength = self._recvAll(rfile, LENGTH_STRUCT_LENGTH)
+                length = unpack(LENGTH_STRUCT_FMT, str(rawLength))[0]
+                reqId, res, err = decode(self._recvAll(rfile, length))[1]
+                with self._lock:
+                    call = self._calls.pop(reqId, None)
+
+                # The caller may have timed out already
+                if call is not None:
+                    call.set(res, err)
+        except EOFError:
+            pass
+        except:
+            # If for some reason the connection drops\gets out of sync we
+            # treat it as a timeout so we only have one error path
+            self.log.error("Problem with handler, treating as timeout",
+                           exc_info=True)
         finally:
-            self._poller.unregister(fd)
+            with self._lock:
+                self._connected = False
+                calls, self._calls = self._calls, {}
+
+            for call in calls.itervalues():
+                call.set(None, Timeout())
+
+            os.close(self._myRead)
+            self._myRead = None
 
-    def _recvAll(self, length, timeout):
-        startTime = time()
-        rawResponse = ""
-        while len(rawResponse) < length:
-            timeLeft = timeout - (time() - startTime)
+    def _sendAll(self, data, deadline):
+        l = 0
+        while l < len(data):
+            timeLeft = deadline - time()
             if timeLeft <= 0:
                 raise Timeout()
 
-            if not self._poll(self._myRead, select.POLLIN | select.POLLPRI,
-                              timeLeft):
-                raise Timeout()
+            self._poller.register(self._myWrite, select.POLLOUT)
+            try:
+                res = misc.NoIntrPoll(self._poller.poll, timeLeft * 1000)
+            finally:
+                self._poller.unregister(self._myWrite)
+
+            for fd, event in res:
+                if event & (select.POLLERR | select.POLLHUP):
+                    raise Timeout()
 
             try:
-                rawResponse += os.read(self._myRead, length - len(rawResponse))
+                l += os.write(self._myWrite, data[l:])
             except OSError as e:
                 if e.errno not in (errno.EAGAIN, errno.EINTR):
                     raise
 
-        return rawResponse
-
-    def _sendAll(self, data, timeout):
-        startTime = time()
-        l = 0
-        while l < len(data):
-            timeLeft = timeout - (time() - startTime)
-            if timeLeft <= 0:
-                raise Timeout()
-
-            if not self._poll(self._myWrite, select.POLLOUT,
-                              timeLeft):
+    def callCrabRPCFunction(self, timeout, name, *args, **kwargs):
+        deadline = time() + timeout
+        call = _Call()
+        with self._lock:
+            if not self._connected:
                 raise Timeout()
 
-            l += os.write(self._myWrite, data[l:])
-
-    def callCrabRPCFunction(self, timeout, name, *args, **kwargs):
-        request = pickle.dumps((name, args, kwargs))
-        self._sendAll(pack(LENGTH_STRUCT_FMT, len(request)), timeout)
-        self._sendAll(request, timeout)
+            reqId = self._nextId
+            self._nextId += 1
+            self._calls[reqId] = call
 
         try:
-            rawLength = self._recvAll(LENGTH_STRUCT_LENGTH, timeout)
-
-            length = unpack(LENGTH_STRUCT_FMT, rawLength)[0]
-            rawResponse = self._recvAll(length, timeout)
-        except Timeout:
-            raise
-        except:
-            # If for some reason the connection drops\gets out of sync we treat
-            # it as a timeout so we only have one error path
-            self.log.error("Problem with handler, treating as timeout",
-                           exc_info=True)
-            raise Timeout()
+            request = encode((reqId, name, args, kwargs), self._wireFormat)
+            with self._writeLock:
+                try:
+                    self._sendAll(pack(LENGTH_STRUCT_FMT, len(request)) +
+                                  request, deadline)
+                except Timeout:
+                    raise
+                except:
+                    self.log.error("Problem with handler, treating as "
+                                   "timeout", exc_info=True)
+                    raise Timeout()
 
-        res, err = pickle.loads(rawResponse)
-        if err is not None:
-            raise err
+            if not call.wait(deadline - time()):
+                raise Timeout()
+        finally:
+            with self._lock:
+                self._calls.pop(reqId, None)
 
-        return res
+        return call.result()
 
     def close(self):
         if not os:
             return
 
+        # The reader thread closes the read end when the server exits
         if self._myWrite is not None:
             os.close(self._myWrite)
             self._myWrite = None
 
-        if self._myRead is not None:
-            os.close(self._myRead)
-            self._myRead = None
-
     def __del__(self):
         self.close()
 
@@ -219,7 +374,7 @@ class CrabRPCProxy(object):
 class PoolHandler(object):
     log = logging.getLogger("Storage.RepoFileHelper.PoolHandler")
 
-    def __init__(self):
+    def __init__(self, wireFormat=FORMAT_MARSHAL):
         myRead, hisWrite = os.pipe()
         hisRead, myWrite = os.pipe()
 
@@ -234,7 +389,7 @@ class PoolHandler(object):
                                   str(hisRead), str(hisWrite)],
                                   close_fds=False, env=env)
 
-            self.proxy = CrabRPCProxy(myRead, myWrite)
+            self.proxy = CrabRPCProxy(myRead, myWrite, wireFormat)
 
         except:
             os.close(myWrite)
@@ -270,52 +425,139 @@ class PoolHandler(object):
 
 
 class RemoteFileHandlerPool(object):
+    """
+    A pool of up to numOfHandlers helper processes, each serving up to
+    callsPerHandler concurrent calls.
+
+    When all the helpers are busy, up to maxQueuedCalls callers wait for a
+    free helper, within the timeout of their call. A helper that timed out
+    is not given new calls, and is killed once its other calls are done.
+    """
     log = logging.getLogger("Storage.RemoteFileHandler")
 
-    def __init__(self, numOfHandlers):
+    def __init__(self, numOfHandlers, callsPerHandler=1, maxQueuedCalls=0):
         self._numOfHandlers = numOfHandlers
+        self._callsPerHandler = callsPerHandler
+        self._maxQueuedCalls = maxQueuedCalls
         self.handlers = [None] * numOfHandlers
-        self.occupied = [Lock() for i in xrange(numOfHandlers)]
+        # Number of calls in progress per handler, including retired
+        # handlers that still have calls in progress.
+        self._calls = {}
+        self._queued = 0
+        self._cond = threading.Condition(threading.Lock())
 
     def _isHandlerAvailable(self, poolHandler):
         if poolHandler is None:
             return False
 
-        return True
+        return poolHandler.proxy.connected
 
-    def callCrabRPCFunction(self, timeout, name, *args, **kwargs):
-        for i, isOccupied in enumerate(self.occupied):
-            if not isOccupied.acquire(False):
+    def _findHandler(self):
+        best = None
+        free = None
+        for i, handler in enumerate(self.handlers):
+            if not self._isHandlerAvailable(handler):
+                if free is None:
+                    free = i
                 continue
 
+            if best is None or self._calls[handler] < self._calls[best]:
+                best = handler
+
+        # Spread the calls on new helpers before pipelining them on busy
+        # helpers, so one stuck call does not delay the others.
+        if best is not None and self._calls[best] == 0:
+            return best
+
+        if free is not None:
+            handler = self.handlers[free]
+            if handler is not None:
+                # The helper died; it is stopped now unless calls are still
+                # in progress, in which case the last call stops it.
+                self._retire(handler)
+                if self._calls[handler] == 0:
+                    del self._calls[handler]
+                    self._stop(handler)
+            handler = self.handlers[free] = PoolHandler()
+            self._calls[handler] = 0
+            return handler
+
+        if best is not None and self._calls[best] < self._callsPerHandler:
+            return best
+
+        return None
+
+    def _acquire(self, deadline):
+        with self._cond:
+            queued = False
             try:
-                handler = self.handlers[i]
-                if not self._isHandlerAvailable(handler):
-                    handler = self.handlers[i] = PoolHandler()
-
-                return handler.proxy.callCrabRPCFunction(timeout, name,
-                                                         *args, **kwargs)
-            except Timeout:
-                try:
-                    self.handlers[i] = None
-                    handler.stop()
-                except:
-                    self.log.error("Could not signal stuck handler (PID:%d)",
-                                   handler.process.pid, exc_info=True)
-
+                while True:
+                    handler = self._findHandler()
+                    if handler is not None:
+                        self._calls[handler] += 1
+                        return handler
+
+                    if not queued:
+                        if self._queued >= self._maxQueuedCalls:
+                            raise Exception("No free file handlers in pool")
+                        self._queued += 1
+                        queued = True
+
+                    timeLeft = deadline - time()
+                    if timeLeft <= 0:
+                        raise Timeout()
+
+                    self._cond.wait(timeLeft)
+            finally:
+                if queued:
+                    self._queued -= 1
+
+    def _release(self, handler):
+        with self._cond:
+            self._calls[handler] -= 1
+            stop = (self._calls[handler] == 0 and
+                    handler not in self.handlers)
+            if stop:
+                del self._calls[handler]
+            self._cond.notify()
+
+        if stop:
+            self._stop(handler)
+
+    def _retire(self, handler):
+        # Called with the lock held
+        for i, h in enumerate(self.handlers):
+            if h is handler:
                 self.handlers[i] = None
-                raise
+                self._cond.notify()
 
-            finally:
-                isOccupied.release()
+    def _stop(self, handler):
+        try:
+            handler.stop()
+        except:
+            self.log.error("Could not signal stuck handler (PID:%d)",
+                           handler.process.pid, exc_info=True)
 
-        raise Exception("No free file handlers in pool")
+    def callCrabRPCFunction(self, timeout, name, *args, **kwargs):
+        deadline = time() + timeout
+        handler = self._acquire(deadline)
+        try:
+            return handler.proxy.callCrabRPCFunction(deadline - time(), name,
+                                                     *args, **kwargs)
+        except Timeout:
+            with self._cond:
+                self._retire(handler)
+            raise
+        finally:
+            self._release(handler)
 
     def close(self):
-        for handler in self.handlers:
-            if not self._isHandlerAvailable(handler):
-                continue
+        # Not locking, this is also called from __del__ during interpreter
+        # shutdown.
+        handlers = [h for h in self.handlers if h is not None]
+        handlers.extend(h for h in self._calls.keys() if h not in handlers)
 
+        for handler in handlers:
             handler.stop()
 
     def __del__(self):
@@ -332,6 +574,39 @@ def simpleWalk(top, topdown=True, onerror=None, followlinks=False):
     return filesList
 
 
+def statWalk(top):
+    """
+    Walk top and return (dirs, files) in one call, so listing a big tree
+    does not need a round trip per file:
+
+        dirs: [(path, st_mtime), ...] for top and every directory below it
+        files: [(path, st_size, st_ctime, qemuReadable), ...]
+
+    Files removed while walking are skipped.
+    """
+    gids = fileUtils.qemuGids()
+    dirs = []
+    files = []
+    for base, dirNames, fileNames in os.walk(top):
+        try:
+            dirs.append((base, os.stat(base).st_mtime))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            continue
+        for f in fileNames:
+            path = os.path.join(base, f)
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            files.append((path, st.st_size, st.st_ctime,
+                          fileUtils.isQemuReadable(st, gids)))
+    return dirs, files
+
+
 def directReadLines(path):
     with fileUtils.open_ex(path, "dr") as f:
         return f.readlines()
@@ -420,7 +695,8 @@ if __name__ == "__main__":
         try:
             server = CrabRPCServer(myRead, myWrite)
             for func in (writeLines, readLines, truncateFile, echo, sleep,
-                         directReadLines, simpleWalk, directTouch):
+                         directReadLines, simpleWalk, statWalk,
+                         directTouch):
 
                 server.registerFunction(func)
 
@@ -309,8 +309,9 @@ class StoragePool(object):
                 if (self.lvExtendPolicy == "ON"
                         and self.masterDomain.supportsMailbox):
                     self.masterDomain.prepareMailbox()
-                    self.spmMailer = storage_mailbox.SPM_MailMonitor(self,
-                                                                     maxHostID)
+                    self.spmMailer = storage_mailbox.SPM_MailMonitor(
+                        self, maxHostID, config.getfloat(
+                            'irs', 'mailbox_monitor_interval'))
                     self.spmMailer.registerMessageType('xtnd', partial(
                         storage_mailbox.SPM_Extend_Message.processRequest,
                         self))
@@ -457,7 +458,9 @@ class StoragePool(object):
 
         if (self.lvExtendPolicy == "ON" and
                 self.masterDomain.supportsMailbox):
-            self.hsmMailer = storage_mailbox.HSM_Mailbox(self.id, self.spUUID)
+            self.hsmMailer = storage_mailbox.HSM_Mailbox(
+                self.id, self.spUUID,
+                config.getfloat('irs', 'mailbox_monitor_interval'))
             self.log.debug("HSM mailbox ready for pool %s on master "
                            "domain %s", self.spUUID, self.masterDomain.sdUUID)
 
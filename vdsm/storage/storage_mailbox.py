@@ -25,17 +25,16 @@ import time
 import threading
 import Queue
 import struct
-import signal
 import logging
 
 import uuid
 from vdsm.config import config
 import sd
 import misc
+import directio
 import task
 from threadPool import ThreadPool
 from storage_exception import InvalidParameterException
-from vdsm import constants
 
 __author__ = "ayalb"
 __date__ = "$Mar 9, 2009 5:25:07 PM$"
@@ -79,11 +78,6 @@ def runTask(args):
     ctask.prepare(cmd, *args)
 
 
-def _mboxExecCmd(*args, **kwargs):
-    kwargs['deathSignal'] = signal.SIGKILL
-    return misc.execCmd(*args, **kwargs)
-
-
 class SPM_Extend_Message:
 
     log = logging.getLogger('Storage.SPM.Messages.Extend')
@@ -244,25 +238,13 @@ class HSM_MailMonitor(threading.Thread):
         self._monitorInterval = monitorInterval
         self._hostID = int(hostID)
         self._used_slots_array = [0] * MESSAGES_PER_MAILBOX
-        self._outgoingMail = EMPTYMAILBOX
+        self._outgoingMail = bytearray(EMPTYMAILBOX)
         self._incomingMail = EMPTYMAILBOX
         # TODO: add support for multiple paths (multiple mailboxes)
         self._spmStorageDir = config.get('irs', 'repository')
-        self._inCmd = [constants.EXT_DD,
-                       'if=' + str(inbox),
-                       'iflag=direct,fullblock',
-                       'bs=' + str(BLOCK_SIZE),
-                       'count=' + str(BLOCKS_PER_MAILBOX),
-                       'skip=' + str(self._hostID * BLOCKS_PER_MAILBOX)
-                       ]
-        self._outCmd = [constants.EXT_DD,
-                        'of=' + str(outbox),
-                        'iflag=fullblock',
-                        'oflag=direct',
-                        'conv=notrunc',
-                        'bs=' + str(BLOCK_SIZE),
-                        'seek=' + str(self._hostID * BLOCKS_PER_MAILBOX)
-                        ]
+        self._mailboxOffset = self._hostID * MAILBOX_SIZE
+        self._inFile = directio.DirectFile(inbox, "r")
+        self._outFile = directio.DirectFile(outbox, "r+")
         self._init = False
         self._initMailbox()  # Read initial mailbox state
         self._msgCounter = 0
@@ -273,14 +255,20 @@ class HSM_MailMonitor(threading.Thread):
 
     def _initMailbox(self):
         # Sync initial incoming mail state with storage view
-        (rc, out, err) = _mboxExecCmd(self._inCmd, raw=True)
-        if rc == 0:
-            self._incomingMail = out
+        try:
+            self._incomingMail = self._readMailbox()
             self._init = True
-        else:
+        except (IOError, OSError, RuntimeError):
             self.log.warning("HSM_MailboxMonitor - Could not initialize "
                              "mailbox, will not accept requests until init "
-                             "succeeds")
+                             "succeeds", exc_info=True)
+
+    def _readMailbox(self):
+        in_mail = self._inFile.read(self._mailboxOffset, MAILBOX_SIZE)
+        if (len(in_mail) != MAILBOX_SIZE):
+            raise RuntimeError("_handleResponses.Could not read mailbox - len "
+                               "%s != %s" % (len(in_mail), MAILBOX_SIZE))
+        return in_mail
 
     def immStop(self):
         self._stop = True
@@ -304,13 +292,9 @@ class HSM_MailMonitor(threading.Thread):
             if newMsgs[start] in ['\0', '0']:
                 continue
 
-            for j in range(start, start + MESSAGE_SIZE):
-                if newMsgs[j] != self._incomingMail[j]:
-                    break
-
-            # If search exhausted then message hasn't changed since last read
-            # and can be skipped
-            if j == (start + MESSAGE_SIZE - 1):
+            # If message hasn't changed since last read it can be skipped
+            if (buffer(newMsgs, start, MESSAGE_SIZE) ==
+                    buffer(self._incomingMail, start, MESSAGE_SIZE)):
                 continue
 
             #
@@ -326,15 +310,13 @@ class HSM_MailMonitor(threading.Thread):
                 del self._activeMessages[i]
                 self._used_slots_array[i] = 0
                 self._msgCounter -= 1
-                self._outgoingMail = self._outgoingMail[0:start] + \
-                    MESSAGE_SIZE * "\0" + self._outgoingMail[start +
-                                                             MESSAGE_SIZE:]
+                self._outgoingMail[start:start + MESSAGE_SIZE] = \
+                    MESSAGE_SIZE * "\0"
                 continue
 
             msg = self._activeMessages[i]
             self._activeMessages[i] = CLEAN_MESSAGE
-            self._outgoingMail = self._outgoingMail[0:start] + \
-                CLEAN_MESSAGE + self._outgoingMail[start + MESSAGE_SIZE:]
+            self._outgoingMail[start:start + MESSAGE_SIZE] = CLEAN_MESSAGE
 
             try:
                 self.log.debug("HSM_MailboxMonitor(%s/%s) - Checking reply: "
@@ -369,27 +351,23 @@ class HSM_MailMonitor(threading.Thread):
 
     def _checkForMail(self):
         # self.log.debug("HSM_MailMonitor - checking for mail")
-        # self.log.debug("Running command: " + str(self._inCmd))
-        (rc, in_mail, err) = misc.execCmd(self._inCmd, raw=True)
-        if rc:
-            raise RuntimeError("_handleResponses.Could not read mailbox - rc "
-                               "%s" % rc)
-        if (len(in_mail) != MAILBOX_SIZE):
-            raise RuntimeError("_handleResponses.Could not read mailbox - len "
-                               "%s != %s" % (len(in_mail), MAILBOX_SIZE))
+        in_mail = self._readMailbox()
         # self.log.debug("Parsing inbox content: %s", in_mail)
         return self._handleResponses(in_mail)
 
     def _sendMail(self):
-        self.log.info("HSM_MailMonitor sending mail to SPM - " +
-                      str(self._outCmd))
-        chk = misc.checksum(
-            self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES],
-            CHECKSUM_BYTES)
+        self.log.info("HSM_MailMonitor sending mail to SPM - %s at offset "
+                      "%s", self._outFile.name, self._mailboxOffset)
+        chkStart = MAILBOX_SIZE - CHECKSUM_BYTES
+        chk = misc.checksum(buffer(self._outgoingMail, 0, chkStart),
+                            CHECKSUM_BYTES)
         pChk = struct.pack('<l', chk)  # Assumes CHECKSUM_BYTES equals 4!!!
-        self._outgoingMail = \
-            self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES] + pChk
-        _mboxExecCmd(self._outCmd, data=self._outgoingMail)
+        self._outgoingMail[chkStart:] = pChk
+        try:
+            self._outFile.write(self._mailboxOffset, self._outgoingMail)
+        except (IOError, OSError):
+            self.log.error("HSM_MailMonitor - Could not write outgoing mail",
+                           exc_info=True)
 
     def _handleMessage(self, message):
         # TODO: add support for multiple mailboxes
@@ -399,12 +377,8 @@ class HSM_MailMonitor(threading.Thread):
                 if not freeSlot:
                     freeSlot = i
                 continue
-            duplicate = True
-            for j in range(0, MESSAGE_SIZE):
-                if message[j] != self._activeMessages[i][j]:
-                    duplicate = False
-                    break
-            if duplicate:
+            if message[0:MESSAGE_SIZE] == \
+                    self._activeMessages[i][0:MESSAGE_SIZE]:
                 self.log.debug("HSM_MailMonitor - ignoring duplicate message "
                                "%s" % (repr(message)))
                 return
@@ -417,8 +391,7 @@ class HSM_MailMonitor(threading.Thread):
         self._activeMessages[freeSlot] = message
         start = freeSlot * MESSAGE_SIZE
         end = start + MESSAGE_SIZE
-        self._outgoingMail = self._outgoingMail[0:start] + message.payload + \
-            self._outgoingMail[end:]
+        self._outgoingMail[start:end] = message.payload
         self.log.debug("HSM_MailMonitor - start: %s, end: %s, len: %s, "
                        "message(%s/%s): %s" %
                        (start, end, len(self._outgoingMail), self._msgCounter,
@@ -508,8 +481,10 @@ class HSM_MailMonitor(threading.Thread):
         finally:
             self.log.info("HSM_MailboxMonitor - Incoming mail monitoring "
                           "thread stopped, clearing outgoing mail")
-            self._outgoingMail = EMPTYMAILBOX
+            self._outgoingMail = bytearray(EMPTYMAILBOX)
             self._sendMail()  # Clear outgoing mailbox
+            self._inFile.close()
+            self._outFile.close()
 
 
 class SPM_MailMonitor:
@@ -553,30 +528,24 @@ class SPM_MailMonitor:
         self._outMailLen = MAILBOX_SIZE * self._numHosts
         self._monitorInterval = monitorInterval
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._outgoingMail = self._outMailLen * "\0"
-        self._incomingMail = self._outgoingMail
-        self._inCmd = ['dd',
-                       'if=' + str(self._inbox),
-                       'iflag=direct,fullblock',
-                       'count=1'
-                       ]
-        self._outCmd = ['dd',
-                        'of=' + str(self._outbox),
-                        'oflag=direct',
-                        'iflag=fullblock',
-                        'conv=notrunc',
-                        'count=1'
-                        ]
+        self._outgoingMail = bytearray(self._outMailLen)
+        self._incomingMail = bytearray(self._outMailLen)
+        # Set when writing the outgoing mail failed, to retry on the next
+        # check even if no mailbox has changed
+        self._sendPending = False
+        self._inFile = directio.DirectFile(self._inbox, "r")
+        self._outFile = directio.DirectFile(self._outbox, "r+")
         self._outLock = thread.allocate_lock()
         self._inLock = thread.allocate_lock()
         # Clear outgoing mail
-        self.log.debug("SPM_MailMonitor - clearing outgoing mail, command is: "
-                       "%s", self._outCmd)
-        cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-        (rc, out, err) = _mboxExecCmd(cmd, data=self._outgoingMail)
-        if rc:
-            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail, "
-                             "dd failed")
+        self.log.debug("SPM_MailMonitor - clearing outgoing mail %s",
+                       self._outbox)
+        try:
+            self._outFile.write(0, self._outgoingMail)
+        except (IOError, OSError):
+            self._sendPending = True
+            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail",
+                             exc_info=True)
 
         thread.start_new_thread(self.run, (self, ))
         self.log.debug('SPM_MailMonitor created for pool %s' % self._poolID)
@@ -593,17 +562,16 @@ class SPM_MailMonitor:
     def setMaxHostID(self, newMaxId):
         self._inLock.acquire()
         self._outLock.acquire()
-        diff = newMaxId - self._numHosts
-        if diff > 0:
-            delta = MAILBOX_SIZE * diff * "\0"
+        newLen = MAILBOX_SIZE * newMaxId
+        if newLen > self._outMailLen:
+            delta = bytearray(newLen - self._outMailLen)
             self._outgoingMail += delta
             self._incomingMail += delta
-        elif diff < 0:
-            delta = MAILBOX_SIZE * diff
-            self._outgoingMail = self._outgoingMail[:-delta]
-            self._incomingMail = self._incomingMail[:-delta]
+        else:
+            del self._outgoingMail[newLen:]
+            del self._incomingMail[newLen:]
         self._numHosts = newMaxId
-        self._outMailLen = MAILBOX_SIZE * self._numHosts
+        self._outMailLen = newLen
         self._outLock.release()
         self._inLock.release()
 
@@ -624,100 +592,94 @@ class SPM_MailMonitor:
 
         send = False
 
-        # run through all messages and check if new messages have arrived
-        # (since last read)
+        # run through all mailboxes and check if new messages have arrived
+        # (since last read).  Most mailboxes do not change between reads, so
+        # a mailbox identical to the last read is skipped without looking at
+        # its messages.  The checksum cannot be used for this, since it is a
+        # plain sum of the bytes and does not change when messages are moved
+        # between slots.
         for host in range(0, self._numHosts):
-            # Check mailbox checksum
             mailboxStart = host * MAILBOX_SIZE
+            if (buffer(newMail, mailboxStart, MAILBOX_SIZE) ==
+                    buffer(self._incomingMail, mailboxStart, MAILBOX_SIZE)):
+                continue
+            mailbox = newMail[mailboxStart:mailboxStart + MAILBOX_SIZE]
+            mailbox, hostSend = self._handleMailbox(host, mailbox)
+            self._incomingMail[mailboxStart:
+                               mailboxStart + MAILBOX_SIZE] = mailbox
+            send |= hostSend
 
-            isMailboxValidated = False
-
-            for i in range(0, MESSAGES_PER_MAILBOX):
-
-                msgId = host * SLOTS_PER_MAILBOX + i
-                msgStart = msgId * MESSAGE_SIZE
-
-                # First byte of message is message version.  Check message
-                # version, if 0 then message is empty and can be skipped
-                if newMail[msgStart] in ['\0', '0']:
-                    continue
-
-                # Most mailboxes are probably empty so it costs less to check
-                # that all messages start with 0 than to validate the mailbox,
-                # therefor this is done after we find a non empty message in
-                # mailbox
-                if not isMailboxValidated:
-                    if not self._validateMailbox(
-                            newMail[mailboxStart:mailboxStart + MAILBOX_SIZE],
-                            host):
-                        # Cleaning invalid mbx in newMail
-                        newMail = newMail[:mailboxStart] + EMPTYMAILBOX + \
-                            newMail[mailboxStart + MAILBOX_SIZE:]
-                        break
-                    self.log.debug("SPM_MailMonitor: Mailbox %s validated, "
-                                   "checking mail", host)
-                    isMailboxValidated = True
-
-                newMsg = newMail[msgStart:msgStart + MESSAGE_SIZE]
-                msgOffset = msgId * MESSAGE_SIZE
-                if newMsg == CLEAN_MESSAGE:
-                    # Should probably put a setter on outgoingMail which would
-                    # take the lock
-                    self._outLock.acquire()
-                    try:
-                        self._outgoingMail = \
-                            self._outgoingMail[0:msgOffset] + CLEAN_MESSAGE + \
-                            self._outgoingMail[msgOffset + MESSAGE_SIZE:
-                                               self._outMailLen]
-                    finally:
-                        self._outLock.release()
-                    send = True
-                    continue
-
-                # Message isn't empty, check if its new
-                isMessageNew = False
-                for j in range(msgStart, msgStart + MESSAGE_SIZE):
-                    if newMail[j] != self._incomingMail[j]:
-                        isMessageNew = True
-                        break
+        return send
 
-                # If search exhausted, i.e. message hasn't changed since last
-                # read, it can be skipped
-                if not isMessageNew:
-                    continue
+    def _handleMailbox(self, host, mailbox):
+        send = False
+        isMailboxValidated = False
 
-                # We only get here if there is a novel request
-                try:
-                    msgType = newMail[msgStart + 1:msgStart + 5]
-                    if msgType in self._messageTypes:
-                        # Use message class to process request according to
-                        # message specific logic
-                        id = str(uuid.uuid4())
-                        self.log.debug("SPM_MailMonitor: processing request: "
-                                       "%s" % repr(newMail[
-                                           msgStart:msgStart + MESSAGE_SIZE]))
-                        res = self.tp.queueTask(
-                            id, runTask, (self._messageTypes[msgType], msgId,
-                                          newMail[msgStart:
-                                                  msgStart + MESSAGE_SIZE])
-                        )
-                        if not res:
-                            raise Exception()
-                    else:
-                        self.log.error("SPM_MailMonitor: unknown message type "
-                                       "encountered: %s", msgType)
-                except RuntimeError as e:
-                    self.log.error("SPM_MailMonitor: exception: %s caught "
-                                   "while handling message: %s", str(e),
-                                   newMail[msgStart:msgStart + MESSAGE_SIZE])
-                except:
-                    self.log.error("SPM_MailMonitor: exception caught while "
-                                   "handling message: %s",
-                                   newMail[msgStart:msgStart + MESSAGE_SIZE],
-                                   exc_info=True)
+        for i in range(0, MESSAGES_PER_MAILBOX):
 
-        self._incomingMail = newMail
-        return send
+            msgStart = i * MESSAGE_SIZE
+
+            # First byte of message is message version.  Check message
+            # version, if 0 then message is empty and can be skipped
+            if mailbox[msgStart] in ['\0', '0']:
+                continue
+
+            # Most mailboxes are probably empty so it costs less to check
+            # that all messages start with 0 than to validate the mailbox,
+            # therefor this is done after we find a non empty message in
+            # mailbox
+            if not isMailboxValidated:
+                if not self._validateMailbox(mailbox, host):
+                    # Cleaning invalid mbx
+                    mailbox = EMPTYMAILBOX
+                    break
+                self.log.debug("SPM_MailMonitor: Mailbox %s validated, "
+                               "checking mail", host)
+                isMailboxValidated = True
+
+            msgId = host * SLOTS_PER_MAILBOX + i
+            msgOffset = msgId * MESSAGE_SIZE
+            newMsg = mailbox[msgStart:msgStart + MESSAGE_SIZE]
+            if newMsg == CLEAN_MESSAGE:
+                # Should probably put a setter on outgoingMail which would
+                # take the lock
+                with self._outLock:
+                    self._outgoingMail[msgOffset:
+                                       msgOffset + MESSAGE_SIZE] = newMsg
+                send = True
+                continue
+
+            # Message isn't empty, check if its new
+            if (buffer(self._incomingMail, msgOffset, MESSAGE_SIZE) ==
+                    buffer(newMsg)):
+                continue
+
+            # We only get here if there is a novel request
+            try:
+                msgType = newMsg[1:5]
+                if msgType in self._messageTypes:
+                    # Use message class to process request according to
+                    # message specific logic
+                    id = str(uuid.uuid4())
+                    self.log.debug("SPM_MailMonitor: processing request: "
+                                   "%s" % repr(newMsg))
+                    res = self.tp.queueTask(
+                        id, runTask, (self._messageTypes[msgType], msgId,
+                                      newMsg)
+                    )
+                    if not res:
+                        raise Exception()
+                else:
+                    self.log.error("SPM_MailMonitor: unknown message type "
+                                   "encountered: %s", msgType)
+            except RuntimeError as e:
+                self.log.error("SPM_MailMonitor: exception: %s caught "
+                               "while handling message: %s", str(e), newMsg)
+            except:
+                self.log.error("SPM_MailMonitor: exception caught while "
+                               "handling message: %s", newMsg, exc_info=True)
+
+        return mailbox, send
 
     def _checkForMail(self):
         # Lock is acquired in order to make sure that neither _numHosts nor
@@ -725,31 +687,30 @@ class SPM_MailMonitor:
         self._inLock.acquire()
         try:
             # self.log.debug("SPM_MailMonitor -_checking for mail")
-            cmd = self._inCmd + ['bs=' + str(self._outMailLen)]
-            # self.log.debug("SPM_MailMonitor - reading incoming mail, "
-            #               "command: " + str(cmd))
-            (rc, in_mail, err) = misc.execCmd(cmd, raw=True)
-            if rc:
+            try:
+                in_mail = self._inFile.read(0, self._outMailLen)
+            except (IOError, OSError) as e:
                 raise IOError(errno.EIO, "_handleRequests._checkForMail - "
-                              "Could not read mailbox: %s" % self._inbox)
+                              "Could not read mailbox: %s: %s" %
+                              (self._inbox, e))
 
             if (len(in_mail) != (self._outMailLen)):
-                self.log.error('SPM_MailMonitor: _checkForMail - dd succeeded '
-                               'but read %d bytes instead of %d, cannot check '
+                self.log.error('SPM_MailMonitor: _checkForMail - read '
+                               '%d bytes instead of %d, cannot check '
                                'mail.  Read mail contains: %s', len(in_mail),
                                self._outMailLen, repr(in_mail[:80]))
                 raise RuntimeError("_handleRequests._checkForMail - Could not "
                                    "read mailbox")
             # self.log.debug("Parsing inbox content: %s", in_mail)
-            if self._handleRequests(in_mail):
+            if self._handleRequests(in_mail) or self._sendPending:
                 self._outLock.acquire()
                 try:
-                    cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-                    (rc, out, err) = _mboxExecCmd(cmd,
-                                                  data=self._outgoingMail)
-                    if rc:
-                        self.log.warning("SPM_MailMonitor couldn't write "
-                                         "outgoing mail, dd failed")
+                    self._outFile.write(0, self._outgoingMail)
+                    self._sendPending = False
+                except (IOError, OSError):
+                    self._sendPending = True
+                    self.log.warning("SPM_MailMonitor couldn't write "
+                                     "outgoing mail", exc_info=True)
                 finally:
                     self._outLock.release()
         finally:
@@ -761,20 +722,17 @@ class SPM_MailMonitor:
         self._outLock.acquire()
         try:
             msgOffset = msgID * MESSAGE_SIZE
-            self._outgoingMail = \
-                self._outgoingMail[0:msgOffset] + msg.payload + \
-                self._outgoingMail[msgOffset + MESSAGE_SIZE:self._outMailLen]
+            self._outgoingMail[msgOffset:msgOffset + MESSAGE_SIZE] = \
+                msg.payload
             mailboxOffset = (msgID / SLOTS_PER_MAILBOX) * MAILBOX_SIZE
             mailbox = self._outgoingMail[mailboxOffset:
                                          mailboxOffset + MAILBOX_SIZE]
-            cmd = self._outCmd + ['bs=' + str(MAILBOX_SIZE),
-                                  'seek=' + str(mailboxOffset / MAILBOX_SIZE)]
-            # self.log.debug("Running command: %s, for message id: %s",
-            #               str(cmd), str(msgID))
-            (rc, out, err) = _mboxExecCmd(cmd, data=mailbox)
-            if rc:
+            try:
+                self._outFile.write(mailboxOffset, mailbox)
+            except (IOError, OSError):
+                self._sendPending = True
                 self.log.error("SPM_MailMonitor: sendReply - couldn't send "
-                               "reply, dd failed")
+                               "reply", exc_info=True)
         finally:
             self._outLock.release()
 
@@ -791,5 +749,7 @@ class SPM_MailMonitor:
         finally:
             self._stopped = True
             self.tp.joinAll(waitForTasks=False)
+            self._inFile.close()
+            self._outFile.close()
             self.log.info("SPM_MailMonitor - Incoming mail monitoring thread "
                           "stopped")
@@ -0,0 +1,174 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+Kernel uevents monitoring
+
+Listens to the uevents broadcast by the kernel on the NETLINK_KOBJECT_UEVENT
+netlink socket and passes them to the registered callbacks.
+"""
+
+import errno
+import logging
+import socket
+import threading
+
+from vdsm import utils
+
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of the events sent by the kernel (udev re-broadcasts them
+# on group 2 using its own format)
+KERNEL_GROUP = 1
+
+RCVBUF_SIZE = 1024 * 1024
+RECV_SIZE = 8192
+STOP_POLL_INTERVAL = 1
+
+# Keys used in uevents
+ACTION = "ACTION"
+DEVPATH = "DEVPATH"
+DEVNAME = "DEVNAME"
+SUBSYSTEM = "SUBSYSTEM"
+DM_NAME = "DM_NAME"
+DM_UUID = "DM_UUID"
+
+# Actions
+ADD = "add"
+CHANGE = "change"
+REMOVE = "remove"
+
+log = logging.getLogger("Storage.Uevent")
+
+
+def parse(data):
+    """
+    Parse a kernel uevent message, "action@devpath" followed by KEY=VALUE
+    pairs, all separated by null characters.
+
+    Returns a dict of the event keys, or None if the message is not a kernel
+    uevent.
+    """
+    header, sep, body = data.partition("\0")
+    if "@" not in header:
+        return None
+
+    event = {}
+    for item in body.split("\0"):
+        key, sep, value = item.partition("=")
+        if sep:
+            event[key] = value
+
+    if ACTION not in event:
+        event[ACTION] = header.partition("@")[0]
+
+    return event
+
+
+class UeventMonitor(object):
+    """
+    Thread reading the kernel uevents.
+
+    Callbacks are called from the monitor thread with the event dict. When
+    the kernel drops events because the socket buffer is full, callbacks are
+    called with None, and must assume that anything may have changed.
+    """
+
+    def __init__(self, subsystems=None):
+        self._subsystems = frozenset(subsystems) if subsystems else None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._stopEvent.set()
+        self._sock = None
+
+    def register(self, func):
+        with self._lock:
+            self._callbacks.append(func)
+
+    def unregister(self, func):
+        with self._lock:
+            self._callbacks.remove(func)
+
+    @property
+    def running(self):
+        return not self._stopEvent.isSet()
+
+    def start(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                             NETLINK_KOBJECT_UEVENT)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+            sock.bind((0, KERNEL_GROUP))
+            sock.settimeout(STOP_POLL_INTERVAL)
+        except:
+            sock.close()
+            raise
+
+        self._sock = sock
+        self._stopEvent.clear()
+        t = threading.Thread(target=self._run, name="uevent-monitor")
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        self._stopEvent.set()
+
+    def _dispatch(self, event):
+        with self._lock:
+            callbacks = list(self._callbacks)
+
+        for func in callbacks:
+            try:
+                func(event)
+            except Exception:
+                log.error("Uevent callback %s failed", func, exc_info=True)
+
+    @utils.traceback(on=log.name)
+    def _run(self):
+        log.debug("Uevent monitor started")
+        try:
+            while not self._stopEvent.isSet():
+                try:
+                    data = self._sock.recv(RECV_SIZE)
+                except socket.timeout:
+                    continue
+                except socket.error as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    if e.errno == errno.ENOBUFS:
+                        log.warning("Uevents were lost, socket buffer full")
+                        self._dispatch(None)
+                        continue
+                    raise
+
+                event = parse(data)
+                if event is None:
+                    continue
+
+                if (self._subsystems is not None and
+                        event.get(SUBSYSTEM) not in self._subsystems):
+                    continue
+
+                self._dispatch(event)
+        finally:
+            self._sock.close()
+            self._sock = None
+            self._stopEvent.set()
+            log.debug("Uevent monitor stopped")
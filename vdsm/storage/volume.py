@@ -800,6 +800,14 @@ class Volume(object):
         """
         pass
 
+    @classmethod
+    def invalidateMetadataCache(cls, sdUUID):
+        """
+        Drop the cached metadata of the volumes of the domain, so a flow
+        starting now sees the changes made by other hosts.
+        """
+        pass
+
     def metadata2info(self, meta):
         return {
             "uuid": self.volUUID,
@@ -30,12 +30,15 @@ import threading
 import os
 import time
 import logging
-import errno
 import ethtool
-import re
+import Queue
+import array
+import itertools
 
 from vdsm import utils
+from vdsm.config import config
 from vdsm import netinfo
+from vdsm import netlink
 from vdsm.ipwrapper import getLinks
 from vdsm.constants import P_VDSM_RUN
 
@@ -52,62 +55,22 @@ class InterfaceSample:
 
     The sample is set at the time of initialization and can't be updated.
     """
-    def readIfaceStat(self, ifid, stat):
+    def __init__(self, link):
         """
-        Get and interface's stat.
+        Initialize an InterfaceSample.
 
-        .. note::
-            Really ugly implementation; from time to time, Linux returns an
-            empty line. TODO: understand why this happens and fix it!
-
-        :param ifid: The ID of the interface you want to query.
-        :param stat: The type of statistic you want get.
-
-        :returns: The value of the statistic you asked for.
-        :type: int
+        :param link: The statistics of the interface, as returned by
+                     :func:`vdsm.netlink.iter_links_stats`.
+        :type link: dict
         """
-        f = '/sys/class/net/%s/statistics/%s' % (ifid, stat)
-        tries = 5
-        while tries:
-            tries -= 1
-            try:
-                s = file(f).read()
-            except IOError as e:
-                # silently ignore missing wifi stats
-                if e.errno != errno.ENOENT:
-                    logging.debug("Could not read %s", f, exc_info=True)
-                return 0
-            try:
-                return int(s)
-            except:
-                if s != '':
-                    logging.warning("Could not parse statistics (%s) from %s",
-                                    f, s, exc_info=True)
-                logging.debug('bad %s: (%s)', f, s)
-                if not tries:
-                    raise
-
-    def readIfaceOperstate(self, ifid):
-        """
-        Return the operational state of the interface.
-
-        :returns: ``'up'`` if interface is up. ``'down'`` or ``0`` id it's
-                  down.
-        """
-        try:
-            flags = ethtool.get_flags(ifid)
-        except IOError:
-            return '0'
-        return 'up' if flags & ethtool.IFF_RUNNING else 'down'
-
-    def __init__(self, ifid):
-        self.rx = self.readIfaceStat(ifid, 'rx_bytes')
-        self.tx = self.readIfaceStat(ifid, 'tx_bytes')
-        self.rxDropped = self.readIfaceStat(ifid, 'rx_dropped')
-        self.txDropped = self.readIfaceStat(ifid, 'tx_dropped')
-        self.rxErrors = self.readIfaceStat(ifid, 'rx_errors')
-        self.txErrors = self.readIfaceStat(ifid, 'tx_errors')
-        self.operstate = self.readIfaceOperstate(ifid)
+        self.rx = link['rx_bytes']
+        self.tx = link['tx_bytes']
+        self.rxDropped = link['rx_dropped']
+        self.txDropped = link['tx_dropped']
+        self.rxErrors = link['rx_errors']
+        self.txErrors = link['tx_errors']
+        self.operstate = ('up' if link['flags'] & ethtool.IFF_RUNNING
+                          else 'down')
 
 
 class TotalCpuSample:
@@ -116,9 +79,12 @@ class TotalCpuSample:
 
     The sample is taken at initialization time and can't be updated.
     """
-    def __init__(self):
+    def __init__(self, procStat):
+        """
+        :param procStat: The content of /proc/stat.
+        """
         self.user, userNice, self.sys, self.idle = \
-            map(int, file('/proc/stat').readline().split()[1:5])
+            map(int, procStat.split(None, 5)[1:5])
         self.user += userNice
 
 
@@ -126,29 +92,25 @@ class CpuCoreSample:
     """
     A sample of the CPU consumption of each core
 
-    The sample is taken at initialization time and can't be updated.
+    The sample is taken at initialization time and can't be updated. The
+    counters of the core coreIds[i] are user[i] and sys[i].
     """
-    CPU_CORE_STATS_PATTERN = re.compile(r'cpu(\d+)\s+(.*)')
-
-    def __init__(self):
-        self.coresSample = {}
-        with open('/proc/stat') as src:
-            for line in src:
-                match = self.CPU_CORE_STATS_PATTERN.match(line)
-                if match:
-                    coreSample = {}
-                    user, userNice, sys, idle = \
-                        map(int, match.group(2).split()[0:4])
-                    coreSample['user'] = user
-                    coreSample['userNice'] = userNice
-                    coreSample['sys'] = sys
-                    coreSample['idle'] = idle
-                    self.coresSample[match.group(1)] = coreSample
-
-    def getCoreSample(self, coreId):
-        strCoreId = str(coreId)
-        if strCoreId in self.coresSample:
-            return self.coresSample[strCoreId]
+    def __init__(self, procStat):
+        """
+        :param procStat: The content of /proc/stat.
+        """
+        self.coreIds = array.array('i')
+        self.user = array.array('d')
+        self.sys = array.array('d')
+        lines = procStat.splitlines()
+        # The first line is the total, followed by a line per core
+        for line in itertools.islice(lines, 1, None):
+            if not line.startswith('cpu'):
+                break
+            name, user, userNice, sys = line.split(None, 4)[:4]
+            self.coreIds.append(int(name[3:]))
+            self.user.append(int(user))
+            self.sys.append(int(sys))
 
 
 class NumaNodeMemorySample:
@@ -180,7 +142,7 @@ class PidCpuSample:
     """
     def __init__(self, pid):
         self.user, self.sys = \
-            map(int, file('/proc/%s/stat' % pid).read().split()[13:15])
+            map(int, _procFile('/proc/%s/stat' % pid).read().split()[13:15])
 
 
 class TimedSample:
@@ -192,15 +154,25 @@ class BaseSample(TimedSample):
     """
     A sample of the statistics for a process.
     """
-    def __init__(self, pid, ifids):
+    def __init__(self, pid, links):
         TimedSample.__init__(self)
         self.interfaces = {}
-        for ifid in ifids:
-            self.interfaces[ifid] = InterfaceSample(ifid)
+        for link in links:
+            self.interfaces[link['name']] = InterfaceSample(link)
         self.pidcpu = PidCpuSample(pid)
 
 
 _PROC_STAT_PATH = '/proc/stat'
+_PROC_LOADAVG_PATH = '/proc/loadavg'
+
+
+@utils.memoized
+def _procFile(path):
+    """
+    Return a utils.ProcFile kept open for path, to read the files sampled
+    periodically without opening them every time.
+    """
+    return utils.ProcFile(path)
 
 
 def getBootTime():
@@ -241,34 +213,35 @@ class HostSample(BaseSample):
             d[p] = {'free': str(free)}
         return d
 
-    def __init__(self, pid, ifids):
+    def __init__(self, pid, links):
         """
         Initialize a HostSample.
 
         :param pid: The PID of this vdsm host.
         :type pid: int
-        :param ifids: The IDs of the interfaces you want to sample.
+        :param links: The statistics of the interfaces you want to sample,
+                      as returned by :func:`vdsm.netlink.iter_links_stats`.
         :type: list
         """
-        BaseSample.__init__(self, pid, ifids)
-        self.totcpu = TotalCpuSample()
+        BaseSample.__init__(self, pid, links)
+        procStat = _procFile(_PROC_STAT_PATH).read()
+        self.totcpu = TotalCpuSample(procStat)
         meminfo = utils.readMemInfo()
         freeOrCached = (meminfo['MemFree'] +
                         meminfo['Cached'] + meminfo['Buffers'])
         self.memUsed = 100 - int(100.0 * (freeOrCached) / meminfo['MemTotal'])
         self.anonHugePages = meminfo.get('AnonHugePages', 0) / 1024
         try:
-            self.cpuLoad = file('/proc/loadavg').read().split()[1]
+            self.cpuLoad = _procFile(_PROC_LOADAVG_PATH).read().split()[1]
         except:
             self.cpuLoad = '0.0'
         self.diskStats = self._getDiskStats()
         try:
-            with file(_THP_STATE_PATH) as f:
-                s = f.read()
-                self.thpState = s[s.index('[') + 1:s.index(']')]
+            s = _procFile(_THP_STATE_PATH).read()
+            self.thpState = s[s.index('[') + 1:s.index(']')]
         except:
             self.thpState = 'never'
-        self.cpuCores = CpuCoreSample()
+        self.cpuCores = CpuCoreSample(procStat)
         self.numaNodeMem = NumaNodeMemorySample()
 
 
@@ -284,6 +257,7 @@ class AdvancedStatsFunction(object):
         self._window = window
         self._timefn = timefn
         self._sample = []
+        self._sampleCount = 0
 
         if not isinstance(interval, int) or interval < 1:
             raise ValueError("interval must be int and greater than 0")
@@ -294,6 +268,13 @@ class AdvancedStatsFunction(object):
     def interval(self):
         return self._interval
 
+    @property
+    def sampleCount(self):
+        """
+        The number of samples stored so far.
+        """
+        return self._sampleCount
+
     def __repr__(self):
         return "<AdvancedStatsFunction %s at 0x%x>" % (
             self._function.__name__, id(self._function.__name__))
@@ -305,6 +286,7 @@ class AdvancedStatsFunction(object):
         if self._window > 0:
             self._sample.append((retTime, retValue))
             del self._sample[:-self._window]
+            self._sampleCount += 1
 
         return retValue
 
@@ -323,80 +305,310 @@ class AdvancedStatsFunction(object):
         return bgn_sample, end_sample, (end_time - bgn_time)
 
 
-class AdvancedStatsThread(threading.Thread):
+class TimerWheel(object):
     """
-    A thread that runs the registered AdvancedStatsFunction objects
-    for statistic and monitoring purpose.
+    A hashed timer wheel. Items are added with a delay in ticks, and are
+    returned by advance() after that many calls.
     """
-    DEFAULT_LOG = logging.getLogger("AdvancedStatsThread")
+    def __init__(self, size=64):
+        self._slots = [[] for i in range(size)]
+        self._pos = 0
+
+    def add(self, ticks, item):
+        ticks = max(1, int(ticks))
+        slot = self._slots[(self._pos + ticks) % len(self._slots)]
+        slot.append(((ticks - 1) // len(self._slots), item))
 
-    def __init__(self, log=DEFAULT_LOG, daemon=False):
+    def advance(self):
         """
-        Initialize an AdvancedStatsThread object
+        Move the wheel by one tick and return the items that are due.
         """
-        threading.Thread.__init__(self)
-        self.daemon = daemon
+        self._pos = (self._pos + 1) % len(self._slots)
+        slot = self._slots[self._pos]
+        due = [item for rounds, item in slot if rounds == 0]
+        slot[:] = [(rounds - 1, item) for rounds, item in slot if rounds > 0]
+        return due
 
-        self._log = log
+
+class StatsScheduler(object):
+    """
+    Runs the functions of many AdvancedStatsCollector objects using a timer
+    wheel with one second ticks and a pool of worker threads.
+
+    The due functions of a collector are run together, and a collector never
+    runs concurrently with itself. When a collector is still running when
+    its functions are due again (e.g. blocked on an unresponsive libvirt
+    domain), its functions are delayed with an exponential back-off. If all
+    the workers are blocked, new workers are started, up to maxWorkers, so
+    the blocked collectors do not stall the others.
+    """
+    TICK = 1
+    MAX_BACKOFF = 60
+    MAX_SHIFT = 6
+
+    _log = logging.getLogger("StatsScheduler")
+
+    def __init__(self, workers, maxWorkers):
+        self._minWorkers = workers
+        self._maxWorkers = max(workers, maxWorkers)
+        self._wheel = TimerWheel()
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
         self._stopEvent = threading.Event()
-        self._contEvent = threading.Event()
+        self._workers = 0
+        # Start time of the job run by each busy worker
+        self._busy = {}
+        self._pending = []
+
+    def start(self):
+        self._log.debug("Starting stats scheduler")
+        for i in range(self._minWorkers):
+            self._startWorker()
+        t = threading.Thread(target=self._run, name="stats-scheduler")
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        self._log.debug("Stopping stats scheduler")
+        self._stopEvent.set()
+        with self._lock:
+            workers = self._workers
+        for i in range(workers):
+            self._queue.put(None)
+
+    def add(self, collector):
+        """
+        Schedule the functions of collector, starting on the next tick.
+        """
+        with self._lock:
+            # The wheel is not thread safe, new functions are added by the
+            # scheduler thread.
+            for statsFunction in collector.statsFunctions:
+                self._pending.append((collector, statsFunction))
+
+    def _startWorker(self):
+        # Called with the lock held, or before starting
+        self._workers += 1
+        t = threading.Thread(target=self._work,
+                             name="stats-worker-%d" % self._workers)
+        t.daemon = True
+        t.start()
+
+    def _run(self):
+        try:
+            deadline = time.time()
+            while not self._stopEvent.isSet():
+                deadline += self.TICK
+                self._stopEvent.wait(max(0, deadline - time.time()))
+                self._tick(time.time())
+        except:
+            self._log.error("Stats scheduler failed", exc_info=True)
+
+    def _tick(self, now):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for job in pending:
+            self._wheel.add(1, job)
+
+        due = {}
+        for collector, statsFunction in self._wheel.advance():
+            due.setdefault(collector, []).append(statsFunction)
+
+        for collector, functions in due.iteritems():
+            self._dispatch(collector, functions, now)
+
+        self._checkWorkers(now)
+
+    def _dispatch(self, collector, functions, now):
+        if collector.stopped:
+            return
+
+        if collector.paused:
+            for statsFunction in functions:
+                self._wheel.add(statsFunction.interval,
+                                (collector, statsFunction))
+            return
+
+        if not collector.queued:
+            collector.queued = True
+            collector.backoff = 0
+            for statsFunction in functions:
+                self._wheel.add(statsFunction.interval,
+                                (collector, statsFunction))
+            self._queue.put((collector, functions))
+            return
+
+        runStart = collector.runStart
+        if runStart is None:
+            # The collector is waiting for a worker; it is not blocked.
+            for statsFunction in functions:
+                self._wheel.add(1, (collector, statsFunction))
+            return
+
+        # The collector is still running. Functions due again since it
+        # started are blocked and delayed with back-off, the others are
+        # tried again on the next tick.
+        blocked = [f for f in functions if now - runStart >= f.interval]
+        if blocked:
+            if collector.backoff == 0:
+                collector.log.warning("Stats collection blocked for %d "
+                                      "seconds, delaying sampling",
+                                      now - runStart)
+            collector.backoff = min(collector.backoff + 1, self.MAX_SHIFT)
+
+        for statsFunction in functions:
+            if statsFunction in blocked:
+                delay = min(statsFunction.interval << collector.backoff,
+                            self.MAX_BACKOFF)
+            else:
+                delay = 1
+            self._wheel.add(delay, (collector, statsFunction))
+
+    def _checkWorkers(self, now):
+        with self._lock:
+            if self._queue.empty() or len(self._busy) < self._workers:
+                return
+            if self._workers >= self._maxWorkers:
+                return
+            # All the workers are busy and jobs are waiting; add a worker if
+            # one of the workers is blocked.
+            if any(now - start > self.TICK for start in
+                   self._busy.itervalues()):
+                self._log.debug("Workers are blocked, adding a worker")
+                self._startWorker()
+
+    def _work(self):
+        me = threading.current_thread()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            collector, functions = job
+            with self._lock:
+                start = time.time()
+                self._busy[me] = start
+                collector.runStart = start
+            try:
+                collector.collect(functions)
+            except:
+                self._log.error("Stats collection failed", exc_info=True)
+            finally:
+                collector.runStart = None
+                collector.queued = False
+                with self._lock:
+                    del self._busy[me]
+                    # Extra workers added for blocked jobs exit when they
+                    # are no longer needed.
+                    if (self._workers > self._minWorkers and
+                            self._queue.empty()):
+                        self._workers -= 1
+                        return
+
+
+_scheduler = None
+_schedulerLock = threading.Lock()
 
+
+def getStatsScheduler():
+    """
+    Return the shared stats scheduler, starting it on the first call.
+    """
+    global _scheduler
+    with _schedulerLock:
+        if _scheduler is None:
+            _scheduler = StatsScheduler(
+                config.getint('vars', 'vm_sampling_workers'),
+                config.getint('vars', 'vm_sampling_max_workers'))
+            _scheduler.start()
+        return _scheduler
+
+
+def stopStatsScheduler():
+    global _scheduler
+    with _schedulerLock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
+
+
+class AdvancedStatsCollector(object):
+    """
+    Runs the registered AdvancedStatsFunction objects for statistic and
+    monitoring purpose, using a shared StatsScheduler instead of a thread
+    of its own.
+    """
+    DEFAULT_LOG = logging.getLogger("AdvancedStatsCollector")
+
+    def __init__(self, log=DEFAULT_LOG, scheduler=None):
+        self._log = log
+        self._scheduler = scheduler
         self._statsTime = None
         self._statsFunctions = []
+        self._started = False
+        self.stopped = False
+        self.paused = False
+        # Managed by the scheduler
+        self.queued = False
+        self.runStart = None
+        self.backoff = 0
+
+    @property
+    def log(self):
+        return self._log
+
+    @property
+    def statsFunctions(self):
+        return tuple(self._statsFunctions)
 
     def addStatsFunction(self, *args):
         """
         Register the functions listed as arguments
         """
-        if self.isAlive():
-            raise RuntimeError("AdvancedStatsThread is started")
+        if self._started:
+            raise RuntimeError("AdvancedStatsCollector is started")
 
         for statsFunction in args:
             self._statsFunctions.append(statsFunction)
 
     def start(self):
-        """
-        Start the execution of the thread and exit
-        """
         self._log.debug("Start statistics collection")
-        threading.Thread.start(self)
+        self._started = True
+        if self._scheduler is None:
+            self._scheduler = getStatsScheduler()
+        self._scheduler.add(self)
 
     def stop(self):
-        """
-        Stop the execution of the thread and exit
-        """
         self._log.debug("Stop statistics collection")
-        self._stopEvent.set()
-        self._contEvent.set()
+        self.stopped = True
 
     def pause(self):
         """
         Pause the execution of the registered functions
         """
         self._log.debug("Pause statistics collection")
-        self._contEvent.clear()
+        self.paused = True
 
     def cont(self):
         """
         Resume the execution of the registered functions
         """
         self._log.debug("Resume statistics collection")
-        self._contEvent.set()
+        self.paused = False
+
+    def isAlive(self):
+        return self._started and not self.stopped
 
     def getLastSampleTime(self):
         return self._statsTime
 
-    def run(self):
-        self._log.debug("Stats thread started")
-        self._contEvent.set()
-
-        while not self._stopEvent.isSet():
-            try:
-                self.collect()
-            except:
-                self._log.debug("Stats thread failed", exc_info=True)
-
-        self._log.debug("Stats thread finished")
+    @property
+    def generation(self):
+        """
+        Changes whenever one of the registered functions stores a new sample,
+        so users can cache what they compute from the samples.
+        """
+        return sum(f.sampleCount for f in self._statsFunctions)
 
     def handleStatsException(self, ex):
         """
@@ -405,33 +617,20 @@ class AdvancedStatsThread(threading.Thread):
         """
         return False
 
-    def collect(self):
-        # TODO: improve this with lcm
-        _mInt = map(lambda x: x.interval, self._statsFunctions)
-        maxInterval = reduce(lambda x, y: x * y, set(_mInt), 1)
-
-        intervalAccum = 0
-        while not self._stopEvent.isSet():
-            self._contEvent.wait()
-
-            self._statsTime = time.time()
-            waitInterval = maxInterval
-
-            for statsFunction in self._statsFunctions:
-                thisInterval = statsFunction.interval - (
-                    intervalAccum % statsFunction.interval)
-                waitInterval = min(waitInterval, thisInterval)
-
-                if intervalAccum % statsFunction.interval == 0:
-                    try:
-                        statsFunction()
-                    except Exception as e:
-                        if not self.handleStatsException(e):
-                            self._log.error("Stats function failed: %s",
-                                            statsFunction, exc_info=True)
-
-            self._stopEvent.wait(waitInterval)
-            intervalAccum = (intervalAccum + waitInterval) % maxInterval
+    def collect(self, functions):
+        """
+        Run functions, called by the scheduler when they are due.
+        """
+        self._statsTime = time.time()
+        for statsFunction in functions:
+            if self.stopped:
+                break
+            try:
+                statsFunction()
+            except Exception as e:
+                if not self.handleStatsException(e):
+                    self._log.error("Stats function failed: %s",
+                                    statsFunction, exc_info=True)
 
 
 class HostStatsThread(threading.Thread):
@@ -449,7 +648,11 @@ class HostStatsThread(threading.Thread):
         self._log = log
         self._stopEvent = threading.Event()
         self._samples = []
-        self._updateIfidsIfrates()
+        # (first sample, last sample, stats)
+        self._cpuCoresStats = (None, None, {})
+        self._linksKey = None
+        self._linkSpeeds = {}
+        self._updateIfidsIfrates(list(netlink.iter_links_stats()))
         # in bytes-per-second
         self._lineRate = (sum(self._ifrates) or 1000) * (10 ** 6) / 8
         self._lastSampleTime = time.time()
@@ -460,11 +663,21 @@ class HostStatsThread(threading.Thread):
     def stop(self):
         self._stopEvent.set()
 
-    def _updateIfidsIfrates(self):
-        devices = getLinks()
-        self._ifids = [dev.name for dev in devices]
-        self._ifrates = []
-        for dev in devices:
+    def _updateIfidsIfrates(self, links):
+        self._ifids = [link['name'] for link in links]
+        linksKey = frozenset((link['index'], link['name'], link['flags'],
+                              link['master']) for link in links)
+        if linksKey != self._linksKey:
+            # A link was added or removed, or changed its state or master, so
+            # the speeds of the nics, bonds and vlans may have changed.
+            self._linkSpeeds = self._getLinkSpeeds()
+            self._linksKey = linksKey
+        self._ifrates = [self._linkSpeeds.get(ifid, 0)
+                         for ifid in self._ifids]
+
+    def _getLinkSpeeds(self):
+        speeds = {}
+        for dev in getLinks():
             if dev.isNIC():
                 speed = netinfo.nicSpeed(dev.name)
             elif dev.isBOND():
@@ -473,11 +686,13 @@ class HostStatsThread(threading.Thread):
                 speed = netinfo.vlanSpeed(dev.name)
             else:
                 speed = 0
-            self._ifrates.append(speed)
+            speeds[dev.name] = speed
+        return speeds
 
     def sample(self):
-        self._updateIfidsIfrates()
-        hs = HostSample(self._pid, self._ifids)
+        links = list(netlink.iter_links_stats())
+        self._updateIfidsIfrates(links)
+        hs = HostSample(self._pid, links)
         return hs
 
     def run(self):
@@ -543,34 +758,62 @@ class HostStatsThread(threading.Thread):
         stats['cpuStatistics'] = self._getCpuCoresStats()
         return stats
 
+    @utils.memoized
+    def _cpuCoresNodes(self):
+        """
+        Map the id of each cpu core in the numa topology to the index of its
+        numa node.
+        """
+        nodes = {}
+        for nodeIndex, numaNode in caps.getNumaTopology().iteritems():
+            for cpuCore in numaNode['cpus']:
+                nodes[cpuCore] = int(nodeIndex)
+        return nodes
+
     def _getCpuCoresStats(self):
         """
         :returns: a dict that with the following formats:
 
             {'<cpuId>': {'numaNodeIndex': int, 'cpuSys': 'str',
              'cpuIdle': 'str', 'cpuUser': 'str'}, ...}
+
+        The stats are computed once per sample; the dict is shared by the
+        callers until the next sample.
         """
+        hs0, hs1 = self._samples[0], self._samples[-1]
+        cachedHs0, cachedHs1, cpuCoreStats = self._cpuCoresStats
+        if hs0 is cachedHs0 and hs1 is cachedHs1:
+            return cpuCoreStats
+
         cpuCoreStats = {}
-        for nodeIndex, numaNode in caps.getNumaTopology().iteritems():
-            cpuCores = numaNode['cpus']
-            for cpuCore in cpuCores:
-                coreStat = {}
-                coreStat['nodeIndex'] = int(nodeIndex)
-                hs0, hs1 = self._samples[0], self._samples[-1]
-                interval = hs1.timestamp - hs0.timestamp
-                jiffies = (hs1.cpuCores.getCoreSample(cpuCore)['user'] -
-                           hs0.cpuCores.getCoreSample(cpuCore)['user']) % \
-                    (2 ** 32)
-                coreStat['cpuUser'] = ("%.2f" % (jiffies / interval))
-                jiffies = (hs1.cpuCores.getCoreSample(cpuCore)['sys'] -
-                           hs0.cpuCores.getCoreSample(cpuCore)['sys']) % \
-                    (2 ** 32)
-                coreStat['cpuSys'] = ("%.2f" % (jiffies / interval))
-                coreStat['cpuIdle'] = ("%.2f" %
-                                       max(0.0, 100.0 -
-                                           float(coreStat['cpuUser']) -
-                                           float(coreStat['cpuSys'])))
-                cpuCoreStats[str(cpuCore)] = coreStat
+        nodes = self._cpuCoresNodes()
+        cores0, cores1 = hs0.cpuCores, hs1.cpuCores
+        interval = hs1.timestamp - hs0.timestamp
+        if cores0.coreIds == cores1.coreIds:
+            positions0 = xrange(len(cores1.coreIds))
+        else:
+            # A core went online or offline between the samples
+            index0 = dict((cpuCore, i)
+                          for i, cpuCore in enumerate(cores0.coreIds))
+            positions0 = [index0.get(cpuCore) for cpuCore in cores1.coreIds]
+
+        for i, j in enumerate(positions0):
+            cpuCore = cores1.coreIds[i]
+            nodeIndex = nodes.get(cpuCore)
+            if j is None or nodeIndex is None:
+                continue
+            cpuUser = "%.2f" % (((cores1.user[i] - cores0.user[j]) %
+                                 (2 ** 32)) / interval)
+            cpuSys = "%.2f" % (((cores1.sys[i] - cores0.sys[j]) %
+                                (2 ** 32)) / interval)
+            cpuIdle = "%.2f" % max(0.0, 100.0 - float(cpuUser) -
+                                   float(cpuSys))
+            cpuCoreStats[str(cpuCore)] = {'nodeIndex': nodeIndex,
+                                          'cpuUser': cpuUser,
+                                          'cpuSys': cpuSys,
+                                          'cpuIdle': cpuIdle}
+
+        self._cpuCoresStats = (hs0, hs1, cpuCoreStats)
         return cpuCoreStats
 
     def _getInterfacesStats(self):
@@ -177,7 +177,11 @@ class UpdatePortMirroringError(Exception):
     pass
 
 
-class VmStatsThread(sampling.AdvancedStatsThread):
+class VmStatsThread(sampling.AdvancedStatsCollector):
+    """
+    Samples the statistics of a vm. Despite the name, this runs on the
+    shared sampling.StatsScheduler, not in a thread of its own.
+    """
     MBPS_TO_BPS = 10 ** 6 / 8
 
     # CPU tune sampling window
@@ -185,7 +189,7 @@ class VmStatsThread(sampling.AdvancedStatsThread):
     CPU_TUNE_SAMPLING_WINDOW = 2
 
     def __init__(self, vm):
-        sampling.AdvancedStatsThread.__init__(self, log=vm.log, daemon=True)
+        sampling.AdvancedStatsCollector.__init__(self, log=vm.log)
         self._vm = vm
 
         self.highWrite = (
@@ -544,14 +548,17 @@ class VmStatsThread(sampling.AdvancedStatsThread):
             # finishing.
             stats['vmJobs'] = info
 
-    def get(self):
-        stats = {}
-
+    def getStatsAge(self):
         try:
-            stats['statsAge'] = time.time() - self.getLastSampleTime()
+            return time.time() - self.getLastSampleTime()
         except TypeError:
             self._log.debug("Stats age not available")
-            stats['statsAge'] = -1.0
+            return -1.0
+
+    def get(self):
+        stats = {}
+
+        stats['statsAge'] = self.getStatsAge()
 
         self._getCpuStats(stats)
         self._getNetworkStats(stats)
@@ -1839,6 +1846,11 @@ class Vm(object):
         self._guestEvent = vmstatus.POWERING_UP
         self._guestEventTime = 0
         self._vmStats = None
+        # (key, stats) computed from the samples of _vmStats
+        self._sampledStats = (None, {})
+        # Bumped when the conf or the drive sizes used by the sampled stats
+        # change
+        self._statsGeneration = 0
         self._guestCpuRunning = False
         self._guestCpuLock = threading.Lock()
         self._startTime = time.time() - \
@@ -2318,6 +2330,8 @@ class Vm(object):
             pass
 
     def _saveStateInternal(self):
+        # The conf was changed
+        self._statsGeneration += 1
         if self.destroyed:
             return
         with self._confLock:
@@ -2591,6 +2605,7 @@ class Vm(object):
         if not volInfo['internal']:
             vmDrive = self._findDriveByName(volInfo['name'])
             vmDrive.apparentsize, vmDrive.truesize = apparentSize, trueSize
+            self._statsGeneration += 1
 
         try:
             self.cont()
@@ -2814,16 +2829,41 @@ class Vm(object):
         if self.isMigrating():
             stats['migrationProgress'] = self.migrateStatus()['progress']
 
-        decStats = {}
         try:
             if self._vmStats:
-                decStats = self._vmStats.get()
+                statsAge = self._vmStats.getStatsAge()
+                stats.update(self._getSampledStats())
+                stats['statsAge'] = utils.convertToStr(statsAge)
                 if (not self.isMigrating()
-                    and decStats['statsAge'] >
+                    and statsAge >
                         config.getint('vars', 'vm_command_timeout')):
                     stats['monitorResponse'] = '-1'
         except Exception:
             self.log.error("Error fetching vm stats", exc_info=True)
+
+        stats.update(self._getGraphicsStats())
+        return stats
+
+    def _getSampledStats(self):
+        """
+        Return the stats computed from the samples of the VmStatsThread.
+
+        Computing them is the most expensive part of getStats, so they are
+        cached until the thread stores new samples, the devices change, or
+        the conf or drive sizes they include change, even if sampling is
+        stalled. The returned dict is shared by the callers and must not be
+        modified.
+        """
+        vmStats = self._vmStats
+        key = (id(vmStats), vmStats.generation, self._devXmlHash,
+               self._statsGeneration)
+        cachedKey, cachedStats = self._sampledStats
+        if key == cachedKey:
+            return cachedStats
+
+        decStats = vmStats.get()
+        del decStats['statsAge']
+        stats = {'disks': {}}
         for var in decStats:
             if type(decStats[var]) is not dict:
                 stats[var] = utils.convertToStr(decStats[var])
@@ -2840,7 +2880,7 @@ class Vm(object):
                     self.log.error("Error setting vm disk stats",
                                    exc_info=True)
 
-        stats.update(self._getGraphicsStats())
+        self._sampledStats = (key, stats)
         return stats
 
     def _getVmStatus(self):
@@ -3979,8 +4019,13 @@ class Vm(object):
                                       vmDrive.imageID, vmDrive.name))
             return
 
-        vmDrive.truesize = int(volSize['truesize'])
-        vmDrive.apparentsize = int(volSize['apparentsize'])
+        truesize = int(volSize['truesize'])
+        apparentsize = int(volSize['apparentsize'])
+        if (truesize, apparentsize) != (vmDrive.truesize,
+                                        vmDrive.apparentsize):
+            vmDrive.truesize = truesize
+            vmDrive.apparentsize = apparentsize
+            self._statsGeneration += 1
 
     def updateDriveParameters(self, driveParams):
         """Update the drive with the new volume information"""
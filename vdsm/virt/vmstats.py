@@ -0,0 +1,130 @@
+#
+# Copyright 2014 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Track which vms changed their statistics, for Host.getChangedVmStats.
+
+Every change seen by the tracker gets the next generation number. A client
+passes the token returned by its previous call, and gets only the stats of
+the vms that changed after the generation in the token, and the ids of the
+vms that were removed since then.
+
+The token holds the epoch of the tracker, so tokens from a previous run of
+vdsm are detected. Those tokens, and tokens too old to know all the removed
+vms, get a full reply, listing all the vms.
+"""
+
+import threading
+import uuid
+
+# These change on every call, even if nothing else does.
+_VOLATILE_STATS = frozenset(('elapsedTime', 'statsAge'))
+
+
+class StatsChangeTracker(object):
+
+    MAX_REMOVED = 1000
+
+    def __init__(self, maxRemoved=MAX_REMOVED):
+        self._maxRemoved = maxRemoved
+        self._lock = threading.Lock()
+        self._epoch = str(uuid.uuid4())
+        self._generation = 0
+        # Tokens older than this generation may miss removed vms
+        self._horizon = 0
+        # vmId: (generation, stats without the volatile fields)
+        self._vms = {}
+        # vmId: generation
+        self._removed = {}
+
+    def changes(self, statsList, token=None):
+        """
+        Record the current statsList and return the changes since token:
+
+            {'statsList': [stats, ...],
+             'removed': [vmId, ...],
+             'full': False,
+             'token': token}
+
+        If full is True, statsList holds the stats of all the vms, and the
+        client should drop the vms it knows that are not listed.
+        """
+        with self._lock:
+            self._update(statsList)
+            since = self._parseToken(token)
+            if since is None or since < self._horizon:
+                return {'statsList': statsList,
+                        'removed': [],
+                        'full': True,
+                        'token': self._token()}
+
+            changed = [stats for stats in statsList
+                       if self._vms[stats['vmId']][0] > since]
+            removed = [vmId for vmId, generation in self._removed.iteritems()
+                       if generation > since]
+            return {'statsList': changed,
+                    'removed': removed,
+                    'full': False,
+                    'token': self._token()}
+
+    def _update(self, statsList):
+        current = set()
+        for stats in statsList:
+            vmId = stats['vmId']
+            current.add(vmId)
+            stable = dict((k, v) for k, v in stats.iteritems()
+                          if k not in _VOLATILE_STATS)
+            old = self._vms.get(vmId)
+            if old is None or old[1] != stable:
+                self._generation += 1
+                self._vms[vmId] = (self._generation, stable)
+                self._removed.pop(vmId, None)
+
+        for vmId in self._vms.keys():
+            if vmId not in current:
+                del self._vms[vmId]
+                self._generation += 1
+                self._removed[vmId] = self._generation
+
+        if len(self._removed) > self._maxRemoved:
+            oldest = sorted(self._removed.iteritems(), key=lambda x: x[1])
+            for vmId, generation in oldest[:-self._maxRemoved]:
+                del self._removed[vmId]
+                self._horizon = max(self._horizon, generation)
+
+    def _token(self):
+        return '%s:%d' % (self._epoch, self._generation)
+
+    def _parseToken(self, token):
+        """
+        Return the generation in token, or None if it is not a valid token
+        of this tracker.
+        """
+        if not token:
+            return None
+        epoch, sep, generation = token.rpartition(':')
+        if epoch != self._epoch:
+            return None
+        try:
+            generation = int(generation)
+        except ValueError:
+            return None
+        if generation > self._generation:
+            return None
+        return generation